@@ -0,0 +1,61 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Benchmark YamboAnalyser on a convergence campaign with many runs
+comparing the json packs read eagerly with the npz packs read on demand
+
+Usage:
+    python bench_analyser.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+from time import time
+
+#run from a checkout without installing yambopy
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from yambopy.io.outputfile import YamboOut
+from yambopy.io.packfile import convert_json_pack
+from yambopy.analyse import YamboAnalyser
+
+test_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs','gw_conv')
+
+def write_packs(folder,nruns,nqps):
+    """
+    Pack the reference run and copy it nruns times with a spectra of nqps points
+    in the json and npz formats
+    """
+    y = YamboOut(os.path.join(test_path,'reference'),save_folder=test_path,cache=False)
+    y.files['o-spectra'] = {'type':'output_spectra','E':np.linspace(0,10,nqps),'EPS-Im':np.random.rand(nqps)}
+    for fmt in ['json','npz']:
+        os.mkdir(os.path.join(folder,fmt))
+    y.pack(os.path.join(folder,'json','run_0.json'))
+    convert_json_pack(os.path.join(folder,'json','run_0.json'),os.path.join(folder,'npz','run_0.npz'))
+    for fmt in ['json','npz']:
+        for n in range(1,nruns):
+            shutil.copy(os.path.join(folder,fmt,'run_0.%s'%fmt),os.path.join(folder,fmt,'run_%d.%s'%(n,fmt)))
+
+def bench(sizes,nqps=20000):
+    print("%6s %6s %10s %10s %10s"%('format','runs','open (s)','query (s)','total (s)'))
+    for nruns in sizes:
+        folder = tempfile.mkdtemp()
+        try:
+            write_packs(folder,nruns,nqps)
+            for fmt in ['json','npz']:
+                start = time(); ya = YamboAnalyser(os.path.join(folder,fmt)); t_open = time()-start
+                start = time()
+                ya.get_files_type('netcdf_gw',tags=('run_1','run_2'))
+                ya.get_inputfiles_tag(['FFTGvecs','BndsRnXp'])
+                ya.get_files_type('report')
+                t_query = time()-start
+                print("%6s %6d %10.4lf %10.4lf %10.4lf"%(fmt,nruns,t_open,t_query,t_open+t_query))
+        finally:
+            shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    bench([10,100,1000])
@@ -0,0 +1,84 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Benchmark the projection of the excitonic states on the transitions
+comparing the loop over the rows of the table with the scatter-add kernels
+of YamboExcitonDB on a synthetic table of realistic size
+
+Usage:
+    python bench_exciton_weights.py
+"""
+import os
+import sys
+import numpy as np
+from time import time
+from itertools import product
+
+#run from a checkout without installing yambopy
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.excitondb import YamboExcitonDB
+from yambopy.tools.funcs import abs2
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def synthetic_excitondb(lattice,nvbands,ncbands,nexcitons):
+    """ Create an exciton database with random normalized eigenvectors
+    """
+    nkpoints = len(lattice.car_kpoints)
+    table = np.array([[k+1,v+1,c+1] for k,v,c in product(range(nkpoints),range(nvbands),range(nvbands,nvbands+ncbands))])
+    ntransitions = len(table)
+    eigenvectors = np.random.rand(nexcitons,ntransitions)+np.random.rand(nexcitons,ntransitions)*1j
+    eigenvectors /= np.linalg.norm(eigenvectors,axis=1)[:,None]
+    eigenvalues = np.sort(np.random.rand(nexcitons))+1j*0
+    residuals = np.random.rand(nexcitons)+0j
+    return YamboExcitonDB(lattice,eigenvalues,residuals,residuals,table=table,eigenvectors=eigenvectors)
+
+def loop_exciton_weights(exc,excitons):
+    """ reference implementation looping over the rows of the table
+    """
+    weights = np.zeros([exc.nkpoints,exc.mband])
+    for exciton in excitons:
+        eivec = exc.eigenvectors[exciton-1]
+        for t,kcv in enumerate(exc.table):
+            k,c,v = kcv[0:3]-1
+            this_weight = abs2(eivec[t])
+            weights[k,c] += this_weight
+            weights[k,v] += this_weight
+    return weights
+
+def loop_amplitudes_phases(exc,excitons):
+    """ reference implementation looping over the rows of the table
+    """
+    nkpoints = len(exc.lattice.car_kpoints)
+    amplitudes = np.zeros([nkpoints])
+    phases     = np.zeros([nkpoints],dtype=np.complex64)
+    for exciton in excitons:
+        eivec = exc.eigenvectors[exciton-1]
+        for eh,kvc in enumerate(exc.table):
+            ikbz, v, c = kvc-1
+            phases[ikbz]     += eivec[eh]
+            amplitudes[ikbz] += np.abs(eivec[eh])
+    return amplitudes, phases
+
+def bench(lattice,sizes,excitons=(1,2,3,4)):
+    print("%12s %8s %10s %10s %8s %6s"%('transitions','kernel','loop (s)','batch (s)','speedup','same'))
+    for nvbands,ncbands in sizes:
+        exc = synthetic_excitondb(lattice,nvbands,ncbands,nexcitons=max(excitons))
+
+        start = time(); ref = loop_exciton_weights(exc,excitons); t_loop = time()-start
+        start = time(); new = exc.get_exciton_weights(excitons); t_batch = time()-start
+        print("%12d %8s %10.4lf %10.4lf %8.1lf %6s"%(exc.ntransitions,'weights',t_loop,t_batch,t_loop/t_batch,np.allclose(ref,new)))
+
+        start = time(); ref = loop_amplitudes_phases(exc,excitons); t_loop = time()-start
+        start = time(); new = exc.get_amplitudes_phases(excitons)[1:]; t_batch = time()-start
+        same = np.allclose(ref[0],new[0]) and np.allclose(np.angle(ref[1]),new[1],atol=1e-4)
+        print("%12d %8s %10.4lf %10.4lf %8.1lf %6s"%(exc.ntransitions,'phases',t_loop,t_batch,t_loop/t_batch,same))
+
+if __name__ == "__main__":
+    lattice = YamboLatticeDB.from_db_file(os.path.join(refs_path,'ip','SAVE','ns.db1'))
+    print("%d kpoints"%len(lattice.car_kpoints))
+    bench(lattice,[(4,4),(8,8),(16,16),(26,26)])
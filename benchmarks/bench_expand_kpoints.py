@@ -0,0 +1,80 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Benchmark the expansion of the kpoints from the irreducible to the full brillouin zone
+comparing the point by point loop with the batched version of YamboLatticeDB.expand_kpoints
+
+Usage:
+    python bench_expand_kpoints.py
+"""
+import os
+import sys
+import numpy as np
+from time import time
+
+#run from a checkout without installing yambopy
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from yambopy.dbs.latticedb import YamboLatticeDB
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def reduce_mesh(ydb,mesh):
+    """
+    Generate the irreducible kpoints of a regular mesh using the symmetries of ydb
+    (returns the kpoints in cartesian coordinates)
+    """
+    mesh = np.array(mesh)
+    grid = np.array(np.meshgrid(*[np.arange(n) for n in mesh],indexing='ij')).reshape(3,-1).T
+    red_kpoints = grid/mesh.astype(float)
+
+    #images of all the kpoints by all the symmetries in reduced coordinates
+    car_kpoints = red_kpoints.dot(ydb.rlat)
+    images = np.einsum('sij,kj->ksi',ydb.sym_car,car_kpoints)
+    images_red = images.dot(np.linalg.inv(ydb.rlat))
+    images_idx = np.rint(images_red*mesh).astype(int)%mesh
+    images_key = np.ravel_multi_index(images_idx.reshape(-1,3).T,mesh).reshape(len(grid),-1)
+
+    visited = np.zeros(len(grid),dtype=bool)
+    ibz = []
+    for nk in range(len(grid)):
+        if visited[nk]: continue
+        visited[images_key[nk]] = True
+        ibz.append(nk)
+    return car_kpoints[ibz]
+
+def lattice_with_mesh(filename,mesh):
+    """ Create a YamboLatticeDB with the lattice of filename and a new kpoint mesh
+    """
+    ydb = YamboLatticeDB.from_db_file(filename,Expand=False)
+    car_kpoints = reduce_mesh(ydb,mesh)
+    return YamboLatticeDB(lat=ydb.lat,alat=ydb.alat,sym_car=ydb.sym_car,
+                          iku_kpoints=car_kpoints*ydb.alat,
+                          car_atomic_positions=ydb.car_atomic_positions,
+                          atomic_numbers=ydb.atomic_numbers,time_rev=ydb.time_rev)
+
+def bench(filename,meshes):
+    print("%12s %8s %8s %10s %10s %8s %6s"%('mesh','nk_ibz','nk_bz','loop (s)','batch (s)','speedup','same'))
+    for mesh in meshes:
+        times = {}
+        results = {}
+        for batched in [False,True]:
+            ydb = lattice_with_mesh(filename,mesh)
+            start = time()
+            ydb.expand_kpoints(batched=batched)
+            times[batched] = time()-start
+            results[batched] = ydb
+        loop, batch = results[False], results[True]
+        same = all([np.array_equal(loop.kpoints_indexes,batch.kpoints_indexes),
+                    np.array_equal(loop.symmetry_indexes,batch.symmetry_indexes),
+                    np.allclose(loop.weights_ibz,batch.weights_ibz)])
+        print("%12s %8d %8d %10.4lf %10.4lf %8.1lf %6s"%('x'.join(map(str,mesh)),loop.ibz_nkpoints,
+              len(loop.kpoints_indexes),times[False],times[True],times[False]/times[True],same))
+
+if __name__ == "__main__":
+    print("hexagonal lattice (hBN)")
+    bench(os.path.join(refs_path,'ip','SAVE','ns.db1'),[[12,12,1],[24,24,1],[36,36,1],[60,60,1]])
+    print("fcc lattice (Si)")
+    bench(os.path.join(refs_path,'gw_conv','SAVE','ns.db1'),[[4,4,4],[8,8,8],[12,12,12],[24,24,24]])
@@ -0,0 +1,74 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Benchmark the solution of the quasiparticle equation in YamboGreenDB.getQP
+comparing the state by state solver with the vectorized one on synthetic self-energies
+
+Usage:
+    python bench_greendb_qp.py
+"""
+import os
+import sys
+import numpy as np
+from time import time
+from scipy.optimize import newton
+from scipy.interpolate import interp1d
+
+#run from a checkout without installing yambopy
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from yambopy.dbs.greendb import YamboGreenDB
+
+def synthetic_greendb(nqps,nenergies,window=4.0):
+    """
+    Create a YamboGreenDB with self-energies with a pole below the bare energies
+    """
+    e0 = np.random.rand(nqps)*20-10
+    x = e0[:,None]+np.linspace(-window,window,nenergies)[None,:]
+    pole = e0-2+np.random.rand(nqps)
+    se = 0.5/(x-pole[:,None]+0.2j)-0.3+0.05j
+
+    green = object.__new__(YamboGreenDB)
+    green.energies = x+0j
+    green.se = se
+    green.nqps, green.nenergies = se.shape
+    green.band1 = np.ones(nqps,dtype=int)
+    green.kindex = np.arange(nqps)
+    green.bandmin = green.bandmax = 1
+    return green, e0
+
+def loop_getqp(green,e0):
+    """
+    reference implementation solving the quasiparticle equation state by state
+    with the same secant method and interpolations of the original getQP
+    """
+    eqps = np.zeros([green.nqps],dtype=complex)
+    zs   = np.zeros([green.nqps],dtype=complex)
+    for nqp in range(green.nqps):
+        x = green.energies[nqp].real
+        y = green.se[nqp]
+        f = interp1d(x,y.real-x+e0[nqp],kind='slinear')
+        eqp = newton(f,e0[nqp],maxiter=200)
+        f = interp1d(x,y)
+        dx = 1e-8
+        dse = (f(eqp+dx)-f(eqp-dx))/(2*dx)
+        eqps[nqp] = eqp+1j*f(eqp).imag
+        zs[nqp] = 1./(1-dse)
+    return eqps, zs
+
+def bench(sizes,nenergies=200):
+    print("%8s %10s %10s %10s %10s %10s %10s"%('nqps','loop (s)','vector (s)','speedup','err eqp','err z','converged'))
+    for nqps in sizes:
+        green, e0 = synthetic_greendb(nqps,nenergies)
+
+        start = time(); eqp_ref, z_ref = loop_getqp(green,e0); t_loop = time()-start
+        start = time(); eqp, z = green.getQP(e0); t_vec = time()-start
+
+        err_eqp = np.max(np.abs(eqp-eqp_ref))
+        err_z = np.max(np.abs(z-z_ref))
+        print("%8d %10.4lf %10.4lf %10.1lf %10.2e %10.2e %10d"%(nqps,t_loop,t_vec,t_loop/t_vec,err_eqp,err_z,np.sum(green.converged)))
+
+if __name__ == "__main__":
+    bench([100,1000,10000])
@@ -0,0 +1,49 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Benchmark the exact and FFT modes of histogram_eiv used for the DOS and JDOS
+on random transition energies
+
+Usage:
+    python bench_histogram_eiv.py
+"""
+import os
+import sys
+import numpy as np
+from time import time
+
+#run from a checkout without installing yambopy
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from yambopy.dbs.electronsdb import histogram_eiv
+
+def bench(ntransitions_list,emin=0,emax=10,step=0.01,sigma=0.1,ctype='lorentzian'):
+    print("%s broadening %.3lf eV, step %.3lf eV"%(ctype,sigma,step))
+    print("%12s %10s %10s %10s %12s %12s"%('transitions','exact (s)','fft (s)','speedup','err linear','err nearest'))
+    for ntransitions in ntransitions_list:
+        transitions = np.random.rand(ntransitions)*(emax-emin+2)+emin-1
+        weights = np.random.rand(ntransitions)/ntransitions
+
+        start = time()
+        x, y_exact = histogram_eiv(transitions,weights,emin,emax,step,sigma,ctype,mode='exact')
+        t_exact = time()-start
+
+        start = time()
+        x, y_fft = histogram_eiv(transitions,weights,emin,emax,step,sigma,ctype,mode='fft')
+        t_fft = time()-start
+
+        x, y_nearest = histogram_eiv(transitions,weights,emin,emax,step,sigma,ctype,mode='fft',binning='nearest')
+
+        norm = np.max(np.abs(y_exact))
+        err_linear  = np.max(np.abs(y_fft-y_exact))/norm
+        err_nearest = np.max(np.abs(y_nearest-y_exact))/norm
+        print("%12d %10.4lf %10.4lf %10.1lf %12.2e %12.2e"%(ntransitions,t_exact,t_fft,t_exact/t_fft,err_linear,err_nearest))
+
+if __name__ == "__main__":
+    #import scipy.signal before timing
+    histogram_eiv([1.0],[1.0],mode='fft')
+    ntransitions_list = [10**3,10**4,10**5,10**6]
+    bench(ntransitions_list,ctype='lorentzian')
+    bench(ntransitions_list,ctype='gaussian')
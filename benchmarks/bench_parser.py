@@ -0,0 +1,119 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Benchmark the parsing of large yambo report (r-*) and output (o-*.qp) files
+comparing the regular expressions over the full text and np.loadtxt
+with the streaming parser of YamboFile
+
+Usage:
+    python bench_parser.py
+"""
+import os
+import sys
+import re
+import shutil
+import tempfile
+import numpy as np
+from time import time
+
+#run from a checkout without installing yambopy
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from yamboparser import YamboFile
+
+qp_format = " B=%d Eo=%6.2f E=%6.2f E-Eo=%6.2f Re(Z)=%4.2f Im(Z)=-.1710E-2 nlXC=%6.2f lXC=%6.2f So=%6.3f\n"
+
+def write_report(filename,nkpoints,nbands):
+    """
+    Write a synthetic GW report with nkpoints blocks of nbands quasiparticles
+    """
+    values = np.random.rand(nkpoints,nbands,7)*10-5
+    with open(filename,'w') as f:
+        f.write(" [01] CPU structure, Files & I/O Directories\n\n")
+        for nk in range(nkpoints):
+            f.write("  *  K [%d] : 0.000000 0.000000 %.6f ( cc) * Comp.s  1 * weight 0.00100\n"%(nk+1,nk/nkpoints))
+        f.write("\n [05] Dynamic Dielectric Matrix (PPA)\n\n")
+        for nk in range(nkpoints):
+            f.write("  QP [eV] @ K [%d] (iku): 0.000000 0.000000 %.6f\n"%(nk+1,nk/nkpoints))
+            for nb in range(nbands):
+                f.write(qp_format%((nb+1,)+tuple(values[nk,nb])))
+            f.write("\n")
+        f.write(" [06] Timing Overview\n\n")
+        f.write(" Clock: global (MAX - min (if any spread is present) clocks)\n\n")
+        f.write(" [07] Game Over & Game summary\n\n")
+        f.write(" Timing   [Min/Max/Average]: 05s/05s/04s\n")
+    return values
+
+def write_output(filename,nkpoints,nbands):
+    """
+    Write a synthetic o-*.qp file with nkpoints*nbands quasiparticles
+    """
+    with open(filename,'w') as f:
+        for i in range(14): f.write("#\n")
+        f.write("# GW [Newton Solver]\n#\n")
+        f.write("#    K-point      Band       Eo         E-Eo       Sc(Eo)\n#\n")
+        table = np.zeros([nkpoints*nbands,5])
+        table[:,0] = np.repeat(np.arange(1,nkpoints+1),nbands)
+        table[:,1] = np.tile(np.arange(1,nbands+1),nkpoints)
+        table[:,2:] = np.random.rand(nkpoints*nbands,3)*10-5
+        np.savetxt(f,table,fmt=['%12d','%12d','%12.5f','%12.5f','%12.5f'])
+    return table
+
+def reference_parse_report(filename):
+    """
+    reference implementation running the regular expressions over the full text of the report
+    """
+    with open(filename) as f: lines = f.readlines()
+    qp_regx = re.compile('(^\s+?QP\s\[eV\]\s@\sK\s\[(\d+)\][a-z0-9E:()\s.-]+?$)(.*?)(?=^$)',re.M|re.DOTALL)
+    extract = re.compile('B[=](\d+)\sEo[=](?:\s+)?([E0-9.-]+)\sE[=](?:\s+)?([E0-9.-]+)\sE[-]Eo[=](?:\s+)?([E0-9.-]+)\sRe[(]Z[)][=](?:\s+)?([E0-9.-]+)\sIm[(]Z[)][=](?:\s+)?[E0-9.-]+\snlXC[=](?:\s+)?([E0-9.-]+)\slXC[=](?:\s+)?([E0-9.-]+)\sSo[=](?:\s+)?([E0-9.-]+)')
+    tags = ['bindex','dft_energy','qp_energy','qp_correction','z_factor','non_local_xc','local_xc','selfenergy_c']
+    qp_results = {}
+    for header, kp_index, block in qp_regx.findall(''.join(lines)):
+        kp_results = dict((tag,[]) for tag in tags)
+        for qp_data in extract.findall(block):
+            for tag,value in zip(tags,qp_data):
+                kp_results[tag].append(float(value))
+        qp_results[kp_index] = kp_results
+    return qp_results
+
+def reference_parse_output(filename):
+    """
+    reference implementation with np.loadtxt filling the dictionary one cell at a time
+    """
+    with open(filename) as f: lines = f.readlines()
+    tags = [line.replace('(meV)','').replace('Sc(Eo)','Sc|Eo') for line in lines if all(tag in line for tag in ['K-point','Band','Eo'])][0]
+    tags = tags[2:].strip().split()
+    table = np.loadtxt(lines)
+    _kdata = {}
+    for row in table:
+        kdata = _kdata.setdefault(str(int(row[0])),{})
+        for tag,value in zip(tags,row):
+            kdata.setdefault(tag,[]).append(value)
+    return _kdata
+
+def max_error(ref,data):
+    return max(np.max(np.abs(np.array(ref[k][tag])-data[k][tag])) for k in ref for tag in ref[k])
+
+def bench(sizes,nbands=50):
+    folder = tempfile.mkdtemp()
+    print("%6s %8s %10s %10s %10s %10s %10s"%('file','nqps','size (MB)','regex (s)','stream (s)','speedup','error'))
+    try:
+        for nkpoints in sizes:
+            for kind, write, reference in [('r-',write_report,reference_parse_report),
+                                           ('o-',write_output,reference_parse_output)]:
+                filename = os.path.join(folder,'%sbench_%d.qp'%(kind,nkpoints))
+                write(filename,nkpoints,nbands)
+                size = os.path.getsize(filename)/1024.**2
+
+                start = time(); ref = reference(filename); t_ref = time()-start
+                start = time(); yfile = YamboFile(os.path.basename(filename),folder); t_stream = time()-start
+
+                print("%6s %8d %10.2lf %10.4lf %10.4lf %10.1lf %10.2e"%(kind,nkpoints*nbands,size,t_ref,t_stream,
+                                                                       t_ref/t_stream,max_error(ref,yfile.data)))
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    bench([100,1000,10000])
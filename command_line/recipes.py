@@ -13,9 +13,9 @@ from yambopy import *
 #
 # by Henrique Miranda.
 #
-def pack_files_in_folder(folder,save_folder=None,mask='',verbose=True):
+def pack_files_in_folder(folder,save_folder=None,mask='',verbose=True,format='json'):
     """
-    Pack the output files in a folder to json files
+    Pack the output files in a folder to json (or npz) files
     """
     if not save_folder: save_folder = folder
     #pack the files in .json files
@@ -26,7 +26,7 @@ def pack_files_in_folder(folder,save_folder=None,mask='',verbose=True):
             if ([ f for f in filenames if 'o-' in f ]):
                 if verbose: print(dirpath)
                 y = YamboOut(dirpath,save_folder=save_folder)
-                y.pack()
+                y.pack(format=format)
 
 #
 # by Alejandro Molina-Sanchez
@@ -5,6 +5,7 @@
 #
 from __future__ import division
 import numpy as np
+from functools import lru_cache
 
 def calculate_distances(kpoints):
     """
@@ -100,25 +101,43 @@ def vec_in_list(veca,vec_list,atol=1e-6):
     """
     return np.array([ np.allclose(veca,vecb,rtol=atol,atol=atol) for vecb in vec_list ]).any()
 
+def _check_lattice(lat):
+    lat = np.array(lat)
+    if lat.shape != (3,3):
+        raise ValueError('Wrong lattice dimensions expected (3,3) got {}'.format(lat.shape))
+    return lat
+
+def _check_coordinates(x):
+    x = np.asarray(x)
+    if np.shape(x)[-1:] != (3,):
+        raise ValueError('Wrong coordinates dimensions expected (...,3) got {}'.format(x.shape))
+    return x
+
+@lru_cache(maxsize=64)
+def _inverse_lattice(lat_key):
+    """
+    Inverse of the lattice, computed once per lattice
+    """
+    return np.linalg.inv(np.array(lat_key).reshape(3,3))
+
 def red_car(red,lat):
     """
     Convert reduced coordinates to cartesian
+    accepts any array of coordinates with shape (...,3)
     """
-    lat = np.array(lat)
-    red = np.array(red)
-    if lat.shape != (3,3):
-        raise ValueError('Wrong lattice dimensions expected (3,3) got {}'.format(lat.shape))
-    return np.array([coord[0]*lat[0]+coord[1]*lat[1]+coord[2]*lat[2] for coord in red])
+    lat = _check_lattice(lat)
+    red = _check_coordinates(red)
+    return red.reshape(-1,3).dot(lat).reshape(red.shape)
 
 def car_red(car,lat):
     """
     Convert cartesian coordinates to reduced
+    accepts any array of coordinates with shape (...,3)
     """
-    car = np.array(car)
-    lat = np.array(lat)
-    if lat.shape != (3,3):
-        raise ValueError('Wrong lattice dimensions expected (3,3) got {}'.format(lat.shape))
-    return np.array([np.linalg.solve(np.array(lat).T,coord) for coord in car])
+    lat = _check_lattice(lat)
+    car = _check_coordinates(car)
+    inv_lat = _inverse_lattice(tuple(lat.astype(float).flatten()))
+    return car.reshape(-1,3).dot(inv_lat).reshape(car.shape)
 
 def rec_lat(lat):
     """
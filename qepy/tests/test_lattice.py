@@ -0,0 +1,32 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import unittest
+import numpy as np
+from qepy.lattice import red_car, car_red, Path
+
+class TestLattice(unittest.TestCase):
+
+    def setUp(self):
+        self.lat = np.array([[0,0.5,0.5],[0.5,0,0.5],[0.5,0.5,0]])
+
+    def test_red_car(self):
+        red = np.random.rand(2,5,3)
+        car = red_car(red,self.lat)
+        self.assertEqual(car.shape,red.shape)
+        np.testing.assert_allclose(car[1,2],np.dot(red[1,2],self.lat))
+        np.testing.assert_allclose(car_red(car,self.lat),red)
+        np.testing.assert_allclose(red_car([1,0,0],self.lat),self.lat[0])
+
+    def test_wrong_shape(self):
+        #the k-points of a path have the weight in the last column
+        path = Path([[[0,0,0],'G'],[[0.5,0,0],'X']],[10])
+        self.assertRaises(ValueError,red_car,path.get_klist(),self.lat)
+        self.assertRaises(ValueError,car_red,np.zeros([6,2]),self.lat)
+        self.assertRaises(ValueError,car_red,np.zeros([3,3]),np.eye(4))
+        red_car(path.get_klist()[:,:3],self.lat)
+
+if __name__ == '__main__':
+    unittest.main()
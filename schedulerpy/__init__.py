@@ -13,9 +13,18 @@ commands on different environments (clusters, local computers, etc..)
  * bash: Execute the job in the bash
  * oar : Use the OAR scheduler
  * pbs : Use the PBS scheduler
+ * slurm : Use the Slurm scheduler
+
+ Jobs of the bash scheduler can be run concurrently with LocalPool
+ The jobs submitted to the schedulers are followed with JobMonitor
+ Chains of jobs depending on each other are submitted at once with JobChain
 
 """
 from .scheduler import *
 from .oar import *
 from .pbs import *
+from .slurm import *
 from .bash import *
+from .pool import *
+from .monitor import *
+from .chain import *
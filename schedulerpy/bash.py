@@ -17,6 +17,19 @@ class Bash(Scheduler):
     _vardict = {"cores":"core",
                 "nodes":"nodes"}
 
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        """
+        The jobs run in the bash finish before run returns
+        """
+        return {}
+
+    def set_dependency(self,jobids,condition='afterok'):
+        """
+        The jobs in the bash run one after the other so the dependencies are already finished
+        """
+        pass
+
     def initialize(self):
         self.get_vardict()
 
@@ -36,7 +49,15 @@ class Bash(Scheduler):
         np = self.get_arg("np","-np")
         self.add_command("%s %s %d %s"%(mpirun,np,threads,cmd))
 
-    def run(self,filename='./run.sh',command='sh',dry=False):
+    def run(self,filename='./run.sh',command='sh',dry=False,wait=True):
+        """
+        Run the script in the bash
+
+        Arguments:
+            wait: if True block until the job finishes and store its output in stdout and stderr.
+                  if False return the subprocess.Popen of the job right after starting it,
+                  the output is written to <filename>.stdout and <filename>.stderr
+        """
         #create the submission script
         self.write(filename)
         workdir  = os.path.dirname(filename)
@@ -44,9 +65,13 @@ class Bash(Scheduler):
 
         if dry:
             print(command)
+        elif not wait:
+            with open(filename+'.stdout','w') as stdout, open(filename+'.stderr','w') as stderr:
+                return subprocess.Popen([command,basename],stdout=stdout,stderr=stderr,cwd=workdir or None)
         else:
-            p = subprocess.Popen([command,basename],stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=workdir)
+            p = subprocess.Popen([command,basename],stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=workdir or None)
             self.stdout, self.stderr = p.communicate()
+            self.returncode = p.returncode
             # In Python 3, Popen.communicate() returns bytes
             try:
                 self.stdout = self.stdout.decode()
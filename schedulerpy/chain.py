@@ -0,0 +1,108 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+#
+from __future__ import print_function
+import os
+from .monitor import JobMonitor
+
+__all__ = ['JobChain']
+
+class JobChain(object):
+    """
+    Submit a set of jobs with dependencies between them at once using the
+    dependencies of the scheduler (Slurm: --dependency=afterok, PBS: -W depend=afterok, OAR: -a)
+
+    The jobs are added with the jobs they depend on, which have to be added before.
+    Steps that need to be done between jobs (creating folders, inputs or databases)
+    are added as their own short jobs with ``add_setup``, so the whole chain is in the
+    queue and the python process that created it can exit.
+    With the Bash scheduler the jobs simply run one after the other.
+
+    Example:
+
+        .. code-block:: python
+
+            chain = JobChain()
+            scf  = chain.add(scf_shell,'scf/run.sh')
+            save = chain.add_setup(['cp -r scf/prefix.save nscf/'],'setup.sh',scf_shell,depends=scf)
+            nscf = chain.add(nscf_shell,'nscf/run.sh',depends=save)
+            chain.submit()
+    """
+    def __init__(self):
+        self.jobs = []         #schedulers of the jobs in the order they are submitted
+        self.filenames = {}    #id(job) -> submission script
+        self.depends = {}      #id(job) -> jobs it depends on
+
+    def add(self,shell,filename,depends=None):
+        """
+        Add a job to the chain
+
+        Arguments:
+            shell:    scheduler with the commands of the job
+            filename: submission script, the job runs in its folder
+            depends:  job or list of jobs of the chain (None are ignored) that must finish before
+        Returns the scheduler of the job to be used in the dependencies of other jobs
+        """
+        if depends is None: depends = []
+        if not isinstance(depends,(list,tuple)): depends = [depends]
+        depends = [job for job in depends if job is not None]
+        for job in depends:
+            if not any(job is other for other in self.jobs):
+                raise ValueError('The jobs a job depends on must be added to the chain before it')
+        if any(job is shell for job in self.jobs):
+            raise ValueError('This job was already added to the chain')
+        self.jobs.append(shell)
+        self.filenames[id(shell)] = filename
+        self.depends[id(shell)] = depends
+        return shell
+
+    def add_setup(self,commands,filename,scheduler,depends=None,walltime=None,name=None):
+        """
+        Add a short job running the commands with a single core of the scheduler
+        """
+        shell = scheduler.light_copy(walltime=walltime)
+        if name: shell.name = name
+        for command in commands: shell.add_command(command)
+        return self.add(shell,filename,depends=depends)
+
+    def get_depends(self,shell):
+        return self.depends[id(shell)]
+
+    def submit(self,dry=False):
+        """
+        Submit all the jobs of the chain, each one depending on the job ids of its dependencies.
+        Returns the list of the job ids (None for jobs run in the bash)
+        """
+        jobids = []
+        for shell in self.jobs:
+            depends = [getattr(job,'jobid',None) for job in self.depends[id(shell)]]
+            shell.set_dependency([jobid for jobid in depends if jobid is not None])
+            filename = self.filenames[id(shell)]
+            folder = os.path.dirname(filename)
+            if folder and not os.path.isdir(folder): os.makedirs(folder)
+            shell.run(filename=filename,dry=dry)
+            jobids.append(getattr(shell,'jobid',None))
+        return jobids
+
+    def wait(self,mode='all',interval=10.):
+        """
+        Wait for the jobs of the chain to finish using a JobMonitor
+        """
+        monitor = JobMonitor(interval=interval)
+        for shell in self.jobs:
+            monitor.add(shell,os.path.dirname(self.filenames[id(shell)]) or None)
+        return monitor.wait(mode=mode)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __str__(self):
+        index = dict((id(shell),n) for n,shell in enumerate(self.jobs))
+        lines = []; app = lines.append
+        for n,shell in enumerate(self.jobs):
+            depends = ",".join("%d"%index[id(job)] for job in self.depends[id(shell)])
+            app("%3d %10s %-40s depends: %s"%(n,shell.__class__.__name__,self.filenames[id(shell)],depends))
+        return "\n".join(lines)
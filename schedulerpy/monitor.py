@@ -0,0 +1,154 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+#
+from __future__ import print_function
+import time
+
+__all__ = ['JobMonitor']
+
+class JobMonitor(object):
+    """
+    Follow the status of jobs submitted to the schedulers
+
+    The status of all the jobs of the same scheduler is obtained with a single call
+    to the scheduler (``Scheduler.query_jobs``) and kept for ``interval`` seconds.
+    The jobs that keep the same status are checked less often: their interval
+    is multiplied by ``backoff`` each time up to ``max_interval`` seconds.
+
+    Arguments:
+
+        ``interval``: seconds between checks of a job that just changed its status
+        ``max_interval``: maximum seconds between checks of a job
+        ``backoff``: factor to increase the interval of the jobs with the same status
+
+    Example:
+
+        .. code-block:: python
+
+            monitor = JobMonitor(interval=10)
+            for shell in shells: monitor.add(shell)
+            monitor.wait(mode='all')
+    """
+    def __init__(self,interval=10.,max_interval=300.,backoff=2.):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jobs = []      #schedulers of the jobs being followed
+        self.status = {}    #id(job) -> last status
+        self._next = {}     #id(job) -> time of the next check
+        self._delay = {}    #id(job) -> current interval
+        self._workdir = {}  #id(job) -> folder where to query the job
+        self.nqueries = 0
+
+    def add(self,shell,workdir=None):
+        """
+        Follow the job submitted with the scheduler shell
+        """
+        if any(job is shell for job in self.jobs): return
+        self.jobs.append(shell)
+        self._workdir[id(shell)] = workdir
+        self._next[id(shell)] = 0
+        self._delay[id(shell)] = self.interval
+
+    def remove(self,shell):
+        self.jobs = [job for job in self.jobs if job is not shell]
+        for cache in [self.status,self._next,self._delay,self._workdir]: cache.pop(id(shell),None)
+
+    @staticmethod
+    def jobid(shell):
+        return getattr(shell,'jobid',None)
+
+    def is_active(self,shell):
+        """
+        Check if the job is still queued or running according to the last status known
+        """
+        if self.jobid(shell) is None: return False
+        status = self.status.get(id(shell))
+        return status is None or status in shell._active_states
+
+    def update(self,force=False):
+        """
+        Query the status of the jobs that are due to be checked (or all if force).
+        The jobs of each type of scheduler are queried with a single call.
+        """
+        now = time.time()
+        due = {}
+        for shell in self.jobs:
+            if self.jobid(shell) is None: continue
+            if not self.is_active(shell): continue
+            if not force and self._next[id(shell)] > now: continue
+            due.setdefault(type(shell),[]).append(shell)
+
+        for scheduler, shells in due.items():
+            jobids = [self.jobid(shell) for shell in shells]
+            workdir = next((self._workdir[id(shell)] for shell in shells if self._workdir[id(shell)]),None)
+            status = scheduler.query_jobs(jobids,workdir)
+            self.nqueries += 1
+            now = time.time()
+            for shell in shells:
+                new_status = status.get(str(self.jobid(shell)),'NULL')
+                if new_status == self.status.get(id(shell)):
+                    delay = min(self._delay[id(shell)]*self.backoff,self.max_interval)
+                else:
+                    delay = self.interval
+                self.status[id(shell)] = new_status
+                self._delay[id(shell)] = delay
+                self._next[id(shell)] = now+delay
+
+    def get_status(self,shell):
+        """
+        Status of a job from the cache, it is queried if it is due to be checked
+        """
+        self.add(shell)
+        self.update()
+        return self.status.get(id(shell),'NULL')
+
+    @property
+    def active(self):
+        return [shell for shell in self.jobs if self.is_active(shell)]
+
+    @property
+    def finished(self):
+        return [shell for shell in self.jobs if not self.is_active(shell)]
+
+    def wait(self,jobs=None,mode='all',timeout=None):
+        """
+        Block until the jobs finish
+
+        Arguments:
+            jobs:    list of schedulers of the jobs to wait for (default: all the jobs followed)
+            mode:    'all' to wait for all the jobs or 'any' to return when one of them finishes
+            timeout: maximum seconds to wait
+
+        Returns the list of jobs that finished
+        """
+        if mode not in ['all','any']:
+            raise ValueError("Unknown mode %s, use 'all' or 'any'"%mode)
+        if jobs is None: jobs = list(self.jobs)
+        for shell in jobs: self.add(shell)
+        start = time.time()
+
+        while True:
+            self.update()
+            active = [shell for shell in jobs if self.is_active(shell)]
+            finished = [shell for shell in jobs if not self.is_active(shell)]
+            if not active: break
+            if mode == 'any' and finished: break
+            #sleep until the next job is due to be checked
+            sleep = min(self._next[id(shell)] for shell in active)-time.time()
+            if timeout is not None:
+                remaining = timeout-(time.time()-start)
+                if remaining <= 0: break
+                sleep = min(sleep,remaining)
+            if sleep > 0: time.sleep(sleep)
+        return finished
+
+    def __str__(self):
+        lines = []; app = lines.append
+        for shell in self.jobs:
+            app("%15s %10s %10s %8.1lf"%(self.jobid(shell),shell.__class__.__name__,
+                                          self.status.get(id(shell)),self._delay[id(shell)]))
+        return "\n".join(lines)
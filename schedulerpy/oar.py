@@ -17,6 +17,9 @@ class Oar(Scheduler):
     """
     _vardict = {"cores":"core",
                 "nodes":"nodes"}
+    _array_index = "OAR_ARRAY_INDEX"
+    _active_states = ['Waiting','Hold','toLaunch','toAckReservation','Launching',
+                      'Running','Suspended','Resuming','Finishing']
                 
     def initialize(self):
         self.get_vardict()
@@ -33,6 +36,39 @@ class Oar(Scheduler):
         if resources_line:
             args.append(resources_line)
         
+    def set_dependency(self,jobids,condition='afterok'):
+        """
+        Start this job only after the jobs with these ids finish, using -a <id> for each of them.
+        OAR starts the job when the previous ones end, whatever their exit code.
+        """
+        for jobid in self.get_jobids(jobids):
+            self.arguments.append("-a %s"%jobid)
+
+    def set_array(self,njobs,maxrunning=None):
+        """
+        Submit this job as an array of njobs jobs with indexes 1 to njobs
+        """
+        self.arguments.append("--array %d"%njobs)
+
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        """
+        get the status of a list of jobs with a single call to oarstat
+        """
+        if not jobids: return {}
+        command = ['oarstat','-s']
+        for jobid in jobids: command += ['-j',str(jobid)]
+        return cls.parse_oarstat(cls.run_query(command,workdir))
+
+    @staticmethod
+    def parse_oarstat(stdout):
+        status = {}
+        for line in stdout.split('\n'):
+            if ':' not in line: continue
+            jobid, state = line.split(':',1)
+            status[jobid.strip()] = state.strip()
+        return status
+
     def get_resources_line(self):
         """
         get the the line with the resources
@@ -70,13 +106,15 @@ class Oar(Scheduler):
         """
         return self.get_script()
 
-    def run(self,silent=True,dry=False):
+    def run(self,filename=None,dry=False,silent=True):
         """
         run the command
         arguments:
+        filename - keep a copy of the submission script in this file
         dry - only print the commands to be run on the screen
         """
         command = self.get_bash()
+        if filename and not dry: self.write(filename)
         
         if dry:
             print(command)
@@ -91,7 +129,7 @@ class Oar(Scheduler):
             if not silent: print(self.stdout)
                 
             #get jobid
-            for line in self.stdout.split('\n'):
+            for line in self.stdout.decode().split('\n'):
                 if 'OAR_JOB_ID' in line:
                     self.jobid = int(line.strip().split('=')[1])
             print("jobid:",self.jobid)
@@ -21,6 +21,8 @@ class Pbs(Scheduler):
     """
     _vardict = {"cores":"core",
                 "nodes":"select"}
+    _array_index = "PBS_ARRAY_INDEX"
+    _active_states = ['Q','R','H','W','E','T','B','S','U']
                    
     def initialize(self):
         self.get_vardict()
@@ -47,6 +49,45 @@ class Pbs(Scheduler):
         if resources_line:
             args.append("-l %s"%resources_line)
 
+    def set_dependency(self,jobids,condition='afterok'):
+        """
+        Start this job only after the jobs with these ids finish, using -W depend=afterok:id1:id2
+        """
+        jobids = self.get_jobids(jobids)
+        if jobids: self.arguments.append("-W depend=%s:%s"%(condition,":".join(jobids)))
+
+    def set_array(self,njobs,maxrunning=None):
+        """
+        Submit this job as an array of njobs jobs with indexes 1 to njobs
+        The flag is -J for PBS Pro, use "array_flag":"-t" and "array_index":"PBS_ARRAYID" for Torque
+        """
+        array = "1-%d"%njobs
+        if maxrunning: array += "%%%d"%maxrunning
+        self.arguments.append("%s %s"%(self.get_arg("array_flag","-J"),array))
+
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        """
+        get the status of a list of jobs with a single call to qstat
+        """
+        if not jobids: return {}
+        stdout = cls.run_query(['qstat']+[str(jobid) for jobid in jobids],workdir)
+        return cls.parse_qstat(stdout,jobids)
+
+    @classmethod
+    def parse_qstat(cls,stdout,jobids):
+        """
+        qstat may truncate the name of the server in the jobid so the jobs are matched by their number
+        """
+        numbers = dict((str(jobid).split('.')[0],str(jobid)) for jobid in jobids)
+        status = {}
+        for line in stdout.split('\n'):
+            fields = line.split()
+            if len(fields) < 6: continue
+            number = fields[0].split('.')[0]
+            if number in numbers: status[numbers[number]] = fields[4]
+        return status
+
     def get_mem(self):
         """
         get the memory for this job
@@ -154,7 +195,7 @@ class Pbs(Scheduler):
         if verbose: print(self.stdout)
         
         #get jobid
-        self.jobid = str(self.stdout).split("\n")[0]
+        self.jobid = self.stdout.decode().split("\n")[0].strip()
         if verbose: print("jobid:",self.jobid)
 
     
@@ -0,0 +1,122 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+#
+from __future__ import print_function
+import threading
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+from .bash import Bash
+
+__all__ = ['LocalPool']
+
+class LocalPool(object):
+    """
+    Run jobs of the Bash scheduler concurrently in the local machine
+
+    Arguments:
+
+        ``cores``: number of cores available to the pool (default: unlimited).
+                   A job uses ``scheduler.cores`` cores (1 if not set).
+                   A job larger than the budget is only started when the pool is empty.
+
+    Each job is started without blocking and a thread waits for its process
+    so that ``wait`` returns as soon as any of the jobs finishes.
+    The exit codes are kept in ``exitcodes`` by the pid of the job.
+    """
+    def __init__(self,cores=None):
+        self.cores = cores
+        self.processes = {}  #pid -> (process, cores)
+        self.exitcodes = {}  #pid -> exitcode
+        self._finished = Queue()
+
+    @staticmethod
+    def accepts(scheduler):
+        """ Check if the jobs of this scheduler can be run in the pool
+        """
+        return isinstance(scheduler,Bash)
+
+    @staticmethod
+    def job_cores(scheduler):
+        return scheduler.cores if scheduler.cores else 1
+
+    @property
+    def running(self):
+        """ pids of the jobs running """
+        return list(self.processes.keys())
+
+    @property
+    def used_cores(self):
+        return sum(cores for process,cores in self.processes.values())
+
+    @property
+    def free_cores(self):
+        if self.cores is None: return None
+        return self.cores-self.used_cores
+
+    def fits(self,scheduler):
+        """ Check if there are enough free cores to start a job of this scheduler
+        """
+        if self.cores is None or not self.processes: return True
+        return self.job_cores(scheduler) <= self.free_cores
+
+    def _waiter(self,process):
+        process.wait()
+        self._finished.put(process.pid)
+
+    def submit(self,scheduler,filename='./run.sh',command='sh'):
+        """
+        Start a job of the Bash scheduler and return its pid
+        """
+        if not self.accepts(scheduler):
+            raise ValueError('Only jobs of the Bash scheduler can run in a LocalPool')
+        process = scheduler.run(filename,command=command,wait=False)
+        self.processes[process.pid] = (process,self.job_cores(scheduler))
+        thread = threading.Thread(target=self._waiter,args=(process,))
+        thread.daemon = True
+        thread.start()
+        return process.pid
+
+    def wait(self,timeout=None):
+        """
+        Wait until at least one job finishes or timeout seconds pass.
+        Returns a dictionary with the pid and exit code of the jobs that finished.
+        """
+        finished = {}
+        if not self.processes: return finished
+        try:
+            pids = [self._finished.get(timeout=timeout)]
+        except Empty:
+            return finished
+        #collect the other jobs that finished in the meantime
+        while True:
+            try:
+                pids.append(self._finished.get_nowait())
+            except Empty:
+                break
+        for pid in pids:
+            process, cores = self.processes.pop(pid)
+            finished[pid] = self.exitcodes[pid] = process.returncode
+        return finished
+
+    def wait_all(self):
+        """ Wait until all the jobs finish and return their exit codes
+        """
+        finished = {}
+        while self.processes:
+            finished.update(self.wait())
+        return finished
+
+    def __len__(self):
+        return len(self.processes)
+
+    def __str__(self):
+        lines = []; app = lines.append
+        app("cores:    %s"%("unlimited" if self.cores is None else "%d"%self.cores))
+        app("running:  %s"%" ".join("%d"%pid for pid in self.running))
+        app("finished: %s"%" ".join("%d:%d"%(pid,code) for pid,code in self.exitcodes.items()))
+        return "\n".join(lines)
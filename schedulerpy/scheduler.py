@@ -43,6 +43,8 @@ class Scheduler(object):
     #TODO: Add a way to get the home directory
     _config_path     = os.path.expanduser("~") + "/.yambopy"
     _config_filename = "%s/config.json"%_config_path
+    _array_index     = None
+    _active_states   = []
 
     def __init__(self, name=None, nodes=None, cores=None, cpus_per_task=None, walltime="1:00:00", **kwargs ):
         self.name = name
@@ -264,6 +266,81 @@ class Scheduler(object):
         """
         raise NotImplementedError('Run not implemented')
 
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        """
+        get the status of a list of jobs with a single call to the scheduler
+
+        return:
+        dictionary with the status of each jobid, the jobs not known to the scheduler
+        (finished) are not present. The jobs are running while their status is in ``_active_states``.
+        """
+        raise NotImplementedError('Querying jobs is not supported by %s'%cls.__name__)
+
+    @staticmethod
+    def run_query(command,workdir=None):
+        """
+        run a command to query the scheduler and return its output (empty if it fails)
+        """
+        try:
+            p = subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=workdir)
+        except OSError:
+            return ''
+        stdout,stderr = p.communicate()
+        return stdout.decode()
+
+    def set_dependency(self,jobids,condition='afterok'):
+        """
+        Start this job only after the jobs with these ids finish (with success for 'afterok')
+
+        Arguments:
+            jobids: list of job ids or a string of ids separated by ':'
+        """
+        raise NotImplementedError('Dependencies are not supported by %s'%self.__class__.__name__)
+
+    @staticmethod
+    def get_jobids(jobids):
+        """ list of job ids from a list or a string of ids separated by ':'
+        """
+        if jobids is None: return []
+        if isinstance(jobids,(list,tuple)): return [str(jobid) for jobid in jobids if jobid is not None]
+        return [jobid for jobid in str(jobids).split(':') if jobid]
+
+    def light_copy(self,cores=1,nodes=1,walltime=None):
+        """
+        return a copy of this scheduler without commands using fewer resources
+        (for short setup jobs)
+        """
+        light = self.copy()
+        light.cores = cores
+        light.nodes = nodes
+        light.cpus_per_task = None
+        if walltime: light.walltime = walltime
+        light.commands  = []
+        light.arguments = []
+        for key in ['dependency','dependent','array']: light.kwargs.pop(key,None)
+        light.initialize()
+        return light
+
+    def set_array(self,njobs,maxrunning=None):
+        """
+        Submit this job as an array of njobs jobs with indexes 1 to njobs
+
+        Arguments:
+            maxrunning: maximum number of jobs of the array running at the same time
+                        (only if supported by the scheduler)
+        """
+        raise NotImplementedError('Job arrays are not supported by %s'%self.__class__.__name__)
+
+    def get_array_index(self):
+        """
+        get the shell variable with the index of the job in the array
+        """
+        index = self.get_arg("array_index",self._array_index)
+        if index is None:
+            raise NotImplementedError('Job arrays are not supported by %s'%self.__class__.__name__)
+        return "${%s}"%index
+
     def set_posrun(self,posrun):
         self.pos_run = posrun
 
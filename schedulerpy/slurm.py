@@ -18,6 +18,8 @@ class Slurm(Scheduler):
     _vardict = {"cores":"core",
                 "nodes":"nodes",
                 "cpus_per_task":"cpus_per_task"}
+    _array_index = "SLURM_ARRAY_TASK_ID"
+    _active_states = ['PD','CF','R','CG','S','RQ','RF','RS']
                           
                 
     def initialize(self):
@@ -41,6 +43,9 @@ class Slurm(Scheduler):
         dependency = self.get_arg("dependency",None)
         if dependency: app("#SBATCH --dependency=%s"%dependency)
 
+        array = self.get_arg("array",None)
+        if array: app("#SBATCH --array=%s"%array)
+
         if self.nodes: app("#SBATCH -N %d" % self.nodes)
         if self.cores: app("#SBATCH --ntasks-per-node=%d" % self.cores)
         if self.cpus_per_task: app("#SBATCH --cpus-per-task=%d" % self.cpus_per_task )
@@ -53,6 +58,21 @@ class Slurm(Scheduler):
         app(self.get_commands())
         return "\n".join(lines)
 
+    def set_dependency(self,jobids,condition='afterok'):
+        """
+        Start this job only after the jobs with these ids finish, using --dependency=afterok:id1:id2
+        """
+        jobids = self.get_jobids(jobids)
+        if jobids: self.kwargs["dependency"] = "%s:%s"%(condition,":".join(jobids))
+
+    def set_array(self,njobs,maxrunning=None):
+        """
+        Submit this job as an array of njobs jobs with indexes 1 to njobs
+        """
+        array = "1-%d"%njobs
+        if maxrunning: array += "%%%d"%maxrunning
+        self.kwargs["array"] = array
+
     def __str__(self):
         """
         create the string for this job
@@ -86,6 +106,27 @@ class Slurm(Scheduler):
         #check if there is stdout
         if verbose: print(self.stdout)
         
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        """
+        get the status of a list of jobs with a single call to squeue
+        The jobs of an array are running while any of them is running
+        """
+        if not jobids: return {}
+        stdout = cls.run_query(['squeue','-h','-o','%i %t','-j',','.join(str(jobid) for jobid in jobids)],workdir)
+        return cls.parse_squeue(stdout)
+
+    @classmethod
+    def parse_squeue(cls,stdout):
+        status = {}
+        for line in stdout.split('\n'):
+            fields = line.split()
+            if len(fields) != 2: continue
+            jobid = fields[0].split('_')[0]
+            if status.get(jobid) in cls._active_states: continue
+            status[jobid] = fields[1]
+        return status
+
     def check_job_status(self,workdir):
         """
         Return status of slurm job (empty if job is not present)
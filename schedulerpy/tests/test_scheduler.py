@@ -167,6 +167,180 @@ class TestSchedulerRun(unittest.TestCase):
         #remove files
         clean_config()
 
+class TestLocalPool(unittest.TestCase):
+    """
+    Run jobs of the bash scheduler concurrently in a LocalPool
+    """
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp()
+
+    def job(self,name,cmd,cores=1):
+        s = Bash(cores=cores)
+        s.add_command(cmd)
+        return s, os.path.join(self.tmp,'%s.sh'%name)
+
+    def test_pool(self):
+        import time
+        pool = LocalPool(cores=2)
+
+        #two jobs fit in the budget and run at the same time
+        start = time.time()
+        slow = pool.submit(*self.job('slow','sleep 1'))
+        fast = pool.submit(*self.job('fast','exit 3'))
+        big, bigrun = self.job('big','true',cores=2)
+        self.assertFalse(pool.fits(big))
+
+        #wake up as soon as the first job finishes
+        finished = pool.wait()
+        self.assertEqual(finished,{fast:3})
+        self.assertLess(time.time()-start,0.9)
+
+        finished = pool.wait_all()
+        self.assertEqual(finished,{slow:0})
+        self.assertLess(time.time()-start,1.9)
+        self.assertEqual(pool.exitcodes,{slow:0,fast:3})
+
+        #a job as large as the budget runs once the pool is empty
+        self.assertTrue(pool.fits(big))
+        pid = pool.submit(big,bigrun)
+        self.assertEqual(pool.wait(timeout=5),{pid:0})
+        self.assertEqual(pool.wait(timeout=0.1),{})
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+class FakeSlurm(Slurm):
+    """
+    Slurm scheduler where each job is running for a number of queries
+    """
+    nqueries = 0
+    remaining = {}
+
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        cls.nqueries += 1
+        status = {}
+        for jobid in jobids:
+            cls.remaining[jobid] -= 1
+            if cls.remaining[jobid] > 0: status[jobid] = 'R'
+        return status
+
+class TestJobMonitor(unittest.TestCase):
+    """
+    Follow the status of several jobs with a JobMonitor
+    """
+    def jobs(self,nqueries):
+        FakeSlurm.nqueries = 0
+        FakeSlurm.remaining = {}
+        shells = []
+        for n,remaining in enumerate(nqueries):
+            s = FakeSlurm()
+            s.jobid = "%d"%(100+n)
+            FakeSlurm.remaining[s.jobid] = remaining
+            shells.append(s)
+        return shells
+
+    def test_wait(self):
+        shells = self.jobs([1,3,3])
+        monitor = JobMonitor(interval=0.01,backoff=1)
+        for s in shells: monitor.add(s)
+        #all the jobs are queried with a single call
+        self.assertEqual(monitor.wait(mode='any'),shells[:1])
+        self.assertEqual(FakeSlurm.nqueries,1)
+        self.assertEqual(monitor.wait(mode='all'),shells)
+        self.assertEqual(FakeSlurm.nqueries,3)
+        #the jobs that finished are not queried again
+        self.assertEqual(monitor.get_status(shells[0]),'NULL')
+        self.assertEqual(FakeSlurm.nqueries,3)
+
+    def test_backoff(self):
+        shells = self.jobs([100])
+        monitor = JobMonitor(interval=0.01,max_interval=0.04,backoff=2)
+        self.assertEqual(monitor.wait(shells,timeout=0.2),[])
+        self.assertEqual(monitor._delay[id(shells[0])],0.04)
+        self.assertLess(FakeSlurm.nqueries,10)
+        #the status is cached between queries
+        monitor._next[id(shells[0])] += 10
+        nqueries = FakeSlurm.nqueries
+        self.assertEqual(monitor.get_status(shells[0]),'R')
+        self.assertEqual(FakeSlurm.nqueries,nqueries)
+
+    def test_parse(self):
+        self.assertEqual(Slurm.parse_squeue("12 R\n13_[2-4] PD\n13_1 R\n"),{'12':'R','13':'PD'})
+        qstat = dedent("""
+                       Job id            Name             User              Time Use S Queue
+                       ----------------  ---------------- ----------------  -------- - -----
+                       123.server        run.sh           user              00:00:00 R workq
+                       """)
+        self.assertEqual(Pbs.parse_qstat(qstat,['123.server.domain','124.server']),{'123.server.domain':'R'})
+        self.assertEqual(Oar.parse_oarstat("12: Running\n13: Terminated\n"),{'12':'Running','13':'Terminated'})
+
+class WriteSlurm(Slurm):
+    """
+    Slurm scheduler that writes the submission script and gives consecutive job ids
+    """
+    njobs = 0
+    def run(self,filename='run.sh',dry=False):
+        self.write(filename)
+        WriteSlurm.njobs += 1
+        self.jobid = "%d"%(100+WriteSlurm.njobs)
+
+class TestJobChain(unittest.TestCase):
+    """
+    Submit chains of jobs with dependencies
+    """
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp()
+
+    def test_dependencies(self):
+        self.assertEqual(Scheduler.get_jobids('1:2'),['1','2'])
+        self.assertEqual(Scheduler.get_jobids([1,None,2]),['1','2'])
+        pbs = Pbs(cores=4)
+        pbs.set_dependency([1,2])
+        self.assertIn('#PBS -W depend=afterok:1:2',str(pbs))
+        oar = Oar(cores=4)
+        oar.set_dependency('1:2')
+        self.assertIn('#OAR -a 1\n#OAR -a 2',str(oar))
+
+        #the setup jobs use a single core and no dependencies of the original scheduler
+        light = pbs.light_copy(walltime="0:10:00")
+        self.assertNotIn('depend',str(light))
+        self.assertIn('core=1',str(light))
+
+    def test_slurm(self):
+        WriteSlurm.njobs = 0
+        shell = WriteSlurm(cores=8)
+        chain = JobChain()
+        scf = chain.add(shell.copy(),os.path.join(self.tmp,'scf','run.sh'))
+        setup = chain.add_setup(['cp -r scf/si.save nscf'],os.path.join(self.tmp,'setup.sh'),shell,depends=scf)
+        nscf = chain.add(shell.copy(),os.path.join(self.tmp,'nscf','run.sh'),depends=[setup,None])
+        last = chain.add(shell.copy(),os.path.join(self.tmp,'last.sh'),depends=[scf,nscf])
+        self.assertRaises(ValueError,chain.add,shell.copy(),'other.sh',depends=WriteSlurm())
+
+        self.assertEqual(chain.submit(),['101','102','103','104'])
+        scripts = [open(chain.filenames[id(job)]).read() for job in chain.jobs]
+        self.assertNotIn('dependency',scripts[0])
+        self.assertIn('--dependency=afterok:101\n',scripts[1])
+        self.assertIn('--ntasks-per-node=1\n',scripts[1])
+        self.assertIn('--dependency=afterok:102\n',scripts[2])
+        self.assertIn('--dependency=afterok:101:103\n',scripts[3])
+
+    def test_bash(self):
+        chain = JobChain()
+        first = chain.add_setup(['echo 1 > out'],os.path.join(self.tmp,'first.sh'),Bash())
+        second = Bash()
+        second.add_command('echo 2 >> out')
+        chain.add(second,os.path.join(self.tmp,'second.sh'),depends=first)
+        chain.submit()
+        with open(os.path.join(self.tmp,'out')) as f:
+            self.assertEqual(f.read().split(),['1','2'])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
 
 if __name__ == '__main__':
 
@@ -8,3 +8,4 @@
 
 from .yambofile import *
 from .yambofolder import *
+from .cache import *
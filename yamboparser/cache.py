@@ -0,0 +1,276 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yamboparser
+#
+"""
+On-disk cache of the data parsed from the files produced by yambo
+"""
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+__all__ = ['YamboCache','get_cache']
+
+def _encode(obj,arrays):
+    """
+    Convert obj to something json can write, the arrays are moved to the arrays dictionary
+    and replaced by a reference to them
+    """
+    if isinstance(obj,np.ndarray) and obj.dtype != object:
+        key = 'array_%d'%len(arrays)
+        arrays[key] = np.asarray(obj)
+        return {'__array__':key}
+    if isinstance(obj,np.ndarray):
+        obj = obj.tolist()
+    if isinstance(obj,dict):
+        if all(isinstance(key,str) for key in obj):
+            return dict((key,_encode(value,arrays)) for key,value in obj.items())
+        return {'__items__':[[_encode(key,arrays),_encode(value,arrays)] for key,value in obj.items()]}
+    if isinstance(obj,(list,tuple)):
+        return [_encode(value,arrays) for value in obj]
+    if isinstance(obj,np.generic):
+        obj = obj.item()
+    if isinstance(obj,complex):
+        return {'__complex__':[obj.real,obj.imag]}
+    return obj
+
+def _decode(obj,arrays):
+    """
+    Inverse of _encode, arrays is a dictionary or an open npz file
+    """
+    if isinstance(obj,dict):
+        if '__array__' in obj:   return arrays[obj['__array__']]
+        if '__complex__' in obj: return complex(*obj['__complex__'])
+        if '__items__' in obj:
+            return dict((_decode(key,arrays),_decode(value,arrays)) for key,value in obj['__items__'])
+        return dict((key,_decode(value,arrays)) for key,value in obj.items())
+    if isinstance(obj,list):
+        return [_decode(value,arrays) for value in obj]
+    return obj
+
+def save_npz(filename,data,**meta):
+    """
+    Save a nested structure of dictionaries, lists and arrays in a npz file.
+    The arrays are stored natively and the rest in a json manifest together with meta.
+    The file is written to a temporary file and moved in place so readers never see it half written.
+    """
+    arrays = {}
+    manifest = dict(meta,data=_encode(data,arrays))
+    arrays['__manifest__'] = np.array(json.dumps(manifest))
+
+    folder = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=folder,suffix='.tmp')
+    try:
+        with os.fdopen(fd,'wb') as f:
+            np.savez(f,**arrays)
+        os.replace(tmpname,filename)
+    except:
+        if os.path.isfile(tmpname): os.remove(tmpname)
+        raise
+
+def load_npz(filename):
+    """
+    Load a file written with save_npz and return (data, manifest)
+    """
+    with np.load(filename,allow_pickle=False) as npz:
+        manifest = json.loads(str(npz['__manifest__']))
+        data = _decode(manifest.pop('data'),npz)
+    return data, manifest
+
+def load_npz_manifest(filename):
+    """
+    Read only the manifest of a file written with save_npz.
+    In manifest['data'] the arrays are references that can be read later with decode_npz
+    """
+    with np.load(filename,allow_pickle=False) as npz:
+        return json.loads(str(npz['__manifest__']))
+
+def decode_npz(filename,encoded):
+    """
+    Read the arrays referenced in part of the manifest of a file written with save_npz
+    Only the arrays referenced are read from the file.
+    """
+    with np.load(filename,allow_pickle=False) as npz:
+        return _decode(encoded,npz)
+
+class YamboCache():
+    """
+    Cache of parsed files stored on disk as npz files
+
+    Arguments:
+
+        ``path``: folder to store the cache (default: $YAMBOPY_CACHE or ~/.cache/yambopy)
+        ``max_size``: maximum size of the cache in MB, the least recently used entries are removed first
+        ``validate``: how to check that a file did not change since it was cached
+
+            'mtime': the size and modification time of the file are the same
+            'hash':  the sha1 hash of the content is the same (files copied or touched
+                     without changes are still found in the cache)
+
+    Each entry is keyed by the absolute path of the file and a namespace
+    so different parsers can cache the same file.
+    """
+    _version = 1
+
+    def __init__(self,path=None,max_size=512,validate='mtime'):
+        if validate not in ['mtime','hash']:
+            raise ValueError('Unknown validation %s, use mtime or hash'%validate)
+        if path is None: path = YamboCache.default_path()
+        self.path = path
+        self.max_size = max_size
+        self.validate = validate
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def default_path():
+        return os.environ.get('YAMBOPY_CACHE',os.path.join(os.path.expanduser('~'),'.cache','yambopy'))
+
+    def entry(self,filename,namespace='yamboparser'):
+        """
+        Path of the entry of the cache for filename
+        """
+        name = '%s:%s'%(namespace,os.path.abspath(filename))
+        return os.path.join(self.path,hashlib.sha1(name.encode()).hexdigest()+'.npz')
+
+    @staticmethod
+    def sha1(filename,blocksize=2**20):
+        """
+        Hash of the content of the file
+        """
+        h = hashlib.sha1()
+        with open(filename,'rb') as f:
+            for block in iter(lambda: f.read(blocksize),b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def stamp(self,filename):
+        """
+        Information used to check if the file changed
+        """
+        stat = os.stat(filename)
+        stamp = {'path':os.path.abspath(filename),'size':stat.st_size,'mtime':stat.st_mtime_ns}
+        if self.validate == 'hash': stamp['sha1'] = YamboCache.sha1(filename)
+        return stamp
+
+    def _is_valid(self,stamp,filename):
+        """
+        Check if the file did not change since it was cached.
+        Returns 'mtime' or 'hash' according to how the file was validated, or False
+        """
+        if stamp.get('version') != self._version: return False
+        stat = os.stat(filename)
+        if stamp['size'] != stat.st_size: return False
+        if stamp['mtime'] == stat.st_mtime_ns: return 'mtime'
+        if self.validate == 'hash' and stamp.get('sha1') == YamboCache.sha1(filename): return 'hash'
+        return False
+
+    def load(self,filename,namespace='yamboparser'):
+        """
+        Return the data cached for filename or None if it is not cached or the file changed
+        """
+        entry = self.entry(filename,namespace)
+        try:
+            data, stamp = load_npz(entry)
+            valid = self._is_valid(stamp,filename)
+        except (OSError,ValueError,KeyError):
+            valid = False
+        if not valid:
+            self.misses += 1
+            return None
+        self.hits += 1
+        #the file was touched without changes, store the new stamp so it is not hashed again
+        if valid == 'hash':
+            self.store(filename,data,namespace)
+            return data
+        #mark the entry as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return data
+
+    def store(self,filename,data,namespace='yamboparser'):
+        """
+        Store the data parsed from filename, returns False if the cache can not be written
+        """
+        try:
+            os.makedirs(self.path,exist_ok=True)
+            save_npz(self.entry(filename,namespace),data,version=self._version,**self.stamp(filename))
+        except OSError:
+            return False
+        self.evict()
+        return True
+
+    def invalidate(self,filename,namespace='yamboparser'):
+        """
+        Remove the entry of filename from the cache
+        """
+        entry = self.entry(filename,namespace)
+        if os.path.isfile(entry): os.remove(entry)
+
+    def entries(self):
+        """
+        List of (path, size, last access) of the entries in the cache
+        """
+        if not os.path.isdir(self.path): return []
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.npz'): continue
+            path = os.path.join(self.path,name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path,stat.st_size,stat.st_mtime))
+        return entries
+
+    @property
+    def size(self):
+        """ Size of the cache in MB
+        """
+        return sum(size for path,size,mtime in self.entries())/1024.**2
+
+    def evict(self,max_size=None):
+        """
+        Remove the least recently used entries until the cache is smaller than max_size (in MB)
+        """
+        if max_size is None: max_size = self.max_size
+        entries = sorted(self.entries(),key=lambda entry: entry[2])
+        total = sum(size for path,size,mtime in entries)
+        while entries and total > max_size*1024**2:
+            path, size, mtime = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove all the entries of the cache
+        """
+        self.evict(max_size=0)
+
+    def __len__(self):
+        return len(self.entries())
+
+    def __str__(self):
+        s  = "path:     %s\n"%self.path
+        s += "entries:  %d\n"%len(self)
+        s += "size:     %.2lf MB (max %.2lf MB)\n"%(self.size,self.max_size)
+        s += "validate: %s\n"%self.validate
+        s += "hits:     %d misses: %d"%(self.hits,self.misses)
+        return s
+
+def get_cache(cache):
+    """
+    Get the cache from the cache argument of the parsers:
+    True uses the default cache, False or None bypass it, or an instance of YamboCache
+    """
+    if cache is True: return YamboCache()
+    if cache is None or cache is False: return None
+    return cache
@@ -0,0 +1,92 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from yamboparser import YamboFile, YamboFolder, YamboCache
+
+folder = os.path.join(os.path.dirname(__file__),'..','..','yambopy','data','refs','parser')
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = YamboCache(os.path.join(self.tmp,'cache'))
+        shutil.copytree(os.path.join(folder,'t2_parse_qps'),os.path.join(self.tmp,'t2'))
+        self.folder = os.path.join(self.tmp,'t2')
+
+    def test_cache(self):
+        filename = 'r-yambo_em1d_HF_and_locXC_gw0'
+        ref = YamboFile(filename,self.folder)
+
+        #the first time the file is parsed and the second one read from the cache
+        YamboFile(filename,self.folder,cache=self.cache)
+        fl = YamboFile(filename,self.folder,cache=self.cache)
+        self.assertEqual((self.cache.hits,self.cache.misses),(1,1))
+        self.assertEqual(fl.kpoints,ref.kpoints)
+        self.assertEqual(fl.timing,ref.timing)
+        for k in ref.data:
+            for tag in ref.data[k]:
+                np.testing.assert_array_equal(fl.data[k][tag],ref.data[k][tag])
+
+        #a modified file is parsed again
+        path = os.path.join(self.folder,filename)
+        with open(path,'a') as f: f.write('\n')
+        YamboFile(filename,self.folder,cache=self.cache)
+        self.assertEqual(self.cache.misses,2)
+
+        #bypass and invalidate the cache
+        YamboFile(filename,self.folder,cache=False)
+        self.assertEqual(self.cache.hits+self.cache.misses,3)
+        self.cache.invalidate(path)
+        YamboFile(filename,self.folder,cache=self.cache)
+        self.assertEqual(self.cache.misses,3)
+
+    def test_default(self):
+        #the cache is only used when requested
+        os.environ['YAMBOPY_CACHE'] = os.path.join(self.tmp,'default')
+        try:
+            YamboFolder(self.folder)
+            self.assertEqual(len(YamboCache()),0)
+            YamboFolder(self.folder,cache=True)
+            self.assertEqual(len(YamboCache()),5)
+        finally:
+            del os.environ['YAMBOPY_CACHE']
+
+    def test_hash(self):
+        cache = YamboCache(os.path.join(self.tmp,'hash'),validate='hash')
+        YamboFolder(self.folder,cache=cache)
+        #touching the files does not change their content
+        for filename in os.listdir(self.folder):
+            os.utime(os.path.join(self.folder,filename),(0,0))
+        fold = YamboFolder(self.folder,cache=cache)
+        self.assertEqual(cache.hits,len(fold.yambofiles))
+
+        #the stamps were refreshed and the files are not hashed again
+        sha1 = YamboCache.sha1
+        YamboCache.sha1 = staticmethod(lambda filename: self.fail('%s hashed again'%filename))
+        try:
+            YamboFolder(self.folder,cache=cache)
+        finally:
+            YamboCache.sha1 = staticmethod(sha1)
+        self.assertEqual(cache.hits,2*len(fold.yambofiles))
+
+    def test_evict(self):
+        YamboFolder(self.folder,cache=self.cache)
+        self.assertEqual(len(self.cache),5)
+        size = self.cache.size
+        self.cache.evict(max_size=size/2)
+        self.assertLessEqual(self.cache.size,size/2)
+        self.cache.clear()
+        self.assertEqual(len(self.cache),0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ import os
 import argparse
 import subprocess
 import filecmp
+import numpy as np
 from yamboparser import YamboFile, YamboFolder
 
 folder = os.path.join(os.path.dirname(__file__),'..','..','yambopy','data','refs','parser')
@@ -45,6 +46,10 @@ class TestFileT2(unittest.TestCase):
     def test_qp_parsing(self):
         fl = YamboFile('o-yambo.qp',os.path.join(folder,'t2_parse_qps'))
         assert  fl.type == 'output_gw'
+        nqps = len(fl.columns['Band'])
+        assert sum(len(data['Band']) for data in fl.data.values()) == nqps
+        for k,data in fl.data.items():
+            assert np.all(data['K-point'] == int(k))
 
     def test_l_parsing(self):
         fl = YamboFile('l-yambo_em1d_HF_and_locXC_gw0',os.path.join(folder,'t2_parse_qps'))
@@ -56,6 +61,11 @@ class TestFileT2(unittest.TestCase):
 
         fl = YamboFile('r-yambo_em1d_HF_and_locXC_gw0',os.path.join(folder,'t2_parse_qps'))
         assert fl.type=='report'
+        #all the bands of each quasiparticle block are read
+        for data in fl.data.values():
+            assert len(data['bindex']) > 1
+            np.testing.assert_allclose(data['qp_energy']-data['dft_energy'],data['qp_correction'],atol=0.02)
+        assert len(fl.columns['kindex']) == sum(len(data['bindex']) for data in fl.data.values())
 
     def test_ndb_qp_parsing(self):
         fl = YamboFile('ndb.QP',os.path.join(folder,'t3_parse_netcdf'))
@@ -6,6 +6,8 @@
 import os
 import re
 import numpy as np
+from itertools import islice
+from .cache import get_cache
 
 #we try to use netcdf
 try:
@@ -31,34 +33,72 @@ class YamboFile(object):
     List of supported text files:
         -> r-*_em?1_*_gw0
         -> o-*.qp
+
+    The parsed data can be stored in a YamboCache (``cache``) so files that did not
+    change are not parsed again. Use True for the default cache and None or False to bypass it.
     """
     _output_prefixes = ['o-']
     _report_prefixes = ['r-','r.']
     _log_prefixes    = ['l-','l.']
     _netcdf_prefixes = ['ns','ndb']
     _netcdf_sufixes  = {'QP':'gw','HF_and_locXC':'hf'}
+    _cached = ['data','columns','kpoints','timing','errors','warnings','memstats']
 
-    def __init__(self,filename,folder='.'):
+    def __init__(self,filename,folder='.',cache=None):
         self.filename = filename
         self.folder = folder
         self.errors = [] #list of errors
         self.warnings = [] #list of warnings
         self.memstats = [] #list of memory allocation statistics
         self.data = {} #dictionary containing all the important data from the file
+        self.columns = {} #dictionary with one array per column of the text files
         self.kpoints = {}
         self.timing = []
+        self._lines = None
 
         #get the type of file
         self.type = YamboFile.get_filetype(filename,folder)
 
-        #if needed read the lines
-        if self.type in ['output_gw','log','report']:
-            #read lines from file
-            with open(os.path.join(folder,filename),'r') as f:
-                self.lines = f.readlines()
-            
-        #parse the file
-        self.parse()
+        #parse the file or get it from the cache
+        cache = get_cache(cache)
+        if cache is None or self.type == 'unknown':
+            self.parse()
+        elif not self.load_cache(cache):
+            self.parse()
+            cache.store(os.path.join(folder,filename),self.as_dict())
+
+    def as_dict(self):
+        """
+        The parsed data of the file as a dictionary
+        """
+        return dict((name,getattr(self,name)) for name in self._cached)
+
+    def load_cache(self,cache):
+        """
+        Get the parsed data from the cache, returns False if the file is not in the cache
+        """
+        cached = cache.load(os.path.join(self.folder,self.filename))
+        if cached is None: return False
+        for name in self._cached:
+            setattr(self,name,cached[name])
+        return True
+
+    def iterlines(self):
+        """
+        Iterate over the lines of the file without keeping them in memory
+        """
+        with open(os.path.join(self.folder,self.filename),'r') as f:
+            for line in f:
+                yield line
+
+    @property
+    def lines(self):
+        """
+        The lines of the text file, only read when requested
+        """
+        if self._lines is None:
+            self._lines = list(self.iterlines())
+        return self._lines
     
     @staticmethod
     def get_filetype(filename,folder):
@@ -68,12 +108,12 @@ class YamboFile(object):
         type = 'unknown'
         basename = os.path.basename(filename)
         if any(basename.startswith(prefix) for prefix in YamboFile._output_prefixes):
-            #read lines from file
+            #read only the header of the file
             with open(os.path.join(folder,basename),'r') as f:
-                lines = f.readlines()
+                lines = list(islice(f,15))
 
             #get the line with the title
-            title = lines[14]
+            title = lines[14] if len(lines) > 14 else ''
 
             if 'GW' in title:
                  type = 'output_gw'
@@ -101,28 +141,42 @@ class YamboFile(object):
         elif self.type == 'report'  : self.parse_report()
 
     def parse_output(self):
-        """ Parse an output file from yambo,
+        """ Parse an output file from yambo in a single pass over its lines
+            produces output of this nature:
+            { k-index1  : { 'Band':array([...]), 'Eo':array([...]), ... },
+              k-index2  :{...}
+            }
+            the full columns of the table are stored in self.columns
         """
-        #get the tags of the columns
-        if self.type == "output_absorption":
-            tags = [tag.strip() for tag in re.findall('([ `0-9a-zA-Z\-\/]+)\[[0-9]\]',''.join(self.lines))]
-        if self.type == "output_gw":
-            tags = [line.replace('(meV)','').replace('Sc(Eo)','Sc|Eo') for line in self.lines if all(tag in line for tag in ['K-point','Band','Eo'])][0]
-            tags = tags[2:].strip().split()
-        table = np.loadtxt(self.lines)
-        _kdata ={}
-        k_index =[ str(int(i)) for i in table[:,0]] # first column  has kpoints
-        for ind in range(len(k_index)):
-            for itag in range(len(tags)):
-                 if k_index[ind] not in list(_kdata.keys()):
-                     _kdata[k_index[ind]] = {}
-                 try:
-                     _kdata[k_index[ind]][tags[itag]].append(table[ind,itag])
-                 except KeyError:
-                     _kdata[k_index[ind]][tags[itag]]  = [ table[ind,itag] ]
-
-        self.data = _kdata
-        #self.data = dict(zip(tags,table.T))
+        tags = None
+        rows = []
+        for line in self.iterlines():
+            if line.startswith('#'):
+                #get the tags of the columns
+                if tags is None and all(tag in line for tag in ['K-point','Band','Eo']):
+                    tags = line.replace('(meV)','').replace('Sc(Eo)','Sc|Eo')[2:].strip().split()
+                continue
+            if line.strip(): rows.append(line)
+        if tags is None or not rows: return
+
+        #convert all the numbers at once and split the table in columns
+        ncolumns = len(rows[0].split())
+        table = np.fromstring(''.join(rows),sep=' ').reshape(-1,ncolumns)
+        self.columns = dict(zip(tags,table.T))
+        self.data = YamboFile._split_kpoints(table[:,0].astype(int),self.columns)
+
+    @staticmethod
+    def _split_kpoints(kindexes,columns):
+        """ Group the columns by k-point index keeping the order in which the k-points appear
+        """
+        order = np.argsort(kindexes,kind='stable')
+        unique, first, counts = np.unique(kindexes[order],return_index=True,return_counts=True)
+        sorted_columns = dict((tag,column[order]) for tag,column in columns.items())
+        _kdata = {}
+        for n in np.argsort(order[first],kind='stable'):
+            rows = slice(first[n],first[n]+counts[n])
+            _kdata[str(unique[n])] = dict((tag,column[rows]) for tag,column in sorted_columns.items())
+        return _kdata
 
     @if_has_netcdf
     def parse_netcdf_gw(self):
@@ -197,62 +251,83 @@ class YamboFile(object):
         self.data=data
         f.close()
 
+    _report_tags = ['bindex','dft_energy','qp_energy','qp_correction',
+                    'z_factor','non_local_xc','local_xc','selfenergy_c']
+
     def parse_report(self):
-        """ Parse the report files.
+        """ Parse the report files in a single pass over its lines.
             produces output of this nature:
-            { k-index1  : { 'dft_enrgy':[...], 'qp_energy':[...] },
+            { k-index1  : { 'dft_enrgy':array([...]), 'qp_energy':array([...]) },
               k-index2  :{...}
             }
             k-index is the kpoint at which the yambo calculation was
             done.
+            the quasiparticles of all the k-points are stored in self.columns
         """
         # start with check for  failure due to error:
         err = re.compile('^\s+?\[ERROR\]\s+?(.*)$')
         kpoints = re.compile('^  [A-X*]+\sK\s\[([0-9]+)\]\s[:](?:\s+)?([0-9.E-]+\s+[0-9.E-]+\s+[0-9.E-]+)\s[A-Za-z()\s*.]+[0-9]+[A-Za-z()\s*.]+([0-9.]+)')
         memory = re.compile('^\s+?<([0-9a-z-]+)> ([A-Z0-9]+)[:] \[M  ([0-9.]+) Gb\]? ([a-zA-Z0-9\s.()\[\]]+)?')
         timing = re.compile('\s+?[A-Za-z]+iming\s+?[A-Za-z/\[\]]+[:]\s+?([a-z0-9-]+)[/]([a-z0-9-]+)[/]([a-z0-9-]+)')
-        self.memstats.extend([ line for line in self.lines if memory.match(line)])
-        for line in self.lines:
-            if err.match(line):
+        kp_regex = re.compile('^\s+?QP\s\[eV\]\s@\sK\s\[(\d+)\]')
+        #labels of the records B=x Eo= y E= .. Im(Z)= .. So= z, removed in this order
+        qp_labels = ['Re(Z)=','Im(Z)=','nlXC=','lXC=','So=','E-Eo=','Eo=','E=','B=']
+
+        failed = False
+        kp_index = None     #k-point of the quasiparticle block being read
+        qp_kindexes = []    #k-point of each line of quasiparticles
+        qp_counts = []      #number of quasiparticles in each line
+        qp_lines = []       #lines with the records of the quasiparticles
+        for line in self.iterlines():
+            #the cheap substring tests avoid running the regular expressions on every line
+            if '<' in line and ' Gb' in line and memory.match(line):
+                self.memstats.append(line)
+            if failed: continue
+
+            #data lines B=x Eo = y .. of the block, an empty line ends it
+            if kp_index is not None:
+                nrecords = line.count('B=')
+                if nrecords:
+                    qp_kindexes.append(kp_index)
+                    qp_counts.append(nrecords)
+                    qp_lines.append(line)
+                    continue
+                if not line.strip():
+                    kp_index = None
+                    continue
+
+            if '[ERROR]' in line and err.match(line):
                 if 'STOP' in err.match(line).groups()[0]:
                     # stop parsing, this is a failed calc.
                     self.errors.append(err.match(line).groups()[0])
-                    return
-            if timing.match(line):
+                    failed = True
+                    continue
+            if 'iming' in line and timing.match(line):
                 self.timing.append(timing.match(line).groups()[0] )
-            if kpoints.match(line):
-                kindx, kpt, wgt = kpoints.match(line).groups()
-                self.kpoints[str(int(kindx))] =  [ float(i.strip()) for i in kpt.split()]
-
-        full_lines = '\n'.join(self.lines)
-        qp_regx = re.compile('(^\s+?QP\s\[eV\]\s@\sK\s\[\d+\][a-z0-9E:()\s.-]+)(.*?)(?=^$)',re.M|re.DOTALL)
-        kp_regex = re.compile('^\s+?QP\s\[eV\]\s@\sK\s\[(\d+)\][a-z0-9E:()\s.-]+$')
-        spliter = re.compile('^(B[=]\d+\sEo[=]\s+?[E0-9.-]+\sE[=]\s+?[E0-9.-]+\sE[-]Eo[=]\s+?[E0-9.-]+\sRe[(]Z[)][=]\s+?[E0-9.-]+\sIm[(]Z[)][=]\s?[E0-9.-]+\snlXC[=]\s+?[E0-9.-]+\slXC[=]\s+?[E0-9.-]+\sSo[=]\s+?[E0-9.-]+)')
-        extract = re.compile('B[=](\d+)\sEo[=](?:\s+)?([E0-9.-]+)\sE[=](?:\s+)?([E0-9.-]+)\sE[-]Eo[=](?:\s+)?([E0-9.-]+)\sRe[(]Z[)][=](?:\s+)?([E0-9.-]+)\sIm[(]Z[)][=](?:\s+)?[E0-9.-]+\snlXC[=](?:\s+)?([E0-9.-]+)\slXC[=](?:\s+)?([E0-9.-]+)\sSo[=](?:\s+)?([E0-9.-]+)')
-        qp_lines = qp_regx.findall(full_lines)
-        qp_results ={}
-        for each in qp_lines: # first group of qp data, shares k-point index
-            kp_index = None
-            kp_results={'bindex':[],'dft_energy':[],'qp_energy':[],'qp_correction':[],
-                        'z_factor':[],'non_local_xc':[],'local_xc':[],'selfenergy_c':[]}
-            for line in each: # different band indexes =B
-                if kp_regex.match(line):
-                    kp_index = str(int(kp_regex.match(line).groups()[0]))
-                else: #  data line B=x Eo = y ..
-                    data_lines = [ i for i in spliter.split(line) if i.strip()]
-                    for qp_data in data_lines:
-                        bindex, dft_energy, qp_energy, qp_correction, z_factor, \
-                        non_local_xc, local_xc, selfenergy_c = [float (i) for i in extract.match(qp_data).groups()]
-                        kp_results['bindex'].append(bindex)
-                        kp_results['dft_energy'].append(dft_energy)
-                        kp_results['qp_energy'].append(qp_energy)
-                        kp_results['qp_correction'].append(qp_correction)
-                        kp_results['z_factor'].append(z_factor)
-                        kp_results['non_local_xc'].append(non_local_xc)
-                        kp_results['local_xc'].append(local_xc)
-                        kp_results['selfenergy_c'].append(selfenergy_c)
-            qp_results[kp_index] = kp_results
-        self.data = qp_results
+            if ' K [' in line:
+                if kpoints.match(line):
+                    kindx, kpt, wgt = kpoints.match(line).groups()
+                    self.kpoints[str(int(kindx))] =  [ float(i.strip()) for i in kpt.split()]
+                elif kp_regex.match(line):
+                    kp_index = int(kp_regex.match(line).groups()[0])
+
+        if failed or not qp_lines: return
+
+        #convert the quasiparticles at once and split them by k-point
+        text = ''.join(qp_lines)
+        for label in qp_labels: text = text.replace(label,' ')
+        #values that overflow the fortran format are written as ****
+        if '*' in text: text = re.sub('[*]+',' nan ',text)
+        nqps = sum(qp_counts)
+        values = np.fromstring(text,sep=' ')
+        if values.size != nqps*len(qp_labels):
+            raise ValueError('Could not read the quasiparticles from %s'%os.path.join(self.folder,self.filename))
+        values = np.delete(values.reshape(nqps,len(qp_labels)),5,axis=1) #imaginary part of Z
+        self.columns = dict(zip(self._report_tags,values.T))
+        self.columns['bindex'] = self.columns['bindex'].astype(int)
+        self.columns['kindex'] = np.repeat(qp_kindexes,qp_counts)
+        columns = dict((tag,self.columns[tag]) for tag in self._report_tags)
+        self.data = YamboFile._split_kpoints(self.columns['kindex'],columns)
 
     def get_type(self):
         """ Get the type of file
@@ -7,23 +7,28 @@ from __future__ import print_function
 import os
 import numpy as np
 from .yambofile import *
+from .cache import get_cache
 
 class YamboFolder():
     """
     Takes as input a folder name that is the folder where yambo saved r-* o-* l-* and netcdf files
+
+    The files that did not change since the last time they were parsed can be read from ``cache``:
+    pass an instance of YamboCache or True to use the default one. By default no cache is used.
     """
 
-    def __init__(self,path):
+    def __init__(self,path,cache=None):
         """
         List all the files in the folder and to each of them call YamboFile class
         """
         self.path = path
+        self.cache = get_cache(cache)
         self.yambofiles = [] #list of YamboFile instances
 
         for dirname, dirnames, filenames in os.walk(path):
             # iterate over all the files in the folder
             for filename in filenames:
-                y = YamboFile(filename, folder=dirname)
+                y = YamboFile(filename, folder=dirname, cache=self.cache)
                 if y.type !='unknown': #checks if the file is of a known type
                     self.yambofiles.append(y)
 
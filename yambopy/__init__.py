@@ -27,7 +27,7 @@ Modules:
         - YamboBSEAbsorptionSpectra: generate a .json file with the bse absorption calculation (including information about the excitons)
 
     analyse:
-        - YamboAnalyser: read .json files generated with yamboout and plot them together
+        - YamboAnalyser: read .json or .npz files generated with yamboout and plot them together
 """
 import numpy as np
 
@@ -62,6 +62,7 @@ from yambopy.dbs.elphondb import *
 from yambopy.io.inputfile import *
 from yambopy.io.outputfile import *
 from yambopy.io.jsonfile import *
+from yambopy.io.packfile import *
 from yambopy.io.iofile import *
 
 #bse/excitons files
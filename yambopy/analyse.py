@@ -5,73 +5,110 @@
 #
 from __future__ import print_function, division
 import os
-import json
 import re
 from itertools import product
+from collections import defaultdict
 import numpy as np
 from yambopy.plot.bandstructure import YambopyBandStructure
 from yambopy.tools.duck import isstring
 from yambopy.lattice import red_car, rec_lat, expand_kpts, isbetween
 from yambopy.io.inputfile import YamboIn
+from yambopy.io.packfile import YamboPack
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.plot.plotting import add_fig_kwargs
 from yambopy.tools.string import marquee
 
 class YamboAnalyser():
     """
-    Class to open multiple ``.json`` files, organize them and plot the data together.
+    Class to open multiple ``.json`` or ``.npz`` packs, organize them and plot the data together.
     Used to perform convergence tests
+
+    Only the structure of the ``.npz`` packs is read when the class is initialized,
+    the data of the output files is read when it is requested and kept for the next requests.
+    If a run is packed in both formats the ``.npz`` pack is used.
+
+    When opening the packs an index is built with the types of output files and the
+    input files of each run so the queries do not need to go through all the files:
+
+        ``index``: run name -> {'types': type -> output filenames,
+                                'inputs': output filename -> input file,
+                                'variables': variables of the input files,
+                                'arguments': arguments of the input files}
+        ``types``: type -> run name -> output filename
     """
     _colormap = 'rainbow'
 
     def __init__(self, folder='.'):
         self.folder = folder
 
-        #get all the json files in the folder
-        all_filenames  = os.listdir(folder)
+        #get all the packs in the folder
+        all_filenames  = sorted(os.listdir(folder))
+        pack_filenames = [f for f in all_filenames if YamboPack.is_pack(f)]
 
-        #filter for json files
-        json_filenames = [f for f in all_filenames if '.json' in f]
+        #open all the packs, the npz packs replace the json ones
+        self.packs = dict()
+        for pack_filename in pack_filenames:
+            pack = YamboPack(os.path.join(folder, pack_filename))
+            if pack.name in self.packs and pack.format == '.json': continue
+            self.packs[pack.name] = pack
 
-        #read all the json files
-        self.jsonfiles = dict()
-        for json_filename in json_filenames:
-            path = "%s/%s"%(folder, json_filename)
-            
-            with  open(path,'r') as f:
-                self.jsonfiles[json_filename] = json.load(f)
+        self.build_index()
+
+    def build_index(self):
+        """
+        Index the output files and input files of all the packs (does not read the data)
+        """
+        self.index = dict()
+        self.types = defaultdict(dict)
+        self.output_filenames = []
+        for name,pack in self.packs.items():
+            run = {'types':defaultdict(list),'inputs':{},'variables':{},'arguments':[]}
+            for output_filename in pack.filenames:
+                type = pack.get_type(output_filename)
+                run['types'][type].append(output_filename)
+                self.types[type][name] = output_filename
+                self.output_filenames.append(output_filename)
+
+                inputfile = pack.get_input(output_filename)
+                if not inputfile: continue
+                run['inputs'][output_filename] = inputfile
+                run['variables'].update(inputfile['variables'])
+                run['arguments'] += [arg for arg in inputfile['arguments'] if arg not in run['arguments']]
+            self.index[name] = run
+
+    @property
+    def jsonfiles(self):
+        """
+        All the data of the packs as dictionaries (reads all the output files)
+        """
+        return dict(("%s%s"%(name,pack.format),{"files":pack.files,"lattice":pack.lattice})
+                    for name,pack in self.packs.items())
+
+    @staticmethod
+    def _filter_tags(names,tags):
+        """
+        Select the names that contain at least one of the tags
+        """
+        if not tags: return list(names)
+        if isstring(tags):
+            tags = (tags,)
+        return [name for name in names if any(tag in name for tag in tags)]
 
     def get_files_type(self,type,tags=None):
         """
-        In all the json files present find the ones of a certain type
+        In all the packs present find the ones of a certain type
         the possible types are:
             report
             netcdf_gw
             netcdf_hf
+        Only the output files selected are read from the packs
         """
-        json_files = self.jsonfiles
         files = {}
 
-        #iterate over all the json files
-        for json_filename in json_files.keys():
-            json_file = json_files[json_filename]
-
-            #all the output files in each json file
-            for output_filename in json_file["files"]:
-                output_file = json_file["files"][output_filename]
-                if output_file["type"] == type:
-                    filename, extension = os.path.splitext(json_filename)
-                    files[filename] =  output_file
-       
-        #filter files with tags
-        if tags:
-            if isstring(tags):
-                tags = (tags,)
-            
-            filenames = list(files.keys())
-            for filename in filenames:
-                if all(tag not in filename for tag in tags):
-                    files.pop(filename)
+        #runs with an output file of this type and the tags in their name
+        runs = self.types.get(type,{})
+        for name in self._filter_tags(runs.keys(),tags):
+            files[name] = self.packs[name].get_file(runs[name])
 
         return files
 
@@ -85,19 +122,22 @@ class YamboAnalyser():
         """
         import matplotlib.pyplot as plt
         #count the number of files
-        nfiles = 0
-        for k in self.jsonfiles.keys():
-            for filename in list(self.jsonfiles[k]['files'].keys()):
-                nfiles+=all(i in filename for i in tags)
+        nfiles = sum(all(i in filename for i in tags) for filename in self.output_filenames)
 
         cmap = plt.get_cmap(self._colormap) #get color map
         colors = [cmap(i) for i in np.linspace(0, 1, nfiles)]
 
         return colors
 
+    def get_inputfiles(self):
+        """
+        Get the input files of all the runs: run name -> output filename -> input file
+        """
+        return dict((name,run['inputs']) for name,run in self.index.items())
+
     def get_inputfiles_tag(self,tags):
         """
-        Get a specific tag from all the .json files from the folders
+        Get a specific tag from all the packs in the folder
         You need to write down all the tags that you want to find
         The tags are both for variables in the input file and arguments (runlevels)
         """
@@ -105,29 +145,11 @@ class YamboAnalyser():
         if isinstance(tags,str):
             tags = (tags,)
 
-        inputfiles = self.get_inputfiles()
         inputfiles_tags = dict()
-
-        for k in list(inputfiles.keys()):
-            inputfiles_tags[k] = dict()
-
-            # get the current inputfile
-            this_inputfile = inputfiles[k]
-
-            #initialize the dictionary
-            inputfiles_tags[k] = {'variables':{},'arguments':[]}
-
-            for tag in tags:
-                for filename in this_inputfile:
-                    
-                    # look in variables
-                    if tag in list(this_inputfile[filename]['variables'].keys()):
-                        variables = this_inputfile[filename]['variables'][tag]
-                        inputfiles_tags[k]['variables'][tag] = variables
-
-                    #look in arguments
-                    if tag in this_inputfile[filename]['arguments']:
-                        inputfiles_tags[k]['arguments'].append(tag)
+        for name,run in self.index.items():
+            variables = run['variables']
+            inputfiles_tags[name] = {'variables': dict((tag,variables[tag]) for tag in tags if tag in variables),
+                                     'arguments': [tag for tag in tags if tag in run['arguments']]}
 
         return inputfiles_tags
 
@@ -155,9 +177,9 @@ class YamboAnalyser():
 
         # add bandstructures of all the files
         for filename, content in gw_files.items():
-            e0,e0imag = content['Eo']
-            e,linewidths = content['E']
-            ec,linewidths = content['E-Eo']
+            e0,e0imag = self._real_imag(content['Eo'])
+            e,linewidths = self._real_imag(content['E'])
+            ec,linewidths = self._real_imag(content['E-Eo'])
             kpoints = content['Kpoint']
 
             #TODO move this section to YamboFileGW class
@@ -183,9 +205,9 @@ class YamboAnalyser():
             #end section
 
             if path_kpoints:
-                #get data from json file
-                jsonfile = list(self.jsonfiles.values())[0]
-                lat = YamboLatticeDB.from_dict(jsonfile['lattice'])
+                #get data from the pack
+                pack = list(self.packs.values())[0]
+                lat = YamboLatticeDB.from_dict(pack.lattice)
                 kpoints, bands_indexes, path_car = lat.get_path(path_kpoints)  
                 bands_e0 = bands_e0[bands_indexes]
                 bands_e  = bands_e[bands_indexes] 
@@ -198,6 +220,16 @@ class YamboAnalyser():
 
         return ks_bandstructure, qp_bandstructure
 
+    @staticmethod
+    def _real_imag(value):
+        """
+        Real and imaginary parts of the complex arrays stored natively (npz)
+        or as [real, imag] (json)
+        """
+        value = np.asarray(value)
+        if np.iscomplexobj(value): return value.real, value.imag
+        return value[0], value[1]
+
     @add_fig_kwargs
     def plot_ks(self,path=None,tags=None):
         """
@@ -254,12 +286,12 @@ class YamboAnalyser():
         colors = self.get_colors(tags)
 
         n=0
-        for k in sorted(self.jsonfiles.keys()):
-            for filename in list(self.jsonfiles[k]["files"].keys()):
+        for k in sorted(self.packs.keys()):
+            for filename in self.packs[k].filenames:
                 if all(i in filename for i in tags):
                     # I prefer to work directly with the dictionary...
                     #data = np.array( self.jsonfiles[k]["files"][filename] )
-                    data = self.jsonfiles[k]["files"][filename]
+                    data = self.packs[k].get_file(filename)
                     #select the color to plot with
                     color = colors[n]
                     n+=1
@@ -335,9 +367,9 @@ class YamboAnalyser():
 
         tag_list = []
 
-        for word in self.jsonfiles.keys():
+        for word in self.packs.keys():
             if tag in word:
-               tag_list.append(word.replace('.json','') )
+               tag_list.append(word)
 
         ntags = len(tag_list)
 
@@ -361,8 +393,8 @@ class YamboAnalyser():
     def __str__(self):
         lines = []; app = lines.append
         app(marquee(self.__class__.__name__))
-        for json_file in self.jsonfiles:
-            app("%s"%json_file)
-            for f in self.jsonfiles[json_file]['files']:
+        for name,pack in self.packs.items():
+            app("%s%s"%(name,pack.format))
+            for f in pack.filenames:
                 app("\t%s"%f)
         return "\n".join(lines)
@@ -11,6 +11,33 @@ completion and more.
 TODO: Include a shell_run function for all executables
 
 """
+def shell_qe_job(job_name,inp_name,out_name,exec='pw.x',scheduler=None,pre_run=[],pos_run=[]):
+    """
+    Prepare the scheduler of a QUANTUM ESPRESSO job without submitting it
+    (see shell_qe_run for the arguments)
+    """
+    # Check executable
+    if not exec[-4:]=='pw.x' and not exec[-4:]=='ph.x':
+        raise ValueError('Executable not recognised (pw.x and ph.x are the only options).')
+        
+    # Copy scheduler instance in order to safely edit it
+    if scheduler is None: shell = Scheduler.factory(scheduler="bash")
+    else:                 shell = deepcopy(scheduler)
+    
+    shell.name = '%s_%s'%(job_name,shell.name)
+    
+    # Add additional commands if present
+    if len(pre_run) != 0:
+        shell.pre_run = shell.pre_run + list(pre_run)
+
+    # Additional commands to be executed after the main mpirun command
+    if len(pos_run) != 0:   
+        shell.pos_run = shell.pos_run + list(pos_run)
+ 
+    # Main mpirun command
+    shell.add_mpirun_command('%s -inp %s > %s'%(exec,inp_name,out_name))
+    return shell
+
 def shell_qe_run(job_name,inp_name,out_name,run_dir,exec='pw.x',shell_name='qe',scheduler=None,depend_on_JOBID=None,hang_python=False,pre_run=[],pos_run=[]):
     """ 
     Submit QUANTUM ESPRESSO job
@@ -30,37 +57,16 @@ def shell_qe_run(job_name,inp_name,out_name,run_dir,exec='pw.x',shell_name='qe',
         
         returns id of present submitted job (-1 if scheduler is bash)         
     """
-    # Check executable
-    if not exec[-4:]=='pw.x' and not exec[-4:]=='ph.x':
-        raise ValueError('Executable not recognised (pw.x and ph.x are the only options).')
-        
-    # Copy scheduler instance in order to safely edit it
-    if scheduler is None: shell = Scheduler.factory(scheduler="bash")
-    else:                 shell = deepcopy(scheduler)
+    shell = shell_qe_job(job_name,inp_name,out_name,exec=exec,scheduler=scheduler,pre_run=pre_run,pos_run=pos_run)
     
-    shell.name = '%s_%s'%(job_name,shell.name)
-    
-    # Add dependency if specified
-    if depend_on_JOBID is not None and shell.schedulertype != 'bash':
-        dependency='afterok:%s'%depend_on_JOBID
-        shell.kwargs['dependency']=dependency
+    # Add dependency if specified (scheduler native: afterok for slurm and pbs)
+    if depend_on_JOBID is not None: shell.set_dependency(depend_on_JOBID)
         
-    # Add additional commands if present
-    if len(pre_run) != 0:
-        for command in pre_run: shell.pre_run.append(command)
-
-    # Additional commands to be executed after the main mpirun command
-    if len(pos_run) != 0:   
-        for command in pos_run: shell.pos_run.append(command)
- 
-    # Main mpirun command
-    shell.add_mpirun_command('%s -inp %s > %s'%(exec,inp_name,out_name))
     shell.run(filename='%s/%s.sh'%(run_dir,shell_name)) ### Specify run path
     
     # Manage submissions if specified
     if hang_python: wait_for_job(shell,run_dir)
-    if shell.schedulertype!='bash': this_job_id = shell.jobid
-    else:                           this_job_id = -1
+    this_job_id = getattr(shell,'jobid',-1)
     
     shell.clean()
     
@@ -1,10 +1,12 @@
 import time
+import subprocess
 from schedulerpy import *
 
 """
 This file contains the basic functions needed to check and manage workflows
 
     - wait_for_job: Let the python execution sleep until job completion
+    - wait_for_all_jobs: Same for a list of jobs (using a single schedulerpy.JobMonitor)
     - TODO: submit_job, check_for_job_completion, ... 
 """
 
@@ -14,50 +16,34 @@ def wait_for_job(shell,run_dir,time_step=10.):
     
     - shell: schedulerpy object relative to submitted job
     - run_dir: directory where the job is being run
-    - time_step: checking period (seconds)
+    - time_step: checking period (seconds), it grows for jobs that keep the same status
     
     Scheduler types supported:
     
         - bash
         - slurm
+        - pbs
+        - oar
     """
-    job_status = shell.check_job_status(run_dir)
-    condition = job_status=='R' or job_status=='PD' or job_status=='CG'
-    while condition:
-        time.sleep(time_step)
-        job_status = shell.check_job_status(run_dir) 
-        condition = job_status=='R' or job_status=='PD' or job_status=='CG'
+    monitor = JobMonitor(interval=time_step)
+    monitor.add(shell,run_dir)
+    monitor.wait(mode='all')
         
-def wait_for_all_jobs(shell_list,run_dir_list,time_step=10.):
+def wait_for_all_jobs(shell_list,run_dir_list,time_step=10.,mode='all'):
     """
     As above, but waits for completion of a list of jobs
+
+    The status of all the jobs is obtained with one call to the scheduler every time_step.
+    With mode='any' it returns as soon as one of the jobs finishes.
+    Returns the list of the jobs that finished.
     """
     if len(shell_list) != len(run_dir_list):
         raise UserWarning('ERROR in parallel job management: list of job ids not corresponding to list run directories.')
     
-    # Get initial statuses
-    job_status_list = []
-    conditions = []
-    for i in range(len(shell_list)):
-        job_status =  shell_list[i].check_job_status(run_dir_list[i])
-        job_status_list.append( job_status )
-        condition = job_status=='R' or job_status=='PD' or job_status=='CG'
-        conditions.append(condition)
-    
-    # Dynamically evaluate all conditions
-    while any(conditions):
-        time.sleep(time_step)
-        job_status_list = []
-        conditions = []
-        for i in range(len(shell_list)):
-            job_status =  shell_list[i].check_job_status(run_dir_list[i])
-            job_status_list.append( job_status )
-            condition = job_status=='R' or job_status=='PD' or job_status=='CG'
-            conditions.append(condition)
-        
-        # Remove finished calculation (i.e., False) from checks
-        for i, condition in enumerate(conditions):
-            if not condition: del shell_list[i]
+    monitor = JobMonitor(interval=time_step)
+    for shell,run_dir in zip(shell_list,run_dir_list):
+        monitor.add(shell,run_dir)
+    return monitor.wait(mode=mode)
 
 def wait_for_setup_operations(filename,run_dir,time_step=10.):
     """
@@ -7,7 +7,54 @@ from yambopy import *
 from math import sqrt
 from time import time
 from yambopy.tools.string import marquee
-from yambopy.tools.funcs import abs2, lorentzian, gaussian
+from yambopy.tools.funcs import abs2, lorentzian, gaussian, linear_binning, broadening_convolution
+from yambopy.dbs.fragments import YamboFragmentLoader
+from functools import partial
+
+na = np.newaxis
+
+def _read_dipoles_fragment(database,nk,dip_type,dipoles_format):
+    """
+    Read the dipoles [cartesian directions, nbands conduction, nbands valence] of one kpoint
+    from a fragment of the old format
+    """
+    if dipoles_format == 1:
+        dip = database.variables['DIP_%s_k_%04d_spin_%04d'%(dip_type,nk+1,1)]
+        dip = (dip[:,:,:,0]+1j*dip[:,:,:,1])
+        return np.array([dip[:,:,i].T for i in range(3)])
+    dipoles = []
+    for i in range(3):
+        dip = database.variables['DIP_%s_k_%04d_xyz_%04d_spin_%04d'%(dip_type,nk+1,i+1,1)][:]
+        dipoles.append(dip[0].T+dip[1].T*1j)
+    return np.array(dipoles)
+
+class YamboDipolesBZ():
+    """
+    Lazy view of the dipoles in the full brillouin zone
+
+    Only the dipoles in the irreducible brillouin zone are stored,
+    the dipoles of the requested kpoints are rotated when they are accessed.
+    Behaves as an array with shape (nkpoints,3,nbands,nbands) for indexing.
+    """
+    def __init__(self,dipolesdb):
+        self.dipolesdb = dipolesdb
+
+    @property
+    def shape(self):
+        return (len(self.dipolesdb.lattice.kpoints_indexes),3,self.dipolesdb.max_band,self.dipolesdb.max_band)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self,index):
+        if not isinstance(index,tuple): index = (index,)
+        kpoints = np.arange(len(self))[index[0]]
+        dipoles = self.dipolesdb.rotate_dipoles(np.atleast_1d(kpoints))
+        if np.ndim(kpoints) == 0: return dipoles[0][index[1:]]
+        return dipoles[(slice(None),)+index[1:]]
+
+    def __array__(self,dtype=None,copy=None):
+        return np.asarray(self.dipolesdb.rotate_dipoles(np.arange(len(self))),dtype=dtype)
 
 class YamboDipolesDB():
     """
@@ -16,9 +63,12 @@ class YamboDipolesDB():
     Can be used to for exapmle plot the imaginary part of the dielectric
     function which corresponds to the optical absorption
     """
-    def __init__(self,lattice,save='SAVE',filename='ndb.dip_iR_and_P',dip_type='iR',field_dir=[1,0,0],field_dir3=[0,0,1]):
+    def __init__(self,lattice,save='SAVE',filename='ndb.dip_iR_and_P',dip_type='iR',field_dir=[1,0,0],field_dir3=[0,0,1],expand=True,
+                 parallel='thread',nworkers=None):
         self.lattice = lattice
         self.filename = "%s/%s"%(save,filename)
+        self.parallel = parallel
+        self.nworkers = nworkers
         
         #read dipoles
         try:
@@ -43,7 +93,7 @@ class YamboDipolesDB():
         self.dipoles = self.readDB(dip_type)
 
         #expand the dipoles to the full brillouin zone
-        self.expandDipoles(self.dipoles)
+        self.expandDipoles(self.dipoles,expand=expand)
 
     def normalize(self,electrons):
         """ 
@@ -51,20 +101,22 @@ class YamboDipolesDB():
         """
         eiv = electrons.eigenvalues
         nkpoints, nbands = eiv.shape
-        for nk in range(nkpoints):
-            
-            eivk = eiv[nk]
-            
-            #create eigenvalues differences arrays
-            norm = np.array([ [ec-ev for ev in eivk] for ec in eivk  ])
-            
-            #normalize
-            for i,j in product(list(range(nbands)),repeat=2):
-                if norm[i,j] == 0: 
-                    self.dipoles[nk,:,i,j] = 0
-                else:
-                    self.dipoles[nk,:,i,j] = self.dipoles[nk,:,i,j]/norm[i,j]
-        dipoles = self.dipoles
+
+        #the lazy view normalizes the dipoles when they are rotated
+        if isinstance(self.dipoles,YamboDipolesBZ):
+            self.normalization = eiv
+            return
+
+        #create eigenvalues differences arrays
+        norm = eiv[:,na,:,na]-eiv[:,na,na,:]
+        self.dipoles[:,:,:nbands,:nbands] = self._divide(self.dipoles[:,:,:nbands,:nbands],norm)
+
+    @staticmethod
+    def _divide(dipoles,norm):
+        """ divide the dipoles by the eigenvalues differences (zero if the difference is zero)
+        """
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return np.where(norm == 0, 0, dipoles/np.where(norm == 0, 1, norm))
 
     def readDB(self,dip_type):
         """
@@ -107,30 +159,20 @@ class YamboDipolesDB():
             dipoles_format = 2
         database.close()
         
-        for nk in range(self.nk_ibz):
-
-            #open database for each k-point
-            filename = "%s_fragment_%d"%(self.filename,nk+1)
-            database = Dataset(filename)
-
-            if dipoles_format == 1:
-                dip = database.variables['DIP_%s_k_%04d_spin_%04d'%(dip_type,nk+1,1)]
-                dip = (dip[:,:,:,0]+1j*dip[:,:,:,1])
-                for i in range(3):
-                    dipoles[nk,i] = dip[:,:,i].T
-            elif dipoles_format == 2:
-                for i in range(3):
-                    dip = database.variables['DIP_%s_k_%04d_xyz_%04d_spin_%04d'%(dip_type,nk+1,i+1,1)][:]
-                    dipoles[nk,i] = dip[0].T+dip[1].T*1j
-
-            #close database
-            database.close()
+        #read the fragments of all the kpoints
+        fragments = YamboFragmentLoader.from_pattern("%s_fragment_%%d"%self.filename,self.nk_ibz,
+                                                     parallel=self.parallel,nworkers=self.nworkers)
+        read = partial(_read_dipoles_fragment,dip_type=dip_type,dipoles_format=dipoles_format)
+        fragments.load(read,dipoles)
 
         return dipoles
         
-    def expandDipoles(self,dipoles=None,field_dir=[1,0,0],field_dir3=[0,0,1]):
+    def expandDipoles(self,dipoles=None,field_dir=[1,0,0],field_dir3=[0,0,1],expand=True):
         """
         Expand diples from the IBZ to the FBZ
+
+        If expand is False only the dipoles in the IBZ are kept and self.dipoles
+        is a lazy view that rotates the dipoles of each kpoint when needed
         """
         if dipoles is None:
             dipoles = self.dipoles
@@ -138,8 +180,6 @@ class YamboDipolesDB():
         #check if we need to expand the dipoles to the full BZ
         lattice = self.lattice
         kpts = lattice.car_kpoints
-        nks  = lattice.kpoints_indexes
-        nss  = lattice.symmetry_indexes
         
         #normalize the fields
         field_dir  = np.array(field_dir)
@@ -152,70 +192,95 @@ class YamboDipolesDB():
         field_diry = np.cross(field_dir3,field_dirx)
         field_dirz = field_dir3
 
+        #get projection operation
+        pro = np.array([field_dirx,field_diry,field_dirz])
+        #transformation for each symmetry operation
+        self.transformations = np.einsum('ij,skj->sik',pro,lattice.sym_car)
+
+        #save dipoles in the ibz
+        self.dipoles_ibz = dipoles 
+        #get dipoles in the full Brilouin zone
+        if expand:
+            self.dipoles = self.rotate_dipoles(np.arange(len(lattice.kpoints_indexes)))
+        else:
+            self.dipoles = YamboDipolesBZ(self)
+                        
+        self.field_dirx = field_dirx
+        self.field_diry = field_diry
+        self.field_dirz = field_dirz
+        
+        return dipoles, kpts
+
+    def rotate_dipoles(self,kpoints):
+        """
+        Get the dipoles of a list of kpoints of the full brillouin zone
+        rotating the dipoles of the IBZ with all the kpoints of the same symmetry at once
+        """
+        lattice = self.lattice
+        nks = lattice.kpoints_indexes[kpoints]
+        nss = lattice.symmetry_indexes[kpoints]
+
         #get band indexes
-        nkpoints = len(nks)
         indexv = self.min_band-1
         indexc = self.indexc-1
         nbands = self.min_band+self.nbands-1
-        
+        cbands = slice(indexc,indexc+self.nbandsc)
+        vbands = slice(indexv,indexv+self.nbandsv)
+
         #Note that P is Hermitian and iR anti-hermitian.
         # [FP] Other possible dipole options (i.e., velocity gauge) to be checked. Treat them as not supported.
         if self.dip_type == 'P':
             factor =  1.0
         else:
             factor = -1.0
-           
-        #save dipoles in the ibz
-        self.dipoles_ibz = dipoles 
-        #get dipoles in the full Brilouin zone
-        self.dipoles = np.zeros([nkpoints,3,nbands,nbands],dtype=np.complex64)
-        for nk_fbz,nk_ibz,ns in zip(list(range(nkpoints)),nks,nss):
-            
+
+        time_rev_list = np.array(lattice.time_rev_list)
+        dipoles = np.zeros([len(nks),3,nbands,nbands],dtype=np.complex64)
+        for ns in np.unique(nss):
+            this_sym = (nss == ns)
+            dip = self.dipoles_ibz[nks[this_sym]]
+
             #if time rev we conjugate
-            if lattice.time_rev_list[ns]:
-                dip = np.conjugate(dipoles[nk_ibz,:,:,:])
-            else:
-                dip = dipoles[nk_ibz,:,:,:]
-            
-            #get symmmetry operation
-            sym = lattice.sym_car[ns].T
-            #get projection operation
-            pro = np.array([field_dirx,field_diry,field_dirz])
-            #transformation
-            tra = np.dot(pro,sym)
-            
-            for c,v in product(list(range(self.nbandsc)),list(range(self.nbandsv))):
-                #rotate dipoles
-                self.dipoles[nk_fbz,:,indexc+c,indexv+v] = np.dot(tra,dip[:,c,v])
-        
-            #make hermitian
-            for c,v in product(list(range(self.nbandsc)),list(range(self.nbandsv))):
-                self.dipoles[nk_fbz,:,indexv+v,indexc+c] = factor*np.conjugate(self.dipoles[nk_fbz,:,indexc+c,indexv+v])
-                        
-        self.field_dirx = field_dirx
-        self.field_diry = field_diry
-        self.field_dirz = field_dirz
-        
-        return dipoles, kpts
+            if time_rev_list[ns]: dip = np.conjugate(dip)
+
+            #rotate dipoles
+            dipoles[this_sym,:,cbands,vbands] = np.einsum('ij,kjcv->kicv',self.transformations[ns],dip)
+
+        #make hermitian
+        dipoles[:,:,vbands,cbands] = factor*np.conjugate(np.swapaxes(dipoles[:,:,cbands,vbands],2,3))
+
+        #normalize the dipoles of the lazy view
+        if hasattr(self,'normalization'):
+            eiv = self.normalization[kpoints]
+            nb = eiv.shape[1]
+            norm = eiv[:,na,:,na]-eiv[:,na,na,:]
+            dipoles[:,:,:nb,:nb] = self._divide(dipoles[:,:,:nb,:nb],norm)
+
+        return dipoles
        
     def plot(self,ax,kpoint=0,dir=0,func=abs2):
         return ax.matshow(func(self.dipoles[kpoint,dir]))
         
-    def ip_eps2(self,electrons,pol=1,ntot_dip=-1,GWshift=0.,broad=0.1,broadtype='l',nbnds=[-1,-1],emin=0.,emax=10.,esteps=500):
+    def ip_eps2(self,electrons,pol=1,ntot_dip=-1,GWshift=0.,broad=0.1,broadtype='l',nbnds=[-1,-1],emin=0.,emax=10.,esteps=500,
+                mode='exact',max_memory=256):
         """
         Compute independent-particle absorption (by Fulvio Paleari)
 
         electrons -> electrons YamboElectronsDB
+        pol -> polarization direction, if None the three directions are returned
         GWshift -> rigid GW shift in eV
         broad -> broadening of peaks
         broadtype -> 'l' is lorentzian, 'g' is gaussian
         nbnds -> number of [valence, conduction] bands included starting from Fermi level. Default means all are included
         emin,emax,esteps -> frequency range for the plot
+        mode -> 'exact' sums the broadening function of each transition
+                'histogram' bins the transitions in the frequency grid and convolves them with the
+                broadening function using FFT (accurate when the frequency step is small compared to broad)
+        max_memory -> maximum memory in MB used for each block of kpoints
         """
 
         #get eigenvalues and weights of electrons
         eiv = electrons.eigenvalues
-        print(eiv.shape)
         weights = electrons.weights
         nv = electrons.nbandsv
         nc = electrons.nbandsc   
@@ -225,7 +290,7 @@ class YamboDipolesDB():
 
         #get frequencies and im
         freq = np.linspace(emin,emax,esteps)
-        eps2 = np.zeros([len(freq)])
+        nfreq = len(freq)
 
         #Cut bands to the maximum number used for the dipoles
         if ntot_dip>0: 
@@ -236,10 +301,13 @@ class YamboDipolesDB():
         electrons.energy_gaps(GWshift)
 
         #Check bands to include in the calculation
+        nbnds = list(nbnds)
         if nbnds[0]<0: nbnds[0]=nv
         if nbnds[1]<0: nbnds[1]=nc
         iv = nv-nbnds[0] #first valence
         lc = nv+nbnds[1] #last conduction
+        cbands = slice(nv,lc)
+        vbands = slice(iv,nv)
 
         #choose broadening
         if "l" in broadtype:
@@ -247,29 +315,52 @@ class YamboDipolesDB():
         else:
             broadening = gaussian
 
-        na = np.newaxis
-        #calculate epsilon
-        for c,v in product(list(range(nv,lc)),list(range(iv,nv))):
-            #get electron-hole energy and dipoles
-            ecv  = eiv[:,c]-eiv[:,v]
-            dip2 = abs2(dipoles[:,pol,c-nv,v])
-
-            #make dimensions match
-            dip2a = dip2[na,:]
-            ecva  = ecv[na,:]
-            freqa = freq[:,na]
-            wa    = weights[na,:]       
- 
-            #calculate the lorentzians 
-            broadw = broadening(freqa,ecva,broad)
-   
-            #scale broadening with dipoles and weights
-            epsk =  wa*dip2a*broadw
+        if mode not in ['exact','histogram']:
+            raise ValueError('Unknown mode %s, use exact or histogram'%mode)
+        if nfreq < 2: mode = 'exact'
+
+        #number of kpoints in each block
+        nkpoints = len(eiv)
+        ntransitions_k = max((lc-nv)*(nv-iv),1)
+        nvalues = nfreq if mode == 'exact' else 8
+        kblock = max(1,int(max_memory*1024**2/(8*ntransitions_k*nvalues)))
+
+        if mode == 'histogram':
+            #extend the frequency grid to contain all the transitions
+            step = freq[1]-freq[0]
+            elow  = np.min(eiv[:,cbands])-np.max(eiv[:,vbands])
+            ehigh = np.max(eiv[:,cbands])-np.min(eiv[:,vbands])
+            nlow  = max(0,int(np.ceil((emin-elow)/step)))
+            nhigh = max(nfreq-1,int(np.ceil((ehigh-emin)/step)))
+            nbins = nlow+nhigh+2
+            hist = np.zeros([3,nbins])
+
+        eps2 = np.zeros([3,nfreq])
+
+        #calculate epsilon streaming over blocks of kpoints
+        for start in range(0,nkpoints,kblock):
+            ks = slice(start,start+kblock)
+
+            #get electron-hole energies and dipoles of all the transitions
+            ecv  = (eiv[ks,cbands,na]-eiv[ks,na,vbands]).ravel()
+            dip2 = abs2(dipoles[ks][:,:,cbands,vbands])
+
+            #scale dipoles with weights
+            wdip2 = weights[ks,na,na,na]*dip2
+            wdip2 = np.swapaxes(wdip2,0,1).reshape(3,-1)
+
+            if mode == 'exact':
+                #calculate the broadening of all the transitions and integrate over kpoints
+                broadw = broadening(freq[na,:],ecv[:,na],broad)
+                eps2 += np.dot(wdip2,broadw)
+            else:
+                hist += linear_binning(ecv,wdip2,emin-nlow*step,step,nbins)
 
-            #integrate over kpoints
-            eps2 += np.sum(epsk,axis=1)
+        if mode == 'histogram':
+            eps2 = broadening_convolution(hist,step,broad,broadening)[:,nlow:nlow+nfreq]
 
-        return freq, eps2
+        if pol is None: return freq, eps2
+        return freq, eps2[pol]
 
     def __str__(self):
         lines = []; app = lines.append
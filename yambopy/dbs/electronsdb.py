@@ -7,7 +7,9 @@ from netCDF4 import Dataset
 import numpy as np
 from itertools import product
 import collections
+from yambopy.tools.funcs import linear_binning, broadening_convolution, occupations, find_fermi
 ha2ev  = 27.211396132
+na = np.newaxis
 max_exp = 50
 min_exp =-100.
 
@@ -17,58 +19,78 @@ def abs2(x):
 def fermi(e):
     """ fermi dirac function
     """
-    if e > max_exp:
-        return 0
-    elif e < -max_exp:
-        return 1
-    return 1/(np.exp(e)+1)
+    return occupations(e,0,1,max_exp=max_exp)
 
 def fermi_array(e_array,ef,invsmear):
     """
     Fermi dirac function for an array
     """
-    e_array = (e_array-ef)/invsmear
-    return [ fermi(e) for e in e_array]
+    return occupations(e_array,ef,invsmear,max_exp=max_exp)
 
-def histogram_eiv(eiv,weights,emin=-5.0,emax=5.0,step=0.01,sigma=0.05,ctype='lorentzian'):
+def histogram_eiv(eiv,weights,emin=-5.0,emax=5.0,step=0.01,sigma=0.05,ctype='lorentzian',mode='exact',binning='linear',
+                  oversample=4,max_memory=64):
     """
     Histogram of eigenvalues
+
+    Arguments:
+        mode: 'exact' adds the broadening function of each eigenvalue to the energy grid
+              'fft' bins the eigenvalues in the energy grid and convolves the histogram with the
+              broadening function using FFT (falls back to 'exact' if sigma is smaller than step)
+        binning: 'linear' distributes each eigenvalue between the two closest points of the grid
+                 'nearest' adds each eigenvalue to the closest point of the grid (only for mode='fft')
+        oversample: the histogram is built in a grid oversample times finer than step (only for mode='fft')
+        max_memory: maximum memory in MB used for each block of eigenvalues in the 'exact' mode
     """
     eiv = np.array(eiv)
     #sigma = 0.005
     x = np.arange(emin,emax,step,dtype=np.float32)
-    y = np.zeros([len(x)],dtype=np.float32)
 
     if ctype == 'gaussian':
         from math import sqrt
         c =  1.0/(sigma*sqrt(2))
         a = -1.0/(2*sigma)
+        broadening = lambda x,x0,sigma: c*np.exp(a*(x-x0)**2)
 
     else:
         #lorentzian stuff
         s2 = (.5*sigma)**2
         c = (.5*sigma)
+        broadening = lambda x,x0,sigma: c/((x-x0)**2+s2)
 
     eiv     = eiv.flatten()
-    weights = weights.flatten()
+    weights = np.array(weights).flatten()
 
     weights = weights[emin < eiv]
     eiv     = eiv[emin < eiv]
     weights = weights[eiv < emax]
     eiv     = eiv[eiv < emax]
 
-    if ctype == 'gaussian':
-        for e,w in zip(eiv,weights):
-            x1 = (x-e)**2
-            #add gaussian
-            y += w*c*np.exp(a*x1)
+    if mode not in ['exact','fft']:
+        raise ValueError('Unknown mode %s, use exact or fft'%mode)
+    if sigma < step or len(x) < 2: mode = 'exact'
+
+    if mode == 'exact':
+        y = np.zeros([len(x)])
+        nblock = max(1,int(max_memory*1024**2/(8*len(x))))
+        for start in range(0,len(eiv),nblock):
+            e = eiv[start:start+nblock]
+            w = weights[start:start+nblock]
+            y += np.dot(w,broadening(x[na,:],e[:,na],sigma))
     else:
-        #lorentzian stuff
-        for e,w in zip(eiv,weights):
-            x1 = (x-e)**2
-            #add lorentzian
-            y += w*c/(x1+s2)
-    return x, y
+        fine_step = step/oversample
+        #the fine grid extends one step beyond the last point to contain all the eigenvalues below emax
+        nbins = len(x)*oversample+1
+        if binning == 'linear':
+            hist = linear_binning(eiv,weights,emin,fine_step,nbins)
+        elif binning == 'nearest':
+            idx = np.rint((eiv-emin)/fine_step).astype(int)
+            inside = idx < nbins
+            hist = np.bincount(idx[inside],weights=weights[inside],minlength=nbins)
+        else:
+            raise ValueError('Unknown binning %s, use linear or nearest'%binning)
+        y = broadening_convolution(hist,fine_step,sigma,broadening)[:len(x)*oversample:oversample]
+
+    return x, y.astype(np.float32)
 
 class YamboElectronsDB():
     """
@@ -134,10 +156,12 @@ class YamboElectronsDB():
         #kpoints weights
         self.weights = np.full((self.nkpoints), 1.0/self.nkpoints,dtype=np.float32)
 
-    def getDOS(self,broad=0.1,emin=-10,emax=10,step=0.01,ctype="lorentzian"):
+    def getDOS(self,broad=0.1,emin=-10,emax=10,step=0.01,ctype="lorentzian",mode='exact'):
         """
         Calculate the density of states.
         Should work for metals as well but untested for that case
+
+        mode: 'exact' or 'fft' (see histogram_eiv)
         """
         eigenvalues = self.eigenvalues_ibz
         weights = self.weights_ibz
@@ -145,7 +169,7 @@ class YamboElectronsDB():
 
         na = np.newaxis
         weights_bands = np.ones(eigenvalues.shape,dtype=np.float32)*weights[:,na]
-        energies, self.dos = histogram_eiv(eigenvalues,weights_bands,emin=emin,emax=emax,step=step,sigma=broad,ctype=ctype)
+        energies, self.dos = histogram_eiv(eigenvalues,weights_bands,emin=emin,emax=emax,step=step,sigma=broad,ctype=ctype,mode=mode)
 
         return energies, self.dos
 
@@ -158,24 +182,25 @@ class YamboElectronsDB():
         nconduction  = self.nbandsc
         nkpoints = self.nkpoints_ibz
 
-        transitions = np.zeros([nkpoints,nvalence*nconduction])
-        for k,v,c in product(range(nkpoints),range(nvalence),range(nconduction)):
-            vc = v*nvalence+c
-            transitions[k,vc] = eigenvalues[k,c+nvalence]-eigenvalues[k,v]
+        #transitions[k,v*nconduction+c]
+        transitions = eigenvalues[:,na,nvalence:nvalence+nconduction]-eigenvalues[:,:nvalence,na]
+        transitions = transitions.reshape(nkpoints,nvalence*nconduction)
         self.transitions = transitions
 
         return self.transitions
 
-    def getJDOS(self,broad=0.1,emin=0,emax=10,step=0.01,ctype="lorentzian"):
+    def getJDOS(self,broad=0.1,emin=0,emax=10,step=0.01,ctype="lorentzian",mode='exact'):
         """
         Calculate the joint density of states
+
+        mode: 'exact' or 'fft' (see histogram_eiv)
         """
         transitions = self.get_transitions()
         weights = self.weights_ibz
 
         na = np.newaxis
         weights_transitions = np.ones(transitions.shape,dtype=np.float32)*weights[:,na]
-        energies, self.jdos = histogram_eiv(self.transitions,weights_transitions,emin=emin,emax=emax,step=step,sigma=broad,ctype=ctype)
+        energies, self.jdos = histogram_eiv(self.transitions,weights_transitions,emin=emin,emax=emax,step=step,sigma=broad,ctype=ctype,mode=mode)
 
         return energies, self.jdos
 
@@ -186,7 +211,7 @@ class YamboElectronsDB():
         self.lifetimes_ibz = np.ones(self.eigenvalues_ibz.shape,dtype=np.float32)*broad
         self.lifetimes     = np.ones(self.eigenvalues.shape,dtype=np.float32)*broad
 
-    def setLifetimesDOS(self,broad=0.1,debug=False):
+    def setLifetimesDOS(self,broad=0.1,debug=False,mode='exact'):
         """
         Approximate the electronic lifetimes using the DOS
         """
@@ -197,7 +222,7 @@ class YamboElectronsDB():
         #get dos
         emin = np.min(eigenvalues)-broad
         emax = np.max(eigenvalues)+broad
-        energies, dos = self.getDOS(emin=emin, emax=emax, step=0.1, broad=broad)
+        energies, dos = self.getDOS(emin=emin, emax=emax, step=0.1, broad=broad, mode=mode)
 
         #normalize dos to broad
         dos = dos/np.max(dos)*broad
@@ -221,24 +246,26 @@ class YamboElectronsDB():
         self.lifetimes_ibz = np.array([ [f(eig) for eig in eigk] for eigk in self.eigenvalues_ibz],dtype=np.float32)
         self.lifetimes     = np.array([ [f(eig) for eig in eigk] for eigk in self.eigenvalues],dtype=np.float32)
 
-    def setFermi(self,fermi,invsmear):
+    def setFermi(self,fermi,invsmear,smearing='fermi-dirac',order=1):
         """
         Set the fermi energy of the system
+
+        Arguments:
+            invsmear: width of the smearing in eV
+            smearing: 'fermi-dirac', 'gaussian' or 'methfessel-paxton' (see tools.funcs.occupations)
+            order: order of the methfessel-paxton smearing
         """
         self.invsmear = invsmear
+        self.smearing = smearing
         self.efermi = fermi
 
         #full brillouin zone
         self.eigenvalues     -= self.efermi
-        self.occupations = np.zeros([self.nkpoints,self.nbands],dtype=np.float32)
-        for nk in range(self.nkpoints):
-            self.occupations[nk] = fermi_array(self.eigenvalues[nk,:],0,self.invsmear)
+        self.occupations = occupations(self.eigenvalues,0,invsmear,smearing,order,max_exp).astype(np.float32)
 
         #for the ibz
         self.eigenvalues_ibz -= self.efermi
-        self.occupations_ibz = np.zeros([self.nkpoints_ibz,self.nbands],dtype=np.float32)
-        for nk in range(self.nkpoints_ibz):
-            self.occupations_ibz[nk] = fermi_array(self.eigenvalues_ibz[nk,:],0,self.invsmear)
+        self.occupations_ibz = occupations(self.eigenvalues_ibz,0,invsmear,smearing,order,max_exp).astype(np.float32)
 
         return self.efermi
 
@@ -282,28 +309,29 @@ class YamboElectronsDB():
 
         return np.copy(eiv)
 
-    def getFermi(self,invsmear,setfermi=True):
+    def getFermi(self,invsmear,setfermi=True,smearing='fermi-dirac',order=1):
         """
         Determine the fermi energy
+
+        Arguments:
+            invsmear: width of the smearing in eV. If it is a list of values (e.g. a temperature sweep)
+                      the fermi energies for all of them are determined at once and returned
+                      without setting the fermi energy
+            smearing: 'fermi-dirac', 'gaussian' or 'methfessel-paxton' (see tools.funcs.occupations)
+            order: order of the methfessel-paxton smearing
         """
-        if self.efermi: return self.efermi
-        from scipy.optimize import bisect
+        sweep = np.ndim(invsmear) > 0
+        if self.efermi is not None and not sweep: return self.efermi
 
         eigenvalues = self.eigenvalues_ibz
-        weights     = self.weights_ibz
-        nkpoints    = self.nkpoints_ibz
+        weights     = self.spin_degen*self.weights_ibz[:,na]
 
-        min_eival, max_eival = np.min(eigenvalues), np.max(eigenvalues)
-        self.invsmear = invsmear
+        fermi = find_fermi(eigenvalues,weights,self.nelectrons,invsmear,smearing,order)
+        if sweep: return fermi
 
-        def occupation_minus_ne(ef):
-            """
-            The total occupation minus the total number of electrons
-            """
-            return sum([sum(self.spin_degen*fermi_array(eigenvalues[nk],ef,self.invsmear))*weights[nk] for nk in range(nkpoints)])-self.nelectrons
-
-        fermi = bisect(occupation_minus_ne,min_eival,max_eival)
-        if setfermi: self.setFermi(fermi,invsmear)
+        self.invsmear = invsmear
+        if setfermi: self.setFermi(fermi,invsmear,smearing,order)
+        else: return fermi
         return self.efermi
 
     def __str__(self):
@@ -9,6 +9,31 @@ from math import sqrt
 import numpy as np
 import os
 from yambopy.units import ha2ev, ev2cm1, I
+from yambopy.tools.funcs import abs2
+from yambopy.dbs.fragments import YamboFragmentLoader
+from functools import partial
+
+def _read_gkkp(database,iq,index=(),var_nm='ELPH_GKKP_Q'):
+    """
+    Read the hyperslab gkkp[index] of the matrix elements gkkp[k][mode][ib1][ib2] at the q-point iq
+    """
+    database.set_auto_mask(False)
+    g = database.variables['%s%d'%(var_nm,iq+1)][tuple(index)+(Ellipsis,)]
+    return (g[...,0] + I*g[...,1]).astype(np.complex64)
+
+def _read_frequencies(database,iq):
+    """
+    Read the phonon frequencies at the q-point iq in eV
+    """
+    return np.sqrt(database.variables['PH_FREQS%d'%(iq+1)][:])*ha2ev
+
+def _read_eigenmodes(database,iq):
+    """
+    Read the phonon eigenmodes at the q-point iq
+    """
+    #eigs_q[cartesian][atom][mode][complex]
+    eigs_q = database.variables['POLARIZATION_VECTORS'][:].T
+    return eigs_q[0,:,:,:] + eigs_q[1,:,:,:]*I
 
 class YamboElectronPhononDB():
     """
@@ -22,6 +47,8 @@ class YamboElectronPhononDB():
     - Call function read_DB to read everything.
     - Call function get_gkkp_sq for squared matrix elements (gkkp_sq)
     - Call function get_gkkp_mixed for mixed matrix elements (gkkp_mixed)
+    - Call function iter_elph to stream the matrix elements one q-point at a time
+    - Call function reduce_elph to accumulate quantities over q without storing all the matrix elements
    
     Format:
     - gkkp[iq][ik][il][ib1][ib2]
@@ -29,7 +56,7 @@ class YamboElectronPhononDB():
     Plot(s) provided:
     - Call function plot for scatterplot in the BZ of G_{nk} = 1/N_q * \sum_{q,nu} | elph_{qnu,knn} |^2         
     """
-    def __init__(self,lattice,filename='ndb.elph_gkkp',folder_gkkp='SAVE',save='SAVE'):
+    def __init__(self,lattice,filename='ndb.elph_gkkp',folder_gkkp='SAVE',save='SAVE',parallel='thread',nworkers=None):
         
         # Find correct database names
         if os.path.isfile("%s/ndb.elph_gkkp"%folder_gkkp): filename='%s/ndb.elph_gkkp'%folder_gkkp
@@ -70,37 +97,23 @@ class YamboElectronPhononDB():
         database.close()
         
         #Check how many databases are present
-        self.nfrags = self.nqpoints
-        for iq in range(self.nqpoints):
-            if not os.path.isfile("%s%d"%(self.frag_filename,iq+1)): 
-                self.nfrags = iq
-                break
+        self.fragments = YamboFragmentLoader.from_pattern(self.frag_filename+"%d",parallel=parallel,nworkers=nworkers)
+        self.fragments.filenames = self.fragments.filenames[:self.nqpoints]
+        self.nfrags = len(self.fragments)
 
     def read_frequencies(self):
         """
         Read phonon frequencies
         """
         self.ph_energies  = np.zeros([self.nfrags,self.nmodes])
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            self.ph_energies[iq] = np.sqrt(database.variables['PH_FREQS%d'%(iq+1)][:])*ha2ev
-            database.close()
+        self.fragments.load(_read_frequencies,self.ph_energies)
         
     def read_eigenmodes(self):
         """
         Read phonon eigenmodes
         """
         self.ph_eigenvectors = np.zeros([self.nfrags,self.nmodes,self.natoms,3],dtype=np.complex64)
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            #eigs_q[cartesian][atom][mode][complex]
-            eigs_q = database.variables['POLARIZATION_VECTORS'][:].T
-            self.ph_eigenvectors[iq] = eigs_q[0,:,:,:] + eigs_q[1,:,:,:]*I
-            database.close()
+        self.fragments.load(_read_eigenmodes,self.ph_eigenvectors)
     
     def read_elph(self,iq=-1,ik=-1,ib1=-1,ib2=-1,ib_rnge=None,inu=-1,read_bare=False):
         """
@@ -142,19 +155,78 @@ class YamboElectronPhononDB():
         
         self.var_nm = 'ELPH_GKKP_Q'
 
+    def _var_name(self,read_bare=False):
+        """
+        Name of the variable with the dressed or bare matrix elements
+        """
+        if not read_bare: return 'ELPH_GKKP_Q'
+        if self.are_bare_there: return 'ELPH_GKKP_BARE_Q'
+        raise ValueError("The bare couplings are not present.")
+
+    def _iter_fragments(self,read,qpoints=None,prefetch=2):
+        """
+        Apply read(database,iq) to the fragments of the q-points and yield (iq, read(database,iq))
+
+        With prefetch > 0 the next fragments are read in advance while the
+        current one is being processed (see YamboFragmentLoader.imap)
+        """
+        if qpoints is None: qpoints = range(self.nfrags)
+        for iq in qpoints:
+            if not -1<iq<self.nfrags: raise ValueError("The database corresponding to iq = %d is not present."%iq)
+        return self.fragments.imap(read,qpoints,prefetch)
+
+    def iter_elph(self,qpoints=None,ib_rnge=None,modes=None,read_bare=False,prefetch=2):
+        """
+        Iterate over the q-points yielding (iq, gkkp_q) with gkkp_q[k][mode][ib1][ib2]
+        Only the requested hyperslab of each fragment is read.
+
+        Arguments:
+            qpoints: indexes of the q-points (default: all the fragments present)
+            ib_rnge: [ib_i, ib_f] read only the bands between ib_i and ib_f (both included)
+            modes: list of phonon modes to read (default: all)
+            read_bare: read the bare matrix elements
+            prefetch: number of fragments read in advance while the current one is processed (0 to disable)
+        """
+        var_nm = self._var_name(read_bare)
+        bands = slice(None)
+        if ib_rnge is not None:
+            if not (ib_rnge[0]<=ib_rnge[1] and ib_rnge[0]>-1 and ib_rnge[1]<self.nbands):
+                raise ValueError("Problem with band range [%d, %d]"%(ib_rnge[0],ib_rnge[1]))
+            bands = slice(ib_rnge[0],ib_rnge[1]+1)
+        if modes is None: modes = slice(None)
+        else:
+            modes = np.array(modes,dtype=int)
+            if np.any(modes<0) or np.any(modes>=self.nmodes): raise ValueError("The MODE indexes %s are not present."%modes)
+
+        read = partial(_read_gkkp,index=(slice(None),modes,bands,bands),var_nm=var_nm)
+        return self._iter_fragments(read,qpoints,prefetch)
+
+    def reduce_elph(self,reduction=None,qpoints=None,ib_rnge=None,modes=None,read_bare=False,prefetch=2):
+        """
+        Accumulate reduction(gkkp_q) over the q-points streaming the matrix elements
+        so that the full gkkp[q][k][mode][ib1][ib2] array is never stored in memory.
+
+        By default the reduction is \sum_{nu} | g^{q nu}_{knn} |^2 and the result is an array [k][n]
+        with the bands in ib_rnge (the sum over q is not normalized).
+
+        The other arguments are the same as in iter_elph.
+        """
+        if reduction is None:
+            reduction = lambda g: np.sum(abs2(np.diagonal(g,axis1=2,axis2=3)),axis=1)
+        result = 0
+        for iq, gkkp_q in self.iter_elph(qpoints,ib_rnge,modes,read_bare,prefetch):
+            result = result + reduction(gkkp_q)
+        return result
+
     def read_elph_nm(self,i_n,i_m):
         """
         Read electron-phonon matrix element between fixed electronic states (n,m)
         """
         gkkp_nm = np.zeros([self.nfrags,self.nkpoints,self.nmodes],dtype=np.complex64)
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            gkkp_nm[iq] = database.variables['%s%d'%(self.var_nm,iq+1)][:,i_n,i_m,:,0] +\
-                       I* database.variables['%s%d'%(self.var_nm,iq+1)][:,i_n,i_m,:,1]
-            database.close()
-            
+
+        read = partial(_read_gkkp,index=(slice(None),slice(None),i_n,i_m),var_nm=self.var_nm)
+        self.fragments.load(read,gkkp_nm)
+
         if self.var_nm == 'ELPH_GKKP_Q': self.gkkp = gkkp_nm
         if self.var_nm == 'ELPH_GKKP_BARE_Q': self.gkkp_bare = gkkp_nm     
 
@@ -164,14 +236,10 @@ class YamboElectronPhononDB():
         Read electron-phonon matrix element with fixed electronic (k,n,m) and running phononic (q,nu) quantum numbers
         """
         gkkp_knm = np.zeros([self.nfrags,self.nmodes],dtype=np.complex64)
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            gkkp_knm[iq] = database.variables['%s%d'%(self.var_nm,iq+1)][ik,i_n,i_m,:,0] +\
-                        I* database.variables['%s%d'%(self.var_nm,iq+1)][ik,i_n,i_m,:,1]
-            database.close()
-            
+
+        read = partial(_read_gkkp,index=(ik,slice(None),i_n,i_m),var_nm=self.var_nm)
+        self.fragments.load(read,gkkp_knm)
+
         if self.var_nm == 'ELPH_GKKP_Q': self.gkkp = gkkp_knm
         if self.var_nm == 'ELPH_GKKP_BARE_Q': self.gkkp_bare = gkkp_knm                
         
@@ -179,11 +247,7 @@ class YamboElectronPhononDB():
         """
         Read electron-phonon matrix element at a user-specified q point
         """
-        fil = self.frag_filename + "%d"%(iq+1)
-        database = Dataset(fil)
-        g_q = database.variables['%s%d'%(self.var_nm,iq+1)][:]
-        gkkp_q = (g_q[:,:,:,:,0] + I*g_q[:,:,:,:,1]).reshape([self.nkpoints,self.nmodes,self.nbands,self.nbands])
-        database.close()
+        gkkp_q = self.fragments.read_fragment(partial(_read_gkkp,var_nm=self.var_nm),iq)
         
         if self.var_nm == 'ELPH_GKKP_Q': self.gkkp = gkkp_q
         if self.var_nm == 'ELPH_GKKP_BARE_Q': self.gkkp_bare = gkkp_q  
@@ -192,15 +256,9 @@ class YamboElectronPhononDB():
         """
         Read electron-phonon matrix element at a user-specified q point and band range 
         """        
-        ib_i = ib_rnge[0]
-        ib_f = ib_rnge[1]+1
-        nbands_range = ib_f-ib_i
-        fil = self.frag_filename + "%d"%(iq+1)
-        database = Dataset(fil)
-        g_qb = database.variables['%s%d'%(self.var_nm,iq+1)][:]
-        gkkp_qb = (g_qb[:,:,:,:,0] + I*g_qb[:,:,:,:,1]).reshape([self.nkpoints,self.nmodes,self.nbands,self.nbands])
-        gkkp_qb = gkkp_qb[:,:,ib_i:ib_f,ib_i:ib_f]
-        database.close()   
+        bands = slice(ib_rnge[0],ib_rnge[1]+1)
+        read = partial(_read_gkkp,index=(slice(None),slice(None),bands,bands),var_nm=self.var_nm)
+        gkkp_qb = self.fragments.read_fragment(read,iq)
 
         if self.var_nm == 'ELPH_GKKP_Q': self.gkkp = gkkp_qb
         if self.var_nm == 'ELPH_GKKP_BARE_Q': self.gkkp_bare = gkkp_qb        
@@ -211,13 +269,9 @@ class YamboElectronPhononDB():
         """
         # gkkp[q][k][mode][bnd1][bnd2]
         gkkp_full = np.zeros([self.nfrags,self.nkpoints,self.nmodes,self.nbands,self.nbands],dtype=np.complex64)   
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            gkkp = database.variables['%s%d'%(self.var_nm,iq+1)][:]
-            gkkp_full[iq] = (gkkp[:,:,:,:,0] + I*gkkp[:,:,:,:,1]).reshape([self.nkpoints,self.nmodes,self.nbands,self.nbands])
-            database.close()
+
+        read = partial(_read_gkkp,var_nm=self.var_nm)
+        self.fragments.load(read,gkkp_full)
 
         if self.var_nm == 'ELPH_GKKP_Q': self.gkkp = gkkp_full
         if self.var_nm == 'ELPH_GKKP_BARE_Q': self.gkkp_bare = gkkp_full          
@@ -226,24 +280,17 @@ class YamboElectronPhononDB():
         """ 
         Load all the database data to memory
         """
-        self.ph_energies  = np.zeros([self.nfrags,self.nmodes])
-        self.ph_eigenvectors = np.zeros([self.nfrags,self.nmodes,self.natoms,3],dtype=np.complex64)
-        self.gkkp = np.zeros([self.nfrags,self.nkpoints,self.nmodes,self.nbands,self.nbands],dtype=np.complex64)
+        #the frequencies are kept in Hartree here
+        self.read_frequencies()
+        self.ph_energies = self.ph_energies/ha2ev
+        self.read_eigenmodes()
+
+        self.var_nm = 'ELPH_GKKP_Q'
+        self.read_elph_full()
         if self.are_bare_there:
-            self.gkkp_bare = np.zeros([self.nfrags,self.nkpoints,self.nmodes,self.nbands,self.nbands],dtype=np.complex64)
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            self.ph_energies[iq] = np.sqrt(database.variables['PH_FREQS%d'%(iq+1)][:])
-            eigs_q = database.variables['POLARIZATION_VECTORS'][:].T
-            self.ph_eigenvectors[iq] = eigs_q[0,:,:,:] + eigs_q[1,:,:,:]*I
-            gkkp = database.variables['ELPH_GKKP_Q%d'%(iq+1)][:]
-            self.gkkp[iq] = (gkkp[:,:,:,:,0] + I*gkkp[:,:,:,:,1]).reshape([self.nkpoints,self.nmodes,self.nbands,self.nbands])
-            if self.are_bare_there:
-                gkkp_bare = database.variables['ELPH_GKKP_BARE_Q%d'%(iq+1)][:]
-                self.gkkp_bare[iq] = (gkkp_bare[:,:,:,:,0] + I*gkkp_bare[:,:,:,:,1]).reshape([self.nkpoints,self.nmodes,self.nbands,self.nbands])
-            database.close()
+            self.var_nm = 'ELPH_GKKP_BARE_Q'
+            self.read_elph_full()
+            self.var_nm = 'ELPH_GKKP_Q'
     
     def plot_elph(self,ib=1,inu=-1,cmap='viridis',size=300,read_bare=False):
         """
@@ -265,15 +312,11 @@ class YamboElectronPhononDB():
     
         # Get raw data to plot
         kx, ky, kz = self.car_kpoints.T
-        data = self.read_elph(ib1=ib,ib2=ib,read_bare=read_bare)
         
-        # Prepare function G_{nk}
-        to_plot = np.zeros(self.nkpoints)
-        for iq in range(self.nfrags): #[ATTENTION] the sum will be performed on the AVAILABLE qpts.
-            if inu>-1: 
-                to_plot += np.abs(data[iq,:,inu])**2.
-            else:
-                for i_mode in range(self.nmodes): to_plot += np.abs(data[iq,:,i_mode])**2.
+        # Prepare function G_{nk} streaming over the q-points
+        #[ATTENTION] the sum will be performed on the AVAILABLE qpts.
+        modes = [inu] if inu>-1 else None
+        to_plot = self.reduce_elph(ib_rnge=[ib,ib],modes=modes,read_bare=read_bare)[:,0]
         to_plot = to_plot/self.nqpoints
         norm_to_plot = to_plot/max(to_plot)
             
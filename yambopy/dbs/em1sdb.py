@@ -6,6 +6,19 @@
 from yambopy import *
 from netCDF4 import Dataset
 from yambopy.lattice import rec_lat, car_red
+from yambopy.dbs.fragments import YamboFragmentLoader
+
+def _read_em1s_fragment(database,nq):
+    """
+    Read the static screening of one q-point
+    """
+    #static screening means we have only one frequency
+    # this try except is because the way this is sotored has changed in yambo
+    try:
+        re, im = database.variables['X_Q_%d'%(nq+1)][0,:]
+    except:
+        re, im = database.variables['X_Q_%d'%(nq+1)][0,:].T
+    return re + 1j*im
 
 class YamboStaticScreeningDB(object):
     """
@@ -59,6 +72,10 @@ class YamboStaticScreeningDB(object):
         gvectors = np.rint(database.variables['X_RL_vecs'][:].T)
         self.gvectors = np.array([g/self.alat  for g in gvectors])
         self.ngvectors = len(self.gvectors)
+
+        #hashed index of the gvectors in integer internal units
+        self.iku_gvectors = gvectors.astype(int)
+        self.g_index = { tuple(g):ng for ng,g in enumerate(self.iku_gvectors) }
         
         #read q-points
         self.iku_qpoints = database.variables['HEAD_QPT'][:].T
@@ -77,34 +94,18 @@ class YamboStaticScreeningDB(object):
             if not os.path.isfile("%s/%s_fragment_%d"%(self.em1s,self.filename,iQ+1)): read_fragments=False
         if read_fragments: self.readDBs()
 
-    def readDBs(self):
+    def readDBs(self,parallel='thread',nworkers=None,verbose=False):
         """
         Read the yambo databases
+
+        The fragments are read concurrently (see YamboFragmentLoader)
         """
 
         #create database to hold all the X data
         self.X = np.zeros([self.nqpoints,self.size,self.size],dtype=np.complex64)
-        for nq in range(self.nqpoints):
-
-            #open database for each k-point
-            filename = "%s/%s_fragment_%d"%(self.save,self.filename,nq+1)
-            try:
-                database = Dataset(filename)
-            except:
-                print("warning: failed to read %s"%filename)
-
-
-            #static screening means we have only one frequency
-            # this try except is because the way this is sotored has changed in yambo
-            try:
-                re, im = database.variables['X_Q_%d'%(nq+1)][0,:]
-            except:
-                re, im = database.variables['X_Q_%d'%(nq+1)][0,:].T
-
-            self.X[nq] = re + 1j*im
-         
-            #close database
-            database.close()
+        fragments = YamboFragmentLoader.from_pattern("%s/%s_fragment_%%d"%(self.em1s,self.filename),self.nqpoints,
+                                                     parallel=parallel,nworkers=nworkers,verbose=verbose)
+        fragments.load(_read_em1s_fragment,self.X)
 
     def saveDBS(self,path):
         """
@@ -143,10 +144,62 @@ class YamboStaticScreeningDB(object):
         get the index of the gvectors.
         If the gvector is not present return None
         """
-        for ng,gvec in enumerate(self.gvectors):
-            if np.isclose(g,gvec).all():
-                return ng
-        return None
+        key = tuple(np.rint(np.array(g)*self.alat).astype(int))
+        ng = self.g_index.get(key)
+        if ng is None or not np.isclose(g,self.gvectors[ng]).all(): return None
+        return ng
+
+    def get_g_indexes(self,gvectors):
+        """
+        get the indexes of a list of gvectors.
+        The gvectors that are not present get the index -1
+        """
+        gvectors = np.array(gvectors).reshape(-1,3)
+        keys = np.rint(gvectors*self.alat).astype(int)
+        indexes = np.array([self.g_index.get(tuple(key),-1) for key in keys],dtype=int)
+        found = indexes > -1
+        found[found] = np.isclose(gvectors[found],self.gvectors[indexes[found]]).all(axis=1)
+        indexes[~found] = -1
+        return indexes
+
+    def get_eps_slice(self,rows=None,cols=[0],qpoints=None,single=False,max_memory=256):
+        """
+        Get the slice [1/(1+vX)]_{rows,cols} for a set of q-points
+
+        Instead of inverting the full matrices the linear systems (1+vX) Y = E_{cols}
+        (or the transposed ones if there are less rows than columns) are solved
+        for all the q-points at once.
+
+        Arguments:
+            rows, cols -> indexes of the local field components (rows=None for all of them)
+            qpoints    -> indexes of the q-points (default: all)
+            single     -> solve in single precision
+            max_memory -> maximum memory in MB used for each block of q-points
+
+        Returns an array [nqpoints,nrows,ncols]
+        """
+        ng = self.ngvectors
+        if rows is None: rows = np.arange(ng)
+        rows, cols = np.atleast_1d(rows), np.atleast_1d(cols)
+        if qpoints is None: qpoints = np.arange(self.nqpoints)
+        dtype = np.complex64 if single else np.complex128
+
+        #solve for the smaller side of the slice
+        transpose = len(rows) < len(cols)
+        if transpose: rows, cols = cols, rows
+        rhs = np.eye(ng,dtype=dtype)[:,cols]
+
+        eps = np.zeros([len(qpoints),len(rows),len(cols)],dtype=dtype)
+        nblock = max(1,int(max_memory*1024**2/(2*ng*ng*np.dtype(dtype).itemsize)))
+        for start in range(0,len(qpoints),nblock):
+            block = qpoints[start:start+nblock]
+            a = np.eye(ng,dtype=dtype)+self.X[block].astype(dtype)
+            if transpose: a = a.transpose(0,2,1)
+            y = np.linalg.solve(a,np.broadcast_to(rhs,(len(block),)+rhs.shape))
+            eps[start:start+nblock] = y[:,rows]
+
+        if transpose: eps = eps.transpose(0,2,1)
+        return eps
 
     def _geteq(self,volume=False): 
         """
@@ -161,12 +214,12 @@ class YamboStaticScreeningDB(object):
             ng1, ng2 -> Choose local field components
             volume   -> Normalize with the volume of the cell
         """
-        x = [np.linalg.norm(q) for q in self.car_qpoints]
-        y = [np.linalg.inv(np.eye(self.ngvectors)+xq)[0,0] for xq in self.X ]
+        x = np.linalg.norm(self.car_qpoints,axis=1)
+        y = self.get_eps_slice(rows=[0],cols=[0])[:,0,0]
       
         #order according to the distance
-        x, y = list(zip(*sorted(zip(x, y))))
-        y = np.array(y)
+        order = np.argsort(x,kind='stable')
+        x, y = tuple(x[order]), y[order]
 
         #scale by volume?
         if volume: y *= self.volume 
@@ -5,6 +5,7 @@
 #
 import os
 from itertools import product
+from collections import OrderedDict
 from yambopy import *
 from cmath import polar 
 from yambopy.units import *
@@ -48,6 +49,62 @@ class Exciton():
     def __str__(self):
         return self.get_string()
 
+class YamboExcitonEigenvectors():
+    """
+    Lazy access to the excitonic eigenvectors stored in a BSE database
+
+    The database is kept open and eigenvectors[i] reads only the row of the
+    exciton i, the most recently used excitons are kept in memory.
+    """
+    def __init__(self,filename,cache_size=32):
+        self.filename = filename
+        self.cache_size = cache_size
+        self._database = Dataset(filename)
+        self._eigenstates = self._database.variables['BS_EIGENSTATES']
+        self._cache = OrderedDict()
+
+    @property
+    def shape(self): return self._eigenstates.shape[:2]
+
+    def __len__(self): return self.shape[0]
+
+    def read(self,index):
+        """ read the eigenvectors from the database without using the cache
+        """
+        eiv = self._eigenstates[index]
+        return eiv[...,0] + eiv[...,1]*I
+
+    def __getitem__(self,index):
+        if not isinstance(index,(int,np.integer)):
+            return self.read(index)
+
+        nexcitons = len(self)
+        if not -nexcitons <= index < nexcitons:
+            raise IndexError('Exciton %d out of range, the database has %d excitons'%(index,nexcitons))
+        index = int(index)%nexcitons
+
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+
+        eivec = self.read(index)
+        self._cache[index] = eivec
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return eivec
+
+    def __array__(self,dtype=None,copy=None):
+        eiv = self.read(slice(None))
+        return np.asarray(eiv,dtype=dtype)
+
+    def close(self):
+        self._cache.clear()
+        if self._database.isopen(): self._database.close()
+
+    def __del__(self):
+        try: self.close()
+        except Exception: pass
+
 class YamboExcitonDB(YamboSaveDB):
     """ Read the excitonic states database from yambo
     """
@@ -64,8 +121,12 @@ class YamboExcitonDB(YamboSaveDB):
         self.eigenvectors = eigenvectors
 
     @classmethod
-    def from_db_file(cls,lattice,filename='ndb.BS_diago_Q01',folder='.'):
+    def from_db_file(cls,lattice,filename='ndb.BS_diago_Q01',folder='.',lazy=False,cache_size=32):
         """ initialize this class from a file
+
+            Arguments:
+            lazy       -> do not load the eigenvectors, read each exciton from the file when it is needed
+            cache_size -> number of excitons kept in memory in the lazy mode
         """
         path_filename = os.path.join(folder,filename)
         if not os.path.isfile(path_filename):
@@ -92,9 +153,12 @@ class YamboExcitonDB(YamboSaveDB):
             table = None
             eigenvectors = None
             if 'BS_EIGENSTATES' in database.variables:
-                eiv = database.variables['BS_EIGENSTATES'][:]
-                eiv = eiv[:,:,0] + eiv[:,:,1]*I
-                eigenvectors = eiv
+                if lazy:
+                    eigenvectors = YamboExcitonEigenvectors(path_filename,cache_size=cache_size)
+                else:
+                    eiv = database.variables['BS_EIGENSTATES'][:]
+                    eiv = eiv[:,:,0] + eiv[:,:,1]*I
+                    eigenvectors = eiv
                 table = database.variables['BS_TABLE'][:].T.astype(int)
 
             table = table
@@ -294,46 +358,77 @@ class YamboExcitonDB(YamboSaveDB):
         
         return np.array(band_kpoints), energies, weights 
     
-    def get_exciton_weights(self,excitons):
-        """get weight of state in each band"""
-        weights = np.zeros([self.nkpoints,self.mband])
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv[0:3]-1    # This is bug's source between yambo 4.4 and 5.0 
-                this_weight = abs2(eivec[t])
-                weights[k,c] += this_weight
-                weights[k,v] += this_weight
-                sum_weights += this_weight
-            if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
- 
+    def get_eigenvectors_block(self,excitons):
+        """
+        get the eigenvectors of a list of excitons (counting from 1) as an array
+        with shape (nexcitons,ntransitions) restricted to the transitions in the table
+        """
+        excitons = np.array(excitons,dtype=int).reshape(-1)-1
+        if isinstance(self.eigenvectors,np.ndarray):
+            eivecs = self.eigenvectors[excitons]
+        else:
+            eivecs = np.array([self.eigenvectors[exciton] for exciton in excitons])
+        return eivecs[:,:self.ntransitions]
+
+    @staticmethod
+    def _scatter_add(values,index,size):
+        """
+        Add values with shape (nexcitons,ntransitions) to an array with shape (nexcitons,size)
+        at the positions given by index with shape (ntransitions,)
+        """
+        nexcitons = len(values)
+        index = (np.arange(nexcitons)[:,None]*size+index[None,:]).ravel()
+        add = lambda v: np.bincount(index,weights=v.ravel(),minlength=nexcitons*size).reshape(nexcitons,size)
+        if np.iscomplexobj(values):
+            return add(values.real)+add(values.imag)*I
+        return add(values)
+
+    def get_exciton_weights(self,excitons,sum_excitons=True):
+        """get weight of state in each band
+
+           Arguments:
+           excitons     -> list of excitons (counting from 1)
+           sum_excitons -> if False return the weights of each exciton
+                           in an array with shape (nexcitons,nkpoints,mband)
+        """
+        nkpoints, mband = self.nkpoints, self.mband
+
+        #get the weight of each transition for all the excitons
+        this_weights = abs2(self.get_eigenvectors_block(excitons))
+
+        sum_weights = np.sum(this_weights,axis=1)
+        for sum_weight in sum_weights:
+            if abs(sum_weight - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weight)
+
+        #add weights to both bands of the transition
+        k,c,v = (self.table[:,0:3]-1).T    # This is bug's source between yambo 4.4 and 5.0 
+        weights = self._scatter_add(this_weights,k*mband+c,nkpoints*mband) + \
+                  self._scatter_add(this_weights,k*mband+v,nkpoints*mband)
+        weights = weights.reshape(-1,nkpoints,mband)
+
+        if sum_excitons: return np.sum(weights,axis=0)
         return weights
   
-    def get_exciton_transitions(self,excitons):
-        """get weight of state in each band"""
-        # Double check the part of the array w_k_v_to_c
-        # We should comment more this part
-        #weights = np.zeros([self.nkpoints,self.mband])
-        w_k_v_to_c = np.zeros([self.nkpoints,self.nvbands,self.ncbands])
+    def get_exciton_transitions(self,excitons,sum_excitons=True):
+        """get weight of each transition from valence to conduction
+
+           Arguments:
+           excitons     -> list of excitons (counting from 1)
+           sum_excitons -> if False return the weights of each exciton
+                           in an array with shape (nexcitons,nkpoints,nvbands,ncbands)
+        """
+        nkpoints, nvbands, ncbands = self.nkpoints, self.nvbands, self.ncbands
         v_min = self.unique_vbands[0]
         c_min = self.unique_cbands[0]
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            #sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv-1
-                #k,v,c = kcv-1                                 # bug?? Double-check
-                this_weight = abs2(eivec[t])
-                w_k_v_to_c[k,v-v_min,c-c_min] = this_weight   # new
-            #if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
- 
-        #return weights, w_k_v_to_c
+
+        this_weights = abs2(self.get_eigenvectors_block(excitons))
+
+        k,v,c = (self.table[:,0:3]-1).T
+        index = (k*nvbands+v-v_min)*ncbands+c-c_min
+        w_k_v_to_c = self._scatter_add(this_weights,index,nkpoints*nvbands*ncbands)
+        w_k_v_to_c = w_k_v_to_c.reshape(-1,nkpoints,nvbands,ncbands)
+
+        if sum_excitons: return np.sum(w_k_v_to_c,axis=0)
         return w_k_v_to_c
 
     def get_exciton_2D(self,excitons,f=None):
@@ -690,19 +785,12 @@ class YamboExcitonDB(YamboSaveDB):
        
         car_kpoints = self.lattice.car_kpoints
         nkpoints = len(car_kpoints)
-        print(nkpoints)
-        amplitudes = np.zeros([nkpoints])
-        phases     = np.zeros([nkpoints],dtype=np.complex64)
-        for exciton in excitons:
-            #the the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-           
-            total = 0
-            for eh,kvc in enumerate(self.table):
-                ikbz, v, c = kvc-1
-                Acvk = eivec[eh]
-                phases[ikbz]     += Acvk
-                amplitudes[ikbz] += np.abs(Acvk)
+
+        #sum the coefficients of all the transitions at each kpoint
+        eivecs = self.get_eigenvectors_block(excitons)
+        ikbz = self.table[:,0]-1
+        amplitudes = np.sum(self._scatter_add(np.abs(eivecs),ikbz,nkpoints),axis=0)
+        phases     = np.sum(self._scatter_add(eivecs,ikbz,nkpoints),axis=0).astype(np.complex64)
 
         #replicate kmesh
         red_kmesh,kindx = replicate_red_kmesh(self.lattice.red_kpoints,repx=repx,repy=repy,repz=repz)
@@ -711,9 +799,16 @@ class YamboExcitonDB(YamboSaveDB):
         return car_kpoints, amplitudes[kindx], np.angle(phases)[kindx]
 
     def get_chi(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5,
-            nexcitons='all',spin_degen=2,verbose=0,**kwargs):
+            nexcitons='all',spin_degen=2,verbose=0,max_memory=256,pole_cutoff=None,**kwargs):
         """
         Calculate the dielectric response function using excitonic states
+
+        The sum over the excitonic states is evaluated in blocks of excitons x frequencies
+
+            Arguments:
+            max_memory  -> maximum memory in MB used by each block
+            pole_cutoff -> if not None include only the excitons with energy
+                           between emin-pole_cutoff and emax+pole_cutoff (in eV)
         """
         if nexcitons == 'all': nexcitons = self.nexcitons
 
@@ -725,9 +820,6 @@ class YamboExcitonDB(YamboSaveDB):
             print("energy range: %lf -> +%lf -> %lf "%(emin,estep,emax))
             print("energy steps: %lf"%nenergies)
 
-        #initialize the susceptibility intensity
-        chi = np.zeros([len(w)],dtype=np.complex64)
-
         if dipoles is None:
             #get dipole
             EL1 = self.l_residual
@@ -737,14 +829,18 @@ class YamboExcitonDB(YamboSaveDB):
             if verbose: print("calculate exciton-light coupling")
             EL1,EL2 = self.project1(dipoles.dipoles[:,dir],nexcitons) 
 
+        #number of excitons in each block so that the block fits in max_memory
+        #(a complex128 array for each of the two green's functions)
+        block_size = max(1,int(max_memory*1024**2/(2*16*max(nenergies,1))))
+
         if isinstance(broad,float): broad = [broad]*nexcitons
 
         if isinstance(broad,tuple): 
             broad_slope = broad[1]-broad[0]
             min_exciton = np.min(self.eigenvalues.real)
-            broad = [ broad[0]+(es-min_exciton)*broad_slope for es in self.eigenvalues[:nexcitons].real]
+            broad = broad[0]+(self.eigenvalues[:nexcitons].real-min_exciton)*broad_slope
 
-        if "gaussian" in broad or "lorentzian" in broad:
+        if isinstance(broad,str) and ("gaussian" in broad or "lorentzian" in broad):
             i = broad.find(":")
             if i != -1:
                 value, eunit = broad[i+1:].split()
@@ -752,28 +848,39 @@ class YamboExcitonDB(YamboSaveDB):
                 else: raise ValueError('Unknown unit %s'%eunit)
 
             f = gaussian if "gaussian" in broad else lorentzian
+            eigenvalues = self.eigenvalues.real
             broad = np.zeros([nexcitons])
-            for s in range(nexcitons):
-                es = self.eigenvalues[s].real
-                broad += f(self.eigenvalues.real,es,sigma)
+            for start in range(0,nexcitons,block_size):
+                es = eigenvalues[start:start+block_size,None]
+                broad += np.sum(f(eigenvalues[None,:],es,sigma),axis=0)
             broad = 0.1*broad/nexcitons
 
-        #iterate over the excitonic states
-        for s in range(nexcitons):
-            #get exciton energy
-            es = self.eigenvalues[s]
- 
+        #select the excitonic states
+        es    = np.array(self.eigenvalues[:nexcitons])
+        r     = np.array(EL1[:nexcitons]*EL2[:nexcitons])
+        broad = np.array(broad[:nexcitons])
+        if pole_cutoff is not None:
+            window = (es.real >= emin-pole_cutoff) & (es.real <= emax+pole_cutoff)
+            es, r, broad = es[window], r[window], broad[window]
+            if verbose: print("%d excitons within %lf eV of the energy range"%(len(es),pole_cutoff))
+
+        #sum over the excitonic states in blocks
+        chi = np.zeros([nenergies],dtype=np.complex128)
+        for start in range(0,len(es),block_size):
+            block = slice(start,start+block_size)
+            es_b    = es[block,None]
+            broad_b = broad[block,None]
+
             #calculate the green's functions
-            G1 = -1/(   w - es + broad[s]*I)
-            G2 = -1/( - w - es - broad[s]*I)
+            G1 = -1/(   w[None,:] - es_b + broad_b*I)
+            G2 = -1/( - w[None,:] - es_b - broad_b*I)
 
-            r = EL1[s]*EL2[s]
-            chi += r*G1 + r*G2
+            chi += np.dot(r[block],G1+G2)
 
         #multiply facto
         d3k_factor = self.lattice.rlat_vol/self.lattice.nkpoints
         cofactor = spin_degen/(2*np.pi)**3 * d3k_factor * (4*np.pi)
-        chi = chi*cofactor/q0norm**2
+        chi = (chi*cofactor/q0norm**2).astype(np.complex64)
 
         return w,chi
 
@@ -782,7 +889,7 @@ class YamboExcitonDB(YamboSaveDB):
         w,chi = self.get_chi(**kwargs)
         #cleanup kwargs variables
         cleanup_vars = ['dipoles','dir','emin','emax','estep','broad',
-                        'q0norm','nexcitons','spin_degen','verbose']
+                        'q0norm','nexcitons','spin_degen','verbose','max_memory','pole_cutoff']
         for var in cleanup_vars: kwargs.pop(var,None)
         if 're' in reim: ax.plot(w,chi.real,**kwargs)
         if 'im' in reim: ax.plot(w,chi.imag,**kwargs)
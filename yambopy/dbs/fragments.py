@@ -0,0 +1,159 @@
+# Copyright (c) 2018, Henrique Miranda
+# All rights reserved.
+#
+# This file is part of the yambopy project
+#
+"""
+Read the fragments (``*_fragment_N``) of the yambo databases concurrently
+"""
+import os
+import numpy as np
+from time import time
+from threading import Lock
+from contextlib import nullcontext
+from collections import deque
+from netCDF4 import Dataset
+
+#the netCDF library is not thread-safe, the threads take turns to access it
+_netcdf_lock = Lock()
+
+def _read_fragment(read,filename,n,lock=None):
+    """
+    Open the fragment and apply read(database,n) to it
+    Returns the result and the time spent
+    """
+    start = time()
+    with lock or nullcontext():
+        with Dataset(filename) as database:
+            data = read(database,n)
+    return data, time()-start
+
+class YamboFragmentLoader():
+    """
+    Read the fragments of a yambo database using a pool of threads or processes
+
+    Arguments:
+
+        ``filenames``: list with the paths of the fragments
+        ``parallel``: 'thread', 'process' or 'serial' (default: thread)
+        ``nworkers``: number of threads or processes (default: min(8,number of cpus))
+        ``verbose``: print the time spent reading each fragment
+
+    The read functions have the signature ``read(database,n)`` where ``database`` is the
+    open netCDF fragment and ``n`` its index in the list of filenames.
+    To use processes ``read`` has to be picklable (a module level function or a ``functools.partial`` of one).
+
+    The netCDF library is not thread-safe so threads hold a lock while they open and read
+    a fragment: they give no I/O concurrency, the fragments are read one at a time in the
+    background overlapping the reads with the work done on the fragments already read.
+
+    Processes read the fragments concurrently, which hides the latency to open the files
+    on parallel filesystems with many large fragments. Starting the workers has a cost so
+    for small databases they are slower than reading in serial. They are started with the
+    default method of multiprocessing (spawn on macOS and Windows, forkserver from python 3.14)
+    which imports the main script again: a script using processes must create the
+    databases inside an ``if __name__ == '__main__':`` block, otherwise the workers fail
+    with BrokenProcessPool.
+
+    After each load the time spent on each fragment is stored in ``timings``.
+    """
+    def __init__(self,filenames,parallel='thread',nworkers=None,verbose=False):
+        if parallel not in ['thread','process','serial']:
+            raise ValueError('Unknown parallelization %s, use thread, process or serial'%parallel)
+        if nworkers is None: nworkers = min(8,os.cpu_count() or 1)
+        self.filenames = list(filenames)
+        self.parallel = parallel
+        self.nworkers = nworkers
+        self.verbose = verbose
+        self.timings = {}
+
+    @classmethod
+    def from_pattern(cls,pattern,nfragments=None,start=1,**kwargs):
+        """
+        Discover the fragments with filenames ``pattern%(n)`` with n starting at start
+
+        If nfragments is None all the consecutive fragments present are used,
+        otherwise the fragments are expected to exist and FileNotFoundError is raised if one is missing.
+        """
+        filenames = []
+        n = start
+        while nfragments is None or len(filenames) < nfragments:
+            filename = pattern%n
+            if not os.path.isfile(filename):
+                if nfragments is None: break
+                raise FileNotFoundError("Fragment %s not found"%filename)
+            filenames.append(filename)
+            n += 1
+        return cls(filenames,**kwargs)
+
+    @property
+    def nfragments(self):
+        return len(self.filenames)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def _executor(self):
+        if self.parallel == 'process':
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(max_workers=self.nworkers)
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=self.nworkers)
+
+    def imap(self,read,indexes=None,prefetch=None):
+        """
+        Yield (n, read(database,n)) for the fragments in indexes keeping the order.
+        At most prefetch fragments (default: nworkers) are read ahead of the one being consumed.
+        """
+        if indexes is None: indexes = range(self.nfragments)
+        indexes = list(indexes)
+        if prefetch is None: prefetch = self.nworkers
+        self.timings = {}
+
+        #a single fragment is not worth starting the workers
+        if self.parallel == 'serial' or not prefetch or len(indexes) < 2:
+            for n in indexes:
+                yield n, self.read_fragment(read,n)
+            return
+
+        lock = _netcdf_lock if self.parallel == 'thread' else None
+        pending = deque()
+        with self._executor() as executor:
+            for n in indexes:
+                pending.append((n,executor.submit(_read_fragment,read,self.filenames[n],n,lock)))
+                if len(pending) > prefetch:
+                    yield self._result(*pending.popleft())
+            while pending:
+                yield self._result(*pending.popleft())
+
+    def _result(self,n,future):
+        data, self.timings[n] = future.result()
+        self._report(n)
+        return n, data
+
+    def _report(self,n):
+        if self.verbose: print("%s: %.4lf s"%(self.filenames[n],self.timings[n]))
+
+    def read_fragment(self,read,n):
+        """
+        Read a single fragment returning read(database,n)
+        """
+        data, self.timings[n] = _read_fragment(read,self.filenames[n],n,_netcdf_lock)
+        self._report(n)
+        return data
+
+    def load(self,read,out,indexes=None):
+        """
+        Read the fragments concurrently into the preallocated array out with out[n] = read(database,n)
+        """
+        for n, data in self.imap(read,indexes,prefetch=len(self.filenames)):
+            out[n] = data
+        return out
+
+    def __str__(self):
+        s  = "fragments: %d\n"%self.nfragments
+        s += "parallel:  %s (%d workers)\n"%(self.parallel,self.nworkers)
+        if self.timings:
+            times = np.array(list(self.timings.values()))
+            s += "read time per fragment: min %.4lf s max %.4lf s total %.4lf s"%(times.min(),times.max(),times.sum())
+        return s
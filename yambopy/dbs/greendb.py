@@ -5,6 +5,7 @@
 #
 from yambopy import *
 import shutil
+import warnings
 ha2ev  = 27.211396132
 
 class YamboGreenDB(object):
@@ -110,111 +111,85 @@ class YamboGreenDB(object):
         #write 
         qp.close()
 
-    def getQP(self,e0,bandmin=None,bandmax=None,debug=False,secant=True,braket=None):
+    def getQP(self,e0,bandmin=None,bandmax=None,debug=False,secant=None,braket=None,max_memory=256):
         """
         Get quasiparticle states
+
+        The equation Re(SE(w)) - w + e0 = 0 is solved for all the states at once:
+        the sign changes on the frequency grid of each state are located and the roots
+        are refined by linear interpolation in those intervals, the one closest to e0 is chosen.
+        The Z factors are obtained from the slope of the self-energy in the same interval.
+
+        The states without a solution are flagged as False in self.converged
+        and keep the bare energy and Z=1.
     
         Arguments:
         e0 -> bare eigenvalues in eV
+        secant -> deprecated, the root closest to e0 (inside the braket if given) is always chosen
+        braket -> only consider the roots in [e0-braket,e0+braket]
+        max_memory -> maximum memory in MB used for each block of states
         """
-        from scipy.optimize import bisect, newton
-        from scipy.interpolate import interp1d
-        from scipy.misc import derivative
+        if secant is not None:
+            warnings.warn('getQP: secant is deprecated and ignored, the root closest to e0 is always chosen '
+                          '(use braket to restrict the search)',DeprecationWarning,stacklevel=2)
 
         #check if the eigenvalues have the correct dimensions
+        e0 = np.array(e0)
         if len(e0) != self.nqps:
             raise ValueError('Wrong dimensions in bare eigenvalues')
 
-        #in case something is strange we plot the stuff
-        def error(nqp):
-            ax = plt.gca()
-
-            #plot 0
-            ax.axhline(0,c='k',lw=1)
-            
-            #se limits
-            semin = min(self.se[nqp].real)
-            semax = max(self.se[nqp].real)
-            plt.ylim(semin,semax)
-
-            #plot self energy
-            self.plot(ax,nqp=nqp)
-
-            #plot omega-e0
-            emin = min(self.energies[nqp].real)
-            emax = max(self.energies[nqp].real)
-            x = np.linspace(emin,emax,100)
-            plt.plot(x,x-e0[nqp])
-
-            #plot imaginary part of greens funciton
-            x = self.energies[nqp].real
-            y = self.green[nqp].imag
-            plt.plot(x,y/max(y)*semax)
-    
-            #plot eqp
-            #plt.axvline(self.eqp[nqp],lw=1)
-            #plt.axvline(e0[nqp],lw=1)
-
-            plt.legend(frameon=False)
-            plt.show()
-
         if bandmin is None: bandmin = self.bandmin
         if bandmax is None: bandmax = self.bandmax
  
         self.eqp = np.zeros([self.nqps],dtype=complex) 
         self.z   = np.zeros([self.nqps],dtype=complex) 
-        for nqp in range(self.nqps):
+        self.converged = np.zeros([self.nqps],dtype=bool)
 
-            band = self.band1[nqp]
-            kpt  = self.kindex[nqp]
-            if debug: print("%3d %3d %3d %8.4lf"%(nqp, kpt, band, e0[nqp]))
-
-            if not (bandmin <= band <= bandmax):
-                continue
+        states = np.nonzero((bandmin <= self.band1) & (self.band1 <= bandmax))[0]
+        nblock = max(1,int(max_memory*1024**2/(64*self.nenergies)))
+        for start in range(0,len(states),nblock):
+            qps = states[start:start+nblock]
+            r = np.arange(len(qps))
+            e0_qps = e0[qps]
 
             #get x and y
-            x = self.energies[nqp].real
-            y = self.se[nqp]
-
-            #interpolate real part of function
-            f = interp1d(x,y.real-x+e0[nqp],kind='slinear')
-
-            #find zero
-            if secant:
-                try:
-                    eqp = newton(f,e0[nqp],maxiter=200)
-                except ValueError as msg:
-                    print(msg)
-                    if debug: error(nqp)
-            else:
-                if braket:
-                    emin = e0[nqp]-braket
-                    emax = e0[nqp]+braket
-                else:
-                    emin = min(x)
-                    emax = max(x)
-
-                eqp = bisect(f,emin,emax) 
-
-            #interpolate whole function
-            f = interp1d(x,y)
-
-            #calculate Z factors
-            dse = derivative(f,eqp,dx=1e-8)
-            z = 1./(1-dse)
-
-            #find Im(Se(EQP)) which corresponds to the lifetime
-            lif = f(eqp).imag
-            eqp += 1j*lif
+            x  = self.energies[qps].real
+            se = self.se[qps]
+            f = se.real-x+e0_qps[:,None]
+
+            #roots of the linear interpolation in the intervals with a sign change
+            x0, x1 = x[:,:-1], x[:,1:]
+            f0, f1 = f[:,:-1], f[:,1:]
+            crossing = (f0*f1 <= 0) & (f0 != f1)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                roots = x0-f0*(x1-x0)/(f1-f0)
+            distance = np.where(crossing,np.abs(roots-e0_qps[:,None]),np.inf)
+            if braket: distance[distance > braket] = np.inf
+
+            #choose the root closest to e0
+            i = np.argmin(distance,axis=1)
+            converged = np.isfinite(distance[r,i])
+            eqp = roots[r,i]
+
+            #calculate Z factors from the slope of the self-energy
+            #(the states without a root give invalid values that are discarded below)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                dse = (se[r,i+1]-se[r,i])/(x1[r,i]-x0[r,i])
+                z = 1./(1-dse)
+
+                #find Im(Se(EQP)) which corresponds to the lifetime
+                lif = (se[r,i]+dse*(eqp-x0[r,i])).imag
 
             #store values
-            self.eqp[nqp] = eqp
-            self.z[nqp] = z           
-
-            #cehck for potential errors
-            if z>1 and debug:
-                print(z)
-                error(nqp)            
+            self.eqp[qps] = np.where(converged,eqp+1j*lif,e0_qps)
+            self.z[qps]   = np.where(converged,z,1)
+            self.converged[qps] = converged
+
+        if debug:
+            for nqp in states[~self.converged[states]]:
+                print("no solution for nqp %3d kpt %3d band %3d e0 %8.4lf"%(nqp,self.kindex[nqp],self.band1[nqp],e0[nqp]))
+            for nqp in states[self.z[states].real > 1]:
+                print("z>1 for nqp %3d kpt %3d band %3d z %8.4lf"%(nqp,self.kindex[nqp],self.band1[nqp],self.z[nqp].real))
 
         return self.eqp, self.z
 
@@ -8,7 +8,7 @@ import numpy as np
 from itertools import product
 from netCDF4 import Dataset
 from yambopy.tools.jsonencoder import JsonDumper, JsonLoader
-from yambopy.lattice import vol_lat, rec_lat, car_red, red_car, vec_in_list, isbetween
+from yambopy.lattice import vol_lat, rec_lat, car_red, red_car, vec_in_list, points_in_segment
 from yambopy.units import atomic_mass
 from yambopy.tools.string import marquee
 from qepy.lattice import Path
@@ -115,6 +115,8 @@ class YamboLatticeDB(object):
     def iku_kpoints(self,value):
         if hasattr(self,"_red_kpoints"): delattr(self,"_red_kpoints")
         if hasattr(self,"_car_kpoints"): delattr(self,"_car_kpoints")
+        if hasattr(self,"_replicated_car_kpoints"): delattr(self,"_replicated_car_kpoints")
+        if hasattr(self,"_path_cache"): delattr(self,"_path_cache")
         self._iku_kpoints = value
 
     @property
@@ -144,7 +146,7 @@ class YamboLatticeDB(object):
     def car_kpoints(self):
         """convert form internal yambo units to cartesian lattice units"""
         if not hasattr(self,"_car_kpoints"):
-            self._car_kpoints = np.array([ k/self.alat for k in self.iku_kpoints ])
+            self._car_kpoints = np.array(self.iku_kpoints)/self.alat
         return self._car_kpoints
 
     @property
@@ -192,13 +194,33 @@ class YamboLatticeDB(object):
             time_rev_list[i] = ( i >= self.nsym/(self.time_rev+1) )
         return time_rev_list
 
-    def expand_kpoints(self,atol=1e-6,verbose=0):
+    def expand_kpoints(self,atol=1e-6,verbose=0,batched=True):
         """
         Take a list of qpoints and symmetry operations and return the full brillouin zone
         with the corresponding index in the irreducible brillouin zone
+
+        Arguments:
+            atol:    tolerance used to decide if two kpoints are the same
+            batched: apply all the symmetries to all the kpoints at once (default)
+                     if False use the original point by point loop
         """
+        if batched:
+            kpoints_full, kpoints_indexes, symmetry_indexes, weights = self._expand_kpoints_batched(atol)
+        else:
+            kpoints_full, kpoints_indexes, symmetry_indexes, weights = self._expand_kpoints_loop(atol)
+
+        if verbose: print("%d kpoints expanded to %d"%(len(self.car_kpoints),len(kpoints_full)))
+
+        #set the variables
+        self.weights_ibz      = np.array(weights)
+        self.kpoints_indexes  = np.array(kpoints_indexes)
+        self.symmetry_indexes = np.array(symmetry_indexes)
+        self.iku_kpoints      = np.array(kpoints_full)*self.alat
 
-        #check if the kpoints were already exapnded
+    def _expand_kpoints_loop(self,atol=1e-6):
+        """
+        Expand the kpoints applying one symmetry to one kpoint at a time
+        """
         kpoints_indexes  = []
         kpoints_full     = []
         symmetry_indexes = []
@@ -234,67 +256,109 @@ class YamboLatticeDB(object):
         for nk in kpoints_full_i:
             weights[nk] = float(len(kpoints_full_i[nk]))/nkpoints_full
 
-        if verbose: print("%d kpoints expanded to %d"%(len(self.car_kpoints),len(kpoints_full)))
+        return np.array(kpoints_full), kpoints_indexes, symmetry_indexes, weights
 
-        #set the variables
-        self.weights_ibz      = np.array(weights)
-        self.kpoints_indexes  = np.array(kpoints_indexes)
-        self.symmetry_indexes = np.array(symmetry_indexes)
-        self.iku_kpoints      = [k*self.alat for k in kpoints_full]
+    def _expand_kpoints_batched(self,atol=1e-6):
+        """
+        Expand the kpoints applying all the symmetries to all the kpoints in one operation
+
+        The star of each kpoint has at most nsym elements so the duplicates are found
+        comparing the images of the same kpoint among themselves,
+        which gives the same result as the point by point loop.
+        """
+        car_kpoints = np.array(self.car_kpoints)
+        nkpoints = len(car_kpoints)
+        nsym = self.nsym
+
+        #apply all the symmetries to all the kpoints: new_k[nk,ns] = sym[ns].k[nk]
+        new_k = np.einsum('sij,kj->ksi',self.sym_car,car_kpoints)
+
+        #fold to [0,1) in reduced coordinates
+        k_bz = (car_red(new_k,self.rlat)+atol)%1
+
+        #same criterion as vec_in_list: |a-b| <= atol + atol*|b| with b the image kept first
+        kept = np.zeros([nkpoints,nsym],dtype=bool)
+        kept[:,0] = True
+        for ns in range(1,nsym):
+            diff = np.abs(k_bz[:,:ns]-k_bz[:,ns,None])
+            same = np.all(diff <= atol + atol*np.abs(k_bz[:,:ns]),axis=2)
+            kept[:,ns] = ~np.any(same & kept[:,:ns],axis=1)
+
+        #the order of the loop is kpoint first and then symmetry
+        kpoints_indexes, symmetry_indexes = np.nonzero(kept)
+        kpoints_full = new_k[kpoints_indexes,symmetry_indexes]
+
+        #calculate the weights of each of the kpoints in the irreducible brillouin zone
+        nkpoints_full = len(kpoints_full)
+        weights = np.zeros([nkpoints_full])
+        weights[:nkpoints] = kept.sum(axis=1)/float(nkpoints_full)
+
+        return kpoints_full, kpoints_indexes, symmetry_indexes, weights
+
+    @property
+    def replicated_car_kpoints(self):
+        """
+        kpoints of the full mesh repeated in the neighbouring brillouin zones (in-plane)
+        returns the cartesian coordinates and the index of the kpoint in the mesh
+        """
+        if not hasattr(self,"_replicated_car_kpoints"):
+            shifts = red_car([np.array([x,y,z]) for x,y,z in product(list(range(-1,2)),list(range(-1,2)),list(range(1)))],self.rlat)
+            car_kpoints = np.array(self.car_kpoints)
+            kpoints = (shifts[:,None,:]+car_kpoints[None,:,:]).reshape(-1,3)
+            indexes = np.tile(np.arange(len(car_kpoints)),len(shifts))
+            self._replicated_car_kpoints = (kpoints, indexes)
+        return self._replicated_car_kpoints
 
     def get_path(self,path,debug=False):
         """
         Obtain a list of indexes and kpoints that belong to the regular mesh
+
+        The mesh repeated in the neighbouring brillouin zones is computed once
+        and the result of each path is cached so that repeated queries are cheap
         """
         if isinstance(path,Path):
-            path = path.get_klist()
+            path = path.get_klist()[:,:3]
 
         #points in cartesian coordinates
         path_car = red_car(path, self.rlat)
 
-        #find the points along the high symmetry lines
-        distance = 0
-        bands_kpoints = []
-        bands_indexes = []
+        if not hasattr(self,"_path_cache"): self._path_cache = {}
+        path_key = tuple(np.round(path_car,8).flatten())
 
-        #for all the paths
-        for k in range(len(path)-1):
+        if path_key not in self._path_cache:
+            kpoints_rep, indexes_rep = self.replicated_car_kpoints
 
-            # store here all the points in the path
-            # key:   has the coordinates of the kpoint rounded to 4 decimal places
-            # value: index of the kpoint
-            #        distance to the starting kpoint
-            #        the kpoint cordinate
-            kpoints_in_path = {}
+            #find the points along the high symmetry lines
+            bands_kpoints = []
+            bands_indexes = []
 
-            start_kpt = path_car[k]   #start point of the path
-            end_kpt   = path_car[k+1] #end point of the path
+            #for all the paths
+            for k in range(len(path)-1):
 
-            #generate repetitions of the brillouin zone
-            for x,y,z in product(list(range(-1,2)),list(range(-1,2)),list(range(1))):
+                start_kpt = path_car[k]   #start point of the path
+                end_kpt   = path_car[k+1] #end point of the path
 
-                #shift the brillouin zone
-                shift = red_car([np.array([x,y,z])],self.rlat)[0]
+                #points along the path sorted acoording to distance to the start of the path
+                in_path = points_in_segment(start_kpt,end_kpt,kpoints_rep)
 
-                #iterate over all the kpoints
-                for index, kpt in enumerate(self.car_kpoints):
+                #the same point can be found in more than one repetition of the brillouin zone
+                #keep only one per coordinates rounded to 4 decimal places (the last found)
+                keys = np.round(kpoints_rep[in_path],4)
+                _, last = np.unique(keys[::-1],axis=0,return_index=True)
+                in_path = in_path[np.sort(len(in_path)-1-last)]
 
-                    kpt_shift = kpt+shift #shift the kpoint
+                bands_kpoints.extend( kpoints_rep[in_path] )
+                bands_indexes.extend( indexes_rep[in_path] )
 
-                    #if the point is collinear we add it
-                    if isbetween(start_kpt,end_kpt,kpt_shift):
-                        key = tuple([round(kpt,4) for kpt in kpt_shift])
-                        value = [ index, np.linalg.norm(start_kpt-kpt_shift), kpt_shift ]
-                        kpoints_in_path[key] = value
+            self._path_cache[path_key] = (bands_kpoints, [int(i) for i in bands_indexes])
 
-            #sort the points acoording to distance to the start of the path
-            kpoints_in_path = sorted(list(kpoints_in_path.values()),key=lambda i: i[1])
+        bands_kpoints, bands_indexes = self._path_cache[path_key]
+        bands_kpoints = list(bands_kpoints)
+        bands_indexes = list(bands_indexes)
 
-            #for all the kpoints in the path
-            for index, disp, kpt in kpoints_in_path:
-                bands_kpoints.append( kpt )
-                bands_indexes.append( index )
-                if debug: print(("%12.8lf "*3)%tuple(kpt), index)
+        if debug:
+            for kpt, index in zip(bands_kpoints,bands_indexes):
+                print(("%12.8lf "*3)%tuple(kpt), index)
 
         self.bands_kpoints = bands_kpoints
         self.bands_indexes = bands_indexes
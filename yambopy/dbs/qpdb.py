@@ -33,28 +33,65 @@ class YamboQPDB():
         self.qpz          = np.array(qps['Z']).real
 
     @property
-    def eigenvalues_qp(self):
-        if not hasattr(self,'_eigenvalues_qp'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
-        return self._eigenvalues_qp
+    def qp_arrays(self):
+        """Arrays (eigenvalues_dft, eigenvalues_qp, lifetimes, z) with shape (nkpoints,nbands) built once"""
+        if not hasattr(self,'_qp_arrays'):
+            self._qp_arrays = self.get_qps()
+        return self._qp_arrays
 
     @property
     def eigenvalues_dft(self):
-        if not hasattr(self,'_eigenvalues_dft'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
-        return self._eigenvalues_dft
+        return self.qp_arrays[0]
+
+    @property
+    def eigenvalues_qp(self):
+        return self.qp_arrays[1]
 
     @property
     def lifetimes(self):
-        if not hasattr(self,'_lifetimes'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
-        return self._lifetimes
+        return self.qp_arrays[2]
 
     @property
     def z(self):
-        if not hasattr(self,'_z'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
-        return self._z
+        return self.qp_arrays[3]
+
+    @property
+    def qp_table(self):
+        """
+        Structured array with one entry per QP state and fields
+        kpoint, band, e0, e, linewidth and z (energies in eV)
+        """
+        if not hasattr(self,'_qp_table'):
+            dtype = [('kpoint',int),('band',int),('e0',float),('e',float),('linewidth',float),('z',float)]
+            table = np.zeros(self.nqps,dtype=dtype)
+            table['kpoint']    = self.kpoint_index
+            table['band']      = self.band_index
+            table['e0']        = self.e0
+            table['e']         = self.e
+            table['linewidth'] = self.linewidths
+            table['z']         = self.qpz
+            self._qp_table = table
+        return self._qp_table
+
+    def get_qp_mask(self,min_band=None,max_band=None,kpoints=None):
+        """
+        Boolean mask of the QP states with bands between min_band and max_band (both included)
+        and with kpoint index in kpoints
+        """
+        mask = np.ones(self.nqps,dtype=bool)
+        if min_band: mask &= self.band_index >= min_band
+        if max_band: mask &= self.band_index <= max_band
+        if kpoints is not None: mask &= np.isin(self.kpoint_index,kpoints)
+        return mask
+
+    def get_qp_table(self,min_band=None,max_band=None,kpoints=None,order=None):
+        """
+        Get the entries of qp_table with the bands between min_band and max_band and kpoint index in kpoints
+        sorted by the fields in order (e.g. 'e0' or ['kpoint','band'])
+        """
+        table = self.qp_table[self.get_qp_mask(min_band,max_band,kpoints)]
+        if order is not None: table = np.sort(table,order=order)
+        return table
 
     @classmethod
     def from_db(cls,filename='ndb.QP',folder='.'):
@@ -71,46 +108,28 @@ class YamboQPDB():
     
     def get_qps(self):
         """
-        Get quasiparticle energies in a list
+        Get quasiparticle energies, linewidths and Z factors in arrays with shape (nkpoints,nbands)
         """
-        #start arrays
-
-        # AMS: I changed the way we define the arrays. Hope is not breaking other things
-
         ncalculatedkpoints = self.max_kpoint - self.min_kpoint + 1
+        shape = [ncalculatedkpoints,self.nbands]
 
-        eigenvalues_dft = np.zeros([ncalculatedkpoints,self.nbands])
-        eigenvalues_qp  = np.zeros([ncalculatedkpoints,self.nbands])
-        linewidths      = np.zeros([ncalculatedkpoints,self.nbands])
-
-        #old
-        #eigenvalues_dft = np.zeros([self.nkpoints,self.nbands])
-        #eigenvalues_qp  = np.zeros([self.nkpoints,self.nbands])
-        #linewidths      = np.zeros([self.nkpoints,self.nbands])
-        z               = np.zeros([self.nkpoints,self.nbands])
-        for ei,e0i,li,zi,ki,ni in zip(self.e,self.e0,self.linewidths,self.qpz,self.kpoint_index,self.band_index):
-
-            # position in array
-            nkpoint = ki - self.min_kpoint 
-            nband   = ni - self.min_band
+        # position in array
+        nkpoint = self.kpoint_index - self.min_kpoint
+        nband   = self.band_index - self.min_band
 
-            eigenvalues_dft[nkpoint,nband] = e0i
-            eigenvalues_qp[nkpoint,nband]  = ei
-            linewidths[nkpoint,nband]      = li
-            z[nkpoint,nband]               = zi
+        arrays = []
+        for values in [self.e0,self.e,self.linewidths,self.qpz]:
+            array = np.zeros(shape)
+            array[nkpoint,nband] = values
+            arrays.append(array)
+        eigenvalues_dft, eigenvalues_qp, linewidths, z = arrays
 
         return eigenvalues_dft, eigenvalues_qp, linewidths, z
 
     def get_filtered_qps(self,min_band=None,max_band=None):
-        """Return selected QP energies as a flat list"""
-        e0=[]; qp=[]; lw=[]
-        for ei,e0i,li,ki,ni in zip(self.e,self.e0,self.linewidths,self.kpoint_index,self.band_index):
-            if min_band and ni < min_band: continue
-            if max_band and ni > max_band: continue
-            e0.append(e0i)
-            qp.append(ei)
-            lw.append(lw)
-        return e0,qp,lw
+        """Return selected QP energies as flat arrays"""
+        mask = self.get_qp_mask(min_band,max_band)
+        return self.e0[mask], self.e[mask], self.linewidths[mask]
 
     def get_direct_gaps(self,valence):
         """
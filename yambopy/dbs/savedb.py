@@ -12,6 +12,7 @@ from yambopy.plot import *
 from yambopy.tools.string import marquee
 from yambopy.lattice import isbetween, car_red, red_car, rec_lat, vol_lat
 from yambopy.units import ha2ev
+from yambopy.tools.funcs import occupations, find_fermi
 
 max_exp = 50
 atol = 1e-3
@@ -205,48 +206,24 @@ class YamboSaveDB():
             self._efermi = self.get_fermi
         return self._efermi
 
-    def get_fermi(self,inv_smear=0.001,verbose=0):
+    def get_fermi(self,inv_smear=0.001,verbose=0,smearing='fermi-dirac',order=1):
         """ Determine the fermi energy
-        """
-        from scipy.optimize import bisect
 
+            Arguments:
+                inv_smear: width of the smearing in eV
+                smearing: 'fermi-dirac', 'gaussian' or 'methfessel-paxton' (see tools.funcs.occupations)
+                order: order of the methfessel-paxton smearing
+        """
         kpts, nks, nss = self.expand_kpts()
 
-        def fermi(e):
-            """ fermi dirac function
-            """
-            if e > max_exp:
-                return 0
-            elif e < -max_exp:
-                return 1
-            return 1/(np.exp(e)+1)
-
-        def fermi_array(e_array,ef):
-            """ Fermi dirac function for an array
-            """
-            e_array = (e_array-ef)/inv_smear
-            return [ fermi(e) for e in e_array]
-
-        def occupation_minus_ne(ef):
-            """ The total occupation minus the total number of electrons
-            """
-            if self.spinor == 1:
-               return sum([sum(self.spin_degen*fermi_array(self.eigenvalues[nk],ef))*self.weights[nk] for nk in range(self.nkpoints)])-self.electrons
-            elif self.spinor == 2:
-               sum_up = sum([sum(self.spin_degen*fermi_array(self.eigenvalues[0,nk],ef))*self.weights[nk] for nk in range(self.nkpoints)]) 
-               sum_dw = sum([sum(self.spin_degen*fermi_array(self.eigenvalues[1,nk],ef))*self.weights[nk] for nk in range(self.nkpoints)]) 
-               return sum_up + sum_dw -self.electrons
-
-        efermi = bisect(occupation_minus_ne,self.min_eival,self.max_eival)
+        #the weights are the same for both spin channels
+        weights = self.spin_degen*self.weights[None,:,None]
+        efermi = find_fermi(self.eigenvalues,weights,self.electrons,inv_smear,smearing,order)
 
         if verbose: print("fermi: %lf eV"%efermi)
 
         self.eigenvalues -= efermi
-
-        self.occupations = np.zeros([self.spinor,self.nkpoints,self.nbands],dtype=np.float32)
-        for nspin in range(self.spinor):
-            for nk in range(self.nkpoints):
-                self.occupations[nspin,nk] = fermi_array(self.eigenvalues[nspin,nk,:self.nbands],0)
+        self.occupations = occupations(self.eigenvalues[:,:,:self.nbands],0,inv_smear,smearing,order,max_exp).astype(np.float32)
 
         return efermi
 
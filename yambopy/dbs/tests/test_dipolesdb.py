@@ -5,6 +5,7 @@
 #
 import unittest
 import os
+import numpy as np
 from yambopy.dbs.dipolesdb import YamboDipolesDB
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.electronsdb import YamboElectronsDB
@@ -28,9 +29,40 @@ class TestYamboDipolesDB(unittest.TestCase):
         dipoles = YamboDipolesDB(lat,save=test_path,dip_type='P')
 
         #calculate epsilon
-        dipoles.ip_eps2(electrons)
+        freq, eps2 = dipoles.ip_eps2(electrons)
+
+        #all the polarizations at once and using the histogram of the transitions
+        freq, eps2_pol = dipoles.ip_eps2(electrons,pol=None,max_memory=1)
+        freq, eps2_hist = dipoles.ip_eps2(electrons,pol=None,mode='histogram')
+        np.testing.assert_allclose(eps2,eps2_pol[1])
+        np.testing.assert_allclose(eps2_hist,eps2_pol,atol=1e-2*np.max(eps2_pol))
 
         print(dipoles)
 
+    def test_lazy_dipoles(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+        electrons = YamboElectronsDB(lat,save=test_path) 
+
+        #the lazy view rotates the dipoles only when they are accessed
+        dipoles = YamboDipolesDB(lat,save=test_path,dip_type='iR')
+        lazy = YamboDipolesDB(lat,save=test_path,dip_type='iR',expand=False)
+        np.testing.assert_allclose(dipoles.dipoles[3],lazy.dipoles[3])
+        np.testing.assert_allclose(dipoles.dipoles[:,1,20],lazy.dipoles[:,1,20])
+
+        dipoles.normalize(electrons)
+        lazy.normalize(electrons)
+        np.testing.assert_allclose(dipoles.dipoles,np.array(lazy.dipoles))
+
+    def test_fragments(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+
+        #the fragments read concurrently are the same as the ones read serially
+        serial = YamboDipolesDB(lat,save=test_path,dip_type='iR',expand=False,parallel='serial')
+        for parallel in ['thread','process']:
+            dipoles = YamboDipolesDB(lat,save=test_path,dip_type='iR',expand=False,parallel=parallel,nworkers=2)
+            np.testing.assert_array_equal(dipoles.dipoles_ibz,serial.dipoles_ibz)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,38 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import numpy as np
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.electronsdb import YamboElectronsDB
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','ip','SAVE')
+
+class TestYamboElectronsDB(unittest.TestCase):
+
+    def setUp(self):
+        self.lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+
+    def test_jdos(self):
+        electrons = YamboElectronsDB(self.lat,save=test_path)
+
+        #joint density of states with the fft convolution
+        x, jdos = electrons.getJDOS(broad=0.1,emin=0,emax=10)
+        x, jdos_fft = electrons.getJDOS(broad=0.1,emin=0,emax=10,mode='fft')
+        np.testing.assert_allclose(jdos_fft,jdos,atol=1e-3*np.max(jdos))
+
+    def test_fermi(self):
+        #fermi energy for several smearings at once
+        fermi_sweep = YamboElectronsDB(self.lat,save=test_path).getFermi([0.1,0.5])
+        for smearing in ['fermi-dirac','gaussian','methfessel-paxton']:
+            electrons = YamboElectronsDB(self.lat,save=test_path)
+            fermi = electrons.getFermi(0.1,smearing=smearing)
+            nelectrons = electrons.spin_degen*np.sum(electrons.occupations_ibz*electrons.weights_ibz[:,None])
+            self.assertAlmostEqual(nelectrons,electrons.nelectrons,places=4)
+        self.assertAlmostEqual(fermi_sweep[0],YamboElectronsDB(self.lat,save=test_path).getFermi(0.1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import os
+from netCDF4 import Dataset
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.elphondb import YamboElectronPhononDB
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','ip','SAVE')
+
+def write_elph_dbs(folder,nqpoints,nkpoints,nmodes,nbands):
+    """
+    Write a ndb.elph_gkkp database with random matrix elements and return them as gkkp[q][k][mode][ib1][ib2]
+    """
+    gkkp = np.random.rand(nqpoints,nkpoints,nmodes,nbands,nbands,2).astype(np.float32)
+    with Dataset(os.path.join(folder,'ndb.elph_gkkp'),'w') as database:
+        database.createDimension('D_3',3)
+        database.createDimension('nq',nqpoints)
+        database.createDimension('npars',4)
+        database.createVariable('PH_Q','f8',('D_3','nq'))[:] = np.random.rand(3,nqpoints)
+        database.createVariable('PARS','f8',('npars',))[:] = [nmodes,nqpoints,nkpoints,nbands]
+    for iq in range(nqpoints):
+        with Dataset(os.path.join(folder,'ndb.elph_gkkp_fragment_%d'%(iq+1)),'w') as database:
+            dims = ('nk','nmodes','nb1','nb2','complex')
+            for dim,n in zip(dims,gkkp.shape[1:]): database.createDimension(dim,n)
+            database.createVariable('ELPH_GKKP_Q%d'%(iq+1),'f4',dims)[:] = gkkp[iq]
+    return gkkp[...,0]+1j*gkkp[...,1]
+
+class TestYamboElectronPhononDB(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def test_streaming(self):
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+        nqpoints, nkpoints, nmodes, nbands = 4, lat.nkpoints, 6, 5
+        gkkp = write_elph_dbs(self.folder,nqpoints,nkpoints,nmodes,nbands)
+
+        elph = YamboElectronPhononDB(lat,folder_gkkp=self.folder)
+        elph.read_elph()
+        np.testing.assert_allclose(elph.gkkp,gkkp,rtol=1e-6)
+
+        #stream a band window and a subset of modes
+        modes = [1,4]
+        for iq, gkkp_q in elph.iter_elph(ib_rnge=[1,3],modes=modes,prefetch=2):
+            np.testing.assert_allclose(gkkp_q,gkkp[iq][:,modes,1:4,1:4],rtol=1e-6)
+
+        #reduction without storing all the matrix elements
+        g2 = elph.reduce_elph(prefetch=0)
+        ref = np.sum(np.abs(np.diagonal(gkkp,axis1=3,axis2=4))**2,axis=(0,2))
+        np.testing.assert_allclose(g2,ref,rtol=1e-5)
+
+        #fixed electronic states
+        elph.read_elph(ib1=2,ib2=3)
+        np.testing.assert_allclose(elph.gkkp,gkkp[:,:,:,2,3],rtol=1e-6)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+if __name__ == '__main__':
+    unittest.main()
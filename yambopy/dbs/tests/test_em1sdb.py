@@ -0,0 +1,92 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from yambopy.dbs.em1sdb import YamboStaticScreeningDB
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw','SAVE')
+
+def write_em1s(folder,X,iku_gvectors,iku_qpoints,filename='ndb.em1s'):
+    """
+    Write a static screening database with the matrices vX of each q-point in the yambo format
+    """
+    nqpoints, ng, ng = X.shape
+    with Dataset(os.path.join(folder,filename),'w') as database:
+        database.createDimension('D_3',3)
+        database.createDimension('D_ng',ng)
+        database.createDimension('D_nq',nqpoints)
+        database.createDimension('D_pars',3)
+        database.createVariable('X_PARS_1','f8',('D_pars',))[:] = [ng,10,1]
+        database.createVariable('X_RL_vecs','f8',('D_3','D_ng'))[:] = iku_gvectors.T
+        database.createVariable('HEAD_QPT','f8',('D_3','D_nq'))[:] = iku_qpoints.T
+    for nq in range(nqpoints):
+        with Dataset(os.path.join(folder,'%s_fragment_%d'%(filename,nq+1)),'w') as database:
+            database.createDimension('D_1',1)
+            database.createDimension('D_2',2)
+            database.createDimension('D_ng',ng)
+            X_q = database.createVariable('X_Q_%d'%(nq+1),'f4',('D_1','D_2','D_ng','D_ng'))
+            X_q[0,0] = X[nq].real
+            X_q[0,1] = X[nq].imag
+
+class TestYamboStaticScreeningDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        np.random.seed(0)
+        nqpoints, ng = 5, 9
+        self.iku_gvectors = np.array([[i,j,k] for i in range(-1,2) for j in range(-1,2) for k in range(-1,2)])[:ng]
+        iku_qpoints = np.random.rand(nqpoints,3)
+        X = 0.3*(np.random.rand(nqpoints,ng,ng)+1j*np.random.rand(nqpoints,ng,ng))
+        write_em1s(self.tmp,X,self.iku_gvectors,iku_qpoints)
+
+        self.em1s = YamboStaticScreeningDB(save=test_path,em1s=self.tmp)
+        self.assertEqual((self.em1s.nqpoints,self.em1s.ngvectors),(nqpoints,ng))
+        np.testing.assert_allclose(self.em1s.X,X,atol=1e-6)
+        self.inv = np.linalg.inv(np.eye(ng)+self.em1s.X.astype(complex))
+
+    def test_eps_slice(self):
+        em1s = self.em1s
+        slices = [(None,[0]),([0],[0]),([1,3,5],[0,2]),([4],[0,1,2,3,7]),(None,None)]
+        for rows,cols in slices:
+            if cols is None: cols = np.arange(em1s.ngvectors)
+            eps = em1s.get_eps_slice(rows=rows,cols=cols)
+            ref = self.inv[:,np.arange(em1s.ngvectors) if rows is None else rows][:,:,cols]
+            np.testing.assert_allclose(eps,ref,atol=1e-12)
+
+        #subset of q-points, blocks of q-points and single precision
+        eps = em1s.get_eps_slice(rows=[1,2],cols=[0,8],qpoints=[4,1],max_memory=1e-5)
+        np.testing.assert_allclose(eps,self.inv[[4,1]][:,[1,2]][:,:,[0,8]],atol=1e-12)
+        eps = em1s.get_eps_slice(rows=[1,2],cols=[3],single=True)
+        self.assertEqual(eps.dtype,np.complex64)
+        np.testing.assert_allclose(eps,self.inv[:,[1,2]][:,:,[3]],atol=1e-5)
+
+        #the head as a function of |q|
+        x, y = em1s._geteq()
+        order = np.argsort(np.linalg.norm(em1s.car_qpoints,axis=1))
+        np.testing.assert_allclose(y,self.inv[order,0,0],atol=1e-12)
+
+    def test_g_indexes(self):
+        em1s = self.em1s
+        gvectors = em1s.gvectors
+        np.testing.assert_array_equal(em1s.iku_gvectors,self.iku_gvectors)
+        indexes = em1s.get_g_indexes([gvectors[3],[5,5,5],gvectors[0],gvectors[8]+0.3/em1s.alat,gvectors[8]])
+        np.testing.assert_array_equal(indexes,[3,-1,0,-1,8])
+        self.assertEqual(list(em1s.get_g_indexes(gvectors)),list(range(em1s.ngvectors)))
+        self.assertEqual(list(em1s.get_g_indexes(np.zeros([0,3]))),[])
+
+        #single gvectors
+        self.assertEqual(em1s.get_g_index(gvectors[5]),5)
+        self.assertIsNone(em1s.get_g_index([0,0,1]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -40,16 +40,39 @@ class TestYamboExcitonDB(unittest.TestCase):
         #calculate chi
         w,chi = exc.get_chi()
 
+        #the result does not depend on the size of the blocks of excitons
+        w,chi_blocks = exc.get_chi(max_memory=1e-3)
+        np.testing.assert_allclose(chi,chi_blocks,rtol=1e-5)
+
         #load reference
         eps_filename = os.path.join(test_path,'o-yambo.eps_q1_diago_bse')
         w_ref,chi_imag_ref,chi_real_ref = np.loadtxt(eps_filename,unpack=True)[:3]
 
+        #get weights and transitions of each exciton
+        weights = exc.get_exciton_weights((1,2),sum_excitons=False)
+        transitions = exc.get_exciton_transitions((1,2),sum_excitons=False)
+        np.testing.assert_allclose(np.sum(weights,axis=0),exc.get_exciton_weights((1,2)))
+        np.testing.assert_allclose(np.sum(transitions,axis=(1,2,3)),[1,1],atol=1e-3)
+
         #get amplitude and phases
         kpoints, amplitude, phase = exc.get_amplitudes_phases((1,0,))
 
         #exciton_bandstructure
         exc.plot_exciton_bs(electrons, path, (1,2,), args_plot={'c':'g'},space='bands',show=False)
 
+    def test_lazy_eigenvectors(self):
+
+        lat  = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        exc  = YamboExcitonDB.from_db_file(lat,folder=os.path.join(test_path,'yambo'))
+        lazy = YamboExcitonDB.from_db_file(lat,folder=os.path.join(test_path,'yambo'),lazy=True,cache_size=2)
+
+        np.testing.assert_allclose(exc.eigenvectors[3],lazy.eigenvectors[3])
+        np.testing.assert_allclose(exc.eigenvectors,np.array(lazy.eigenvectors))
+        np.testing.assert_allclose(exc.get_exciton_weights((1,2,3)),lazy.get_exciton_weights((1,2,3)))
+        assert len(lazy.eigenvectors._cache) == 2
+
+        lazy.eigenvectors.close()
+
     def tearDown(self):
         if os.path.isfile('exc_I.dat'): os.remove('exc_I.dat')
         if os.path.isfile('exc_E.dat'): os.remove('exc_E.dat')
@@ -0,0 +1,114 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from scipy.optimize import bisect, newton
+from scipy.interpolate import interp1d
+from yambopy.dbs.greendb import YamboGreenDB
+
+def write_green(filename,e0,se,bands):
+    """
+    Write a ndb.G database with the self-energies se(w) on a grid around the bare energies
+    """
+    w = e0[:,None]+np.linspace(-4,4,401)[None,:]
+    sigma = np.array([f(x,e) for f,x,e in zip(se,w,e0)])
+    green = 1./(w-e0[:,None]-sigma)
+    nqps, nenergies = w.shape
+    with Dataset(filename,'w') as database:
+        database.createDimension('D_2',2)
+        database.createDimension('D_3',3)
+        database.createDimension('D_energies',nenergies)
+        database.createDimension('D_qps',nqps)
+        for name,value in [('Green_Functions_Energies',w+0j),('Green_Functions',green),('SE_Operator',sigma)]:
+            database.createVariable(name,'f8',('D_2','D_energies','D_qps'))[:] = [value.real.T,value.imag.T]
+        database.createVariable('QP_table','f8',('D_3','D_qps'))[:] = [bands,bands,np.arange(1,nqps+1)]
+        database.createVariable('QP_kpts','f8',('D_3','D_qps'))[:] = np.zeros([3,nqps])
+
+def scalar_qp(green,e0,nqp,braket=None):
+    """
+    Solution of the quasiparticle equation of a single state as done by the original getQP
+    """
+    x = green.energies[nqp].real
+    y = green.se[nqp]
+    f = interp1d(x,y.real-x+e0[nqp],kind='slinear')
+    if braket: eqp = bisect(f,e0[nqp]-braket,e0[nqp]+braket)
+    else:      eqp = newton(f,e0[nqp],maxiter=200)
+    f = interp1d(x,y)
+    dx = 1e-8
+    dse = (f(eqp+dx)-f(eqp-dx))/(2*dx)
+    return eqp+1j*f(eqp).imag, 1./(1-dse)
+
+class TestYamboGreenDB(unittest.TestCase):
+
+    def setUp(self):
+        self.e0 = np.array([-1.0,2.0,0.5,3.0,1.0,0.0])
+        se = [lambda w,e: 0.2*(w-e)-0.3+0.05j,                      #linear, root at e0-0.375
+              lambda w,e: 0.2*(w-e)-0.3+0.05j,
+              lambda w,e: 0.5/(w-e+1.5+0.2j)-0.3+0.05j,               #pole below the bare energy
+              lambda w,e: 0.3*(w-e+0.51)*(w-e-3)+w-e+0.1j*w,          #roots at e0-0.51 and e0+3
+              lambda w,e: 2+w-e+0j,                                   #no root
+              lambda w,e: 0.2*(w-e)-0.3+0.05j]                      #band not requested
+        self.tmp = tempfile.mkdtemp()
+        write_green(os.path.join(self.tmp,'ndb.G'),self.e0,se,[1,2,1,2,1,3])
+        self.green = YamboGreenDB(folder=self.tmp)
+        self.assertEqual((self.green.nqps,self.green.nenergies),(6,401))
+        self.assertEqual((self.green.bandmin,self.green.bandmax),(1,3))
+
+    def getQP(self,**kwargs):
+        #the last state is outside the bands requested
+        return self.green.getQP(self.e0,bandmax=2,**kwargs)
+
+    def test_known_root(self):
+        eqp, z = self.getQP()
+        np.testing.assert_allclose(eqp[:2],self.e0[:2]-0.375+0.05j,atol=1e-10)
+        np.testing.assert_allclose(z[:2],1.25,atol=1e-10)
+        self.assertEqual(list(self.green.converged),[True,True,True,True,False,False])
+
+        #the states without solution keep the bare energy
+        self.assertEqual((eqp[4],z[4]),(1.0,1))
+        self.assertEqual((eqp[5],z[5]),(0,0))
+
+    def test_scalar(self):
+        eqp, z = self.getQP()
+        for nqp in [0,1,2,3]:
+            eqp_ref, z_ref = scalar_qp(self.green,self.e0,nqp)
+            self.assertAlmostEqual(eqp[nqp],eqp_ref,places=6)
+            self.assertAlmostEqual(z[nqp],z_ref,places=4)
+
+    def test_braket(self):
+        #only the root at e0-0.51 is inside the braket
+        eqp, z = self.getQP(braket=1.0)
+        for nqp in [0,1,2,3]:
+            eqp_ref, z_ref = scalar_qp(self.green,self.e0,nqp,braket=1.0)
+            self.assertAlmostEqual(eqp[nqp],eqp_ref,places=6)
+            self.assertAlmostEqual(z[nqp],z_ref,places=4)
+        self.assertAlmostEqual(eqp[3].real,2.49,places=4)
+
+        #no root close enough
+        eqp, z = self.getQP(braket=0.02)
+        self.assertFalse(np.any(self.green.converged))
+        np.testing.assert_array_equal(eqp[:5],self.e0[:5])
+
+        #the blocks of states give the same result
+        eqp_block, z_block = self.getQP(max_memory=1e-4)
+        eqp, z = self.getQP()
+        np.testing.assert_array_equal(eqp_block,eqp)
+        np.testing.assert_array_equal(z_block,z)
+
+    def test_secant(self):
+        with self.assertWarns(DeprecationWarning):
+            eqp, z = self.getQP(secant=False,braket=1.0)
+        self.assertAlmostEqual(eqp[3].real,2.49,places=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@
 #
 import unittest
 import os
+import numpy as np
 from yambopy.dbs.latticedb import YamboLatticeDB
 from qepy.lattice import Path
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw_conv')
@@ -34,10 +35,29 @@ class TestYamboLatticeDB(unittest.TestCase):
                    [[0.5,0.0,0.0],'L']], [20,20,20])
         bands_kpoints, bands_indexes, path_car = ydb.get_path(p)
 
+        #the second query of the same path comes from the cache
+        bands_kpoints2, bands_indexes2, path_car2 = ydb.get_path(p)
+        assert bands_indexes == bands_indexes2
+        np.testing.assert_allclose(bands_kpoints,bands_kpoints2)
+
         print(ydb)
 
+    def test_expand_kpoints(self):
+        """ test that the batched and loop expansions of the kpoints agree """
+        for folder in ['gw_conv','ip']:
+            filename = os.path.join(test_path,'..',folder,'SAVE/ns.db1')
+            ydb_loop  = YamboLatticeDB.from_db_file(filename,Expand=False)
+            ydb_batch = YamboLatticeDB.from_db_file(filename,Expand=False)
+            ydb_loop.expand_kpoints(batched=False)
+            ydb_batch.expand_kpoints(batched=True)
+
+            np.testing.assert_array_equal(ydb_loop.kpoints_indexes,ydb_batch.kpoints_indexes)
+            np.testing.assert_array_equal(ydb_loop.symmetry_indexes,ydb_batch.symmetry_indexes)
+            np.testing.assert_allclose(ydb_loop.weights_ibz,ydb_batch.weights_ibz)
+            np.testing.assert_allclose(ydb_loop.iku_kpoints,ydb_batch.iku_kpoints)
+
     def tearDown(self): 
-        os.remove('lattice.json')
+        if os.path.isfile('lattice.json'): os.remove('lattice.json')
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,6 +5,7 @@
 #
 import unittest
 import os
+import numpy as np
 from yambopy.dbs.qpdb import YamboQPDB
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw')
 
@@ -18,6 +19,13 @@ class TestYamboQPDB(unittest.TestCase):
         #get qp dbb
         eigenvalues_qp, eingenvalues_dft, lifetimes, z = qpdb.get_qps()
 
+        #table of the qp states filtered and sorted
+        table = qpdb.get_qp_table(min_band=2,max_band=4,kpoints=[1,3],order='e0')
+        self.assertTrue(np.all(np.diff(table['e0']) >= 0))
+        self.assertTrue(np.all((table['band'] >= 2) & (table['band'] <= 4)))
+        self.assertEqual(set(table['kpoint']),{1,3})
+        np.testing.assert_array_equal(qpdb.eigenvalues_qp[table['kpoint']-qpdb.min_kpoint,table['band']-qpdb.min_band],table['e'])
+
         #plot bs
         qpdb.plot_bs(show=False)
 
@@ -0,0 +1,62 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import os
+from types import SimpleNamespace
+from netCDF4 import Dataset
+from yambopy.dbs.wfdb import YamboWFDB
+
+def write_wf_dbs(folder,nkpoints,nspin,ng,nbands):
+    """
+    Write ns.wf databases with random wavefunctions and return them as wf[k][spin][g][band]
+    """
+    wf = np.random.rand(nkpoints,nspin,ng,nbands)+1j*np.random.rand(nkpoints,nspin,ng,nbands)
+    Dataset(os.path.join(folder,'ns.wf'),'w').close()
+    for nk in range(nkpoints):
+        with Dataset(os.path.join(folder,'ns.wf_fragments_%d_1'%(nk+1)),'w') as database:
+            dims = ('nspin','ng','nbands')
+            for dim,n in zip(dims,wf.shape[1:]): database.createDimension(dim,n)
+            database.createVariable('WF_REAL_COMPONENTS_@_K%d_BAND_GRP_1'%(nk+1),'f4',dims)[:] = wf[nk].real
+            database.createVariable('WF_IM_COMPONENTS_@_K%d_BAND_GRP_1'%(nk+1),'f4',dims)[:] = wf[nk].imag
+    return wf.astype(np.complex64)
+
+class TestYamboWFDB(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.save = os.path.join(self.folder,'SAVE')
+        os.mkdir(self.save)
+
+    def test_lazy_wf(self):
+        savedb = SimpleNamespace(wfcgrid=None,gvectors=None,kpts_car=None,lat=None,rlat=None)
+        wf = write_wf_dbs(self.save,5,1,30,8)
+
+        ywf = YamboWFDB(savedb,save=self.save)
+        np.testing.assert_array_equal(ywf.wf,wf)
+
+        #lazy access with a band window
+        lazy = YamboWFDB(savedb,save=self.save,lazy=True,ib_rnge=[2,5],cache_size=2)
+        self.assertEqual(lazy.wf.shape,(5,1,30,4))
+        np.testing.assert_array_equal(lazy.wf[3],wf[3,:,:,2:6])
+        np.testing.assert_array_equal(lazy.wf[1:4,0,:,1],wf[1:4,0,:,3])
+        np.testing.assert_array_equal(np.array(lazy.wf),wf[...,2:6])
+
+        #update the band window in place and write a copy
+        lazy.write(wf=lambda nk: 2*lazy.wf[nk])
+        lazy.write(os.path.join(self.folder,'new'))
+        for path in [self.save,os.path.join(self.folder,'new')]:
+            new = YamboWFDB(savedb,save=path,single=False)
+            np.testing.assert_allclose(new.wf[...,2:6],2*wf[...,2:6],rtol=1e-6)
+            np.testing.assert_array_equal(new.wf[...,:2],wf[...,:2])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,20 +8,121 @@ import numpy as np
 import shutil
 import os
 from netCDF4 import Dataset
+from functools import partial
+from collections import OrderedDict
+from yambopy.dbs.fragments import YamboFragmentLoader
 
 def abs2(x):
     return x.real**2 + x.imag**2
 
+def _read_wf_fragment(database,n,bands=slice(None),dtype=np.complex64):
+    """
+    Read the wavefunctions [nspin,ng,nbands] of one kpoint in the band window bands
+    """
+    re = database.variables['WF_REAL_COMPONENTS_@_K%d_BAND_GRP_1'%(n+1)][...,bands]
+    im = database.variables['WF_IM_COMPONENTS_@_K%d_BAND_GRP_1'%(n+1)][...,bands]
+    wf = np.empty(re.shape,dtype=dtype)
+    wf.real, wf.imag = re, im
+    return wf
+
+class YamboWFLazy():
+    """
+    Lazy access to the wavefunctions stored in the ``ns.wf_fragments_*`` files
+
+    The fragments are opened when they are first accessed and wf[nk] reads only the
+    band window of the kpoint nk, the most recently used kpoints (and their open files)
+    are kept in memory.
+    Behaves as an array with shape (nkpoints,nspin,ng,nbands) for indexing.
+    """
+    def __init__(self,filenames,bands=slice(None),dtype=np.complex64,cache_size=8):
+        self.filenames = filenames
+        self.bands = bands
+        self.dtype = dtype
+        self.cache_size = cache_size
+        self._databases = OrderedDict()
+        self._cache = OrderedDict()
+
+        #get the size of the wavefunctions from the first kpoint
+        nspin, ng, nbands = self._database(0).variables['WF_REAL_COMPONENTS_@_K1_BAND_GRP_1'].shape
+        self._shape = (len(filenames),nspin,ng,len(range(nbands)[bands]))
+
+    @property
+    def shape(self): return self._shape
+
+    def __len__(self): return self.shape[0]
+
+    def _database(self,nk):
+        """ get the open database of the kpoint nk
+        """
+        if nk in self._databases:
+            self._databases.move_to_end(nk)
+            return self._databases[nk]
+        database = Dataset(self.filenames[nk])
+        self._databases[nk] = database
+        if len(self._databases) > self.cache_size:
+            self._databases.popitem(last=False)[1].close()
+        return database
+
+    def read(self,nk):
+        """ read the wavefunctions of the kpoint nk without using the cache
+        """
+        return _read_wf_fragment(self._database(nk),nk,self.bands,self.dtype)
+
+    def get(self,nk):
+        """ get the wavefunctions [nspin,ng,nbands] of the kpoint nk
+        """
+        nkpoints = len(self)
+        if not -nkpoints <= nk < nkpoints:
+            raise IndexError('Kpoint %d out of range, the database has %d kpoints'%(nk,nkpoints))
+        nk = int(nk)%nkpoints
+
+        if nk in self._cache:
+            self._cache.move_to_end(nk)
+            return self._cache[nk]
+
+        wf = self.read(nk)
+        self._cache[nk] = wf
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return wf
+
+    def __getitem__(self,index):
+        if not isinstance(index,tuple): index = (index,)
+        kpoints = np.arange(len(self))[index[0]]
+        if np.ndim(kpoints) == 0: return self.get(kpoints)[index[1:]]
+        return np.array([self.get(nk)[index[1:]] for nk in kpoints])
+
+    def __array__(self,dtype=None,copy=None):
+        return np.asarray(self[:],dtype=dtype)
+
+    def close(self):
+        self._cache.clear()
+        while self._databases:
+            self._databases.popitem()[1].close()
+
+    def __del__(self):
+        try: self.close()
+        except Exception: pass
+
 class YamboWFDB():
-    def __init__(self,savedb,path=None,save='SAVE',filename='ns.wf'):
+    def __init__(self,savedb,path=None,save='SAVE',filename='ns.wf',parallel='thread',nworkers=None,
+                 lazy=False,ib_rnge=None,single=True,cache_size=8):
         """
         load wavefunction from yambo
+
+        Arguments:
+            lazy       -> do not load the wavefunctions, read each kpoint from the file when it is needed
+            ib_rnge    -> [ib_i, ib_f] keep only the bands between ib_i and ib_f (both included)
+            single     -> store the wavefunctions in complex64 (the precision of the database), complex128 otherwise
+            cache_size -> number of kpoints kept in memory in the lazy mode
         """
         if path is None:
             self.path = save
         else:
             self.path = path+'/SAVE'
         self.filename = filename
+        self.bands = slice(None) if ib_rnge is None else slice(ib_rnge[0],ib_rnge[1]+1)
+        self.dtype = np.complex64 if single else np.complex128
         
         #take some data from savedb
         self.savedb   = savedb
@@ -32,29 +133,30 @@ class YamboWFDB():
         self.rlat = savedb.rlat
        
         #read wf 
-        self.read()
+        self.read(parallel=parallel,nworkers=nworkers,lazy=lazy,cache_size=cache_size)
         self.nkpoints, self.nspin, self.ng, self.nbands = self.wf.shape
 
-    def read(self):
+    def read(self,parallel='thread',nworkers=None,verbose=False,lazy=False,cache_size=8):
+        """
+        Read the wavefunctions of all the kpoints
+
+        The fragments are read concurrently (see YamboFragmentLoader)
+        or accessed lazily when needed if lazy is True (see YamboWFLazy)
+        """
         path = self.path
         filename = self.filename
 
-        wf = []
-        nk = 1
-        while True:
-            try:
-                fname = "%s/%s_fragments_%d_1"%(path,filename,nk)
-                database = Dataset(fname)
-                re = database.variables['WF_REAL_COMPONENTS_@_K%d_BAND_GRP_1'%nk][:]
-                im = database.variables['WF_IM_COMPONENTS_@_K%d_BAND_GRP_1'%nk][:]
-                a = re+1j*im
-                wf.append(a)
-                nk+=1
-            except:
-                if nk==1:
-                    raise IOError('Could not read %s'%fname)
-                break
-        self.wf = np.array(wf)
+        fragments = YamboFragmentLoader.from_pattern("%s/%s_fragments_%%d_1"%(path,filename),
+                                                     parallel=parallel,nworkers=nworkers,verbose=verbose)
+        if not len(fragments):
+            raise IOError('Could not read %s/%s_fragments_1_1'%(path,filename))
+
+        self.wf = YamboWFLazy(fragments.filenames,self.bands,self.dtype,cache_size)
+        if not lazy:
+            shape = self.wf.shape
+            self.wf.close()
+            self.wf = np.zeros(shape,dtype=self.dtype)
+            fragments.load(partial(_read_wf_fragment,bands=self.bands,dtype=self.dtype),self.wf)
         self.nkpoints, self.nspin, self.ng, self.nbands = self.wf.shape
 
     def get_wf_gvecs(self,kpoint=0):
@@ -69,29 +171,40 @@ class YamboWFDB():
 
         return gvecs
 
-    def write(self,path):
+    def write(self,path=None,wf=None):
         """
-        write the wavefunctions in new files
+        write the wavefunctions
+
+        The fragments are written one kpoint at a time. If path is None (or the folder of
+        this database) the fragments are updated in place, otherwise each fragment is
+        copied to path and updated before moving to the next one.
+        Only the bands in the band window are written.
+
+        Arguments:
+            wf -> array or function wf(nk) with the wavefunctions [nspin,ng,nbands] of each kpoint (default: self.wf)
         """
-        if os.path.isdir(path): shutil.rmtree(path)
-        os.mkdir(path)
+        if wf is None: wf = self.wf
+        get_wf = wf if callable(wf) else (lambda nk: np.array(wf[nk]))
 
-        #copy all the files
         oldpath = self.path
         filename = self.filename
-        shutil.copyfile("%s/%s"%(oldpath,filename),"%s/%s"%(path,filename))
-        for nk in range(self.nkpoints):
-            fname = "%s_fragments_%d_1"%(filename,nk+1)
-            shutil.copyfile("%s/%s"%(oldpath,fname),"%s/%s"%(path,fname))
+        if path is None or os.path.abspath(path) == os.path.abspath(oldpath):
+            path = oldpath
+        else:
+            if os.path.isdir(path): shutil.rmtree(path)
+            os.mkdir(path)
+            shutil.copyfile("%s/%s"%(oldpath,filename),"%s/%s"%(path,filename))
 
-        #edit with the new wfs
-        wf = self.wf
         for nk in range(self.nkpoints):
+            wf_k = get_wf(nk)
+            #the lazy reader can not have the fragment open while we write it
+            if isinstance(self.wf,YamboWFLazy): self.wf.close()
+
             fname = "%s_fragments_%d_1"%(filename,nk+1)
-            database = Dataset("%s/%s"%(path,fname),'r+')
-            database.variables['WF_REAL_COMPONENTS_@_K%d_BAND_GRP_1'%(nk+1)][:] = wf[nk].real
-            database.variables['WF_IM_COMPONENTS_@_K%d_BAND_GRP_1'%(nk+1)][:] = wf[nk].imag
-            db.close()
+            if path != oldpath: shutil.copyfile("%s/%s"%(oldpath,fname),"%s/%s"%(path,fname))
+            with Dataset("%s/%s"%(path,fname),'r+') as database:
+                database.variables['WF_REAL_COMPONENTS_@_K%d_BAND_GRP_1'%(nk+1)][...,self.bands] = wf_k.real
+                database.variables['WF_IM_COMPONENTS_@_K%d_BAND_GRP_1'%(nk+1)][...,self.bands] = wf_k.imag
         print('new wavefunctions written in %s'%path)
 
     def __str__(self):
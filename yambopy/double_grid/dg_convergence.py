@@ -4,6 +4,8 @@ from schedulerpy import *
 import os
 import subprocess
 from glob import glob
+import sys
+import pickle
 from copy import deepcopy
 import matplotlib.pyplot as plt
 
@@ -51,6 +53,9 @@ class YamboDG_Optimize():
       - nscf_out, y_out_dir: pw and yambo output directories
       - qe_scheduler,y_scheduler: SchedulerPy object for cluster submission (default: bash)
       - wait_all: if cluster submission is on, forces the master python process to wait for all sumbitted jobs to complete before exiting
+      - chain: if cluster submission is on, submit the whole tree at once (STEPS 1 to 3) using the dependencies
+               of the scheduler. The setup operations between the steps run as their own short jobs
+               (see branch_wise_flow) and with wait_all=False the master python process exits right away.
       - yambo_calc_type: name the yambo calculations
       - yambo_exec: either yambo, yambo_ph or yambo_rt
       - save_type: simple, elph, expanded_elph, fixsymm, fixsymm+elph
@@ -95,7 +100,7 @@ class YamboDG_Optimize():
     def __init__(self,cg_grids,fg_grids,prefix,nscf_input,ya_input,E_laser=0.,STEPS='all',RUN=True, converge_DG=False,\
                  scf_save_path='./scf',pseudo_path='./pseudos',RUN_path='./',nscf_out="nscf",y_out_dir="results",\
                  qe_scheduler=None,y_scheduler=None,wait_all=True,pw_exec_path='',yambo_exec_path='',\
-                 yambo_exec='yambo',save_type='simple',yambo_calc_type="yambo",noyambo=False):
+                 yambo_exec='yambo',save_type='simple',yambo_calc_type="yambo",noyambo=False,chain=False):
 
         #Configuring schedulers
         self.frontend = Scheduler.factory(scheduler="bash")
@@ -175,7 +180,12 @@ class YamboDG_Optimize():
         if converge_DG: self.yf.msg('#### DOUBLE GRID CONVERGENCE WORKFLOW ####')
         else: self.yf.msg('#### DOUBLE GRID WORKFLOW FOR %s CALCULATIONS ####'%self.yambo_calc_type)
         
-        self.driver(STEPS,RUN,nscf_out,y_out_dir,save_type,elph_path,yambo_exec_path,converge_DG)
+        if chain and self.wait_up:
+            self.yf.msg("------ STEPS 1-3: job chain ------")
+            self.setup_cg()
+            if RUN: self.run_chain(nscf_out,y_out_dir,save_type,elph_path,yambo_exec_path)
+        else:
+            self.driver(STEPS,RUN,nscf_out,y_out_dir,save_type,elph_path,yambo_exec_path,converge_DG)
         
         #End IO        
         self.yf.IO_close()
@@ -202,45 +212,14 @@ class YamboDG_Optimize():
         if STEPS=='2' or STEPS=='all':
             self.yf.msg("------  STEP 2 ------")
             for ig,cg in enumerate(self.cg_strings):
-                # NSCF status check
-                calc_dir  = '%s/%s_coarse_grid'%(self.nscf_dir,cg)            
-                calc = self.check_nscf_completed(calc_dir,nscf_out)
-                if calc: self.yf.msg("     NSCF CG %s found."%cg)
-                else: self.yf.msg("     NSCF CG %s NOT found."%cg)
-                # YAMBO status check
-                ycalc_dir = '%s/%s_coarse_grid'%(self.yambo_dir,cg)
-                ycalc = self.yambo_output_is_NOT_there(ycalc_dir,y_out_dir)
-                if ycalc: self.yf.msg("     YAMBO CG %s NOT found."%cg)
-                else: self.yf.msg("     YAMBO CG %s found."%cg)      
-                #          
-                if calc and ycalc:
-                    yambo_dir = '%s/%s_coarse_grid'%(self.yambo_dir,cg)
-                    CreateYamboSave(self.prefix,save_type=save_type,nscf=calc_dir,elph_path=elph_path,\
-                                    database=os.path.abspath(yambo_dir),yambo_exec_path=yambo_exec_path,printIO=False)
-                    self.setup_fg(calc_dir,yambo_dir,self.fg_grids[ig],self.fg_strings[ig])
+                self.setup_cg_branch(ig,nscf_out,y_out_dir,save_type,elph_path,yambo_exec_path)
             if RUN: self.run_jobs(nscf_out,y_out_dir)
                     
         if STEPS=='3' or STEPS=='all':
             self.yf.msg("------  STEP 3 ------")
             for ig,cg in enumerate(self.cg_strings):
                 for iff,fg in enumerate(self.fg_strings[ig]):
-                    # NSCF status check
-                    calc_dir  = '%s/%s_coarse_grid/%s'%(self.nscf_dir,cg,fg)
-                    calc = self.check_nscf_completed(calc_dir,nscf_out)
-                    if calc: self.yf.msg("     NSCF CG %s FG %s found."%(cg,fg))
-                    else: self.yf.msg("     NSCF CG %s FG %s NOT found."%(cg,fg))
-                    # YAMBO status check
-                    ycalc_dir = '%s/%s_coarse_grid/%s'%(self.yambo_dir,cg,fg)
-                    ycalc = self.yambo_output_is_NOT_there(ycalc_dir,y_out_dir)
-                    if ycalc: self.yf.msg("     YAMBO CG %s FG %s NOT found."%(cg,fg))
-                    else: self.yf.msg("     YAMBO CG %s FG %s found."%(cg,fg))   
-                    #      
-                    if calc and ycalc:
-                        yambo_dir = '%s/%s_coarse_grid/%s'%(self.yambo_dir,cg,fg)
-                        if not os.path.isfile('%s/SAVE/ndb.Double_Grid'%yambo_dir):
-                            CreateYamboSave(self.prefix,save_type='simple',nscf=calc_dir,elph_path=None,\
-                                            database="%s/dg_SAVE"%os.path.abspath(yambo_dir),yambo_exec_path=yambo_exec_path,printIO=False)
-                            self.setup_yambo_fg(yambo_dir,self.fg_grids[ig][iff],y_out_dir)
+                    self.setup_fg_branch(ig,iff,nscf_out,y_out_dir,yambo_exec_path)
             if RUN: self.run_jobs(nscf_out,y_out_dir)
         
         # This is a plotting routine in the ip case. It has to be updated to a full convergence analysis and report.
@@ -278,6 +257,49 @@ class YamboDG_Optimize():
             ip_labels = [ip for ip in ip_labels if ip != []]
             self.plot_ip_spectra(ip_data,ip_labels,self.E_laser)
         
+    def setup_cg_branch(self,ig,nscf_out,y_out_dir,save_type,elph_path,yambo_exec_path):
+        """ Setup of step 2 for a CG once its nscf is done: CG yambo SAVE and FG folder tree
+        """
+        cg = self.cg_strings[ig]
+        # NSCF status check
+        calc_dir  = '%s/%s_coarse_grid'%(self.nscf_dir,cg)            
+        calc = self.check_nscf_completed(calc_dir,nscf_out)
+        if calc: self.yf.msg("     NSCF CG %s found."%cg)
+        else: self.yf.msg("     NSCF CG %s NOT found."%cg)
+        # YAMBO status check
+        ycalc_dir = '%s/%s_coarse_grid'%(self.yambo_dir,cg)
+        ycalc = self.yambo_output_is_NOT_there(ycalc_dir,y_out_dir)
+        if ycalc: self.yf.msg("     YAMBO CG %s NOT found."%cg)
+        else: self.yf.msg("     YAMBO CG %s found."%cg)      
+        #          
+        if calc and ycalc:
+            yambo_dir = '%s/%s_coarse_grid'%(self.yambo_dir,cg)
+            CreateYamboSave(self.prefix,save_type=save_type,nscf=calc_dir,elph_path=elph_path,\
+                            database=os.path.abspath(yambo_dir),yambo_exec_path=yambo_exec_path,printIO=False)
+            self.setup_fg(calc_dir,yambo_dir,self.fg_grids[ig],self.fg_strings[ig])
+
+    def setup_fg_branch(self,ig,iff,nscf_out,y_out_dir,yambo_exec_path):
+        """ Setup of step 3 for a FG once its nscf is done: FG yambo SAVE and double grid
+        """
+        cg, fg = self.cg_strings[ig], self.fg_strings[ig][iff]
+        # NSCF status check
+        calc_dir  = '%s/%s_coarse_grid/%s'%(self.nscf_dir,cg,fg)
+        calc = self.check_nscf_completed(calc_dir,nscf_out)
+        if calc: self.yf.msg("     NSCF CG %s FG %s found."%(cg,fg))
+        else: self.yf.msg("     NSCF CG %s FG %s NOT found."%(cg,fg))
+        # YAMBO status check
+        ycalc_dir = '%s/%s_coarse_grid/%s'%(self.yambo_dir,cg,fg)
+        ycalc = self.yambo_output_is_NOT_there(ycalc_dir,y_out_dir)
+        if ycalc: self.yf.msg("     YAMBO CG %s FG %s NOT found."%(cg,fg))
+        else: self.yf.msg("     YAMBO CG %s FG %s found."%(cg,fg))   
+        #      
+        if calc and ycalc:
+            yambo_dir = '%s/%s_coarse_grid/%s'%(self.yambo_dir,cg,fg)
+            if not os.path.isfile('%s/SAVE/ndb.Double_Grid'%yambo_dir):
+                CreateYamboSave(self.prefix,save_type='simple',nscf=calc_dir,elph_path=None,\
+                                database="%s/dg_SAVE"%os.path.abspath(yambo_dir),yambo_exec_path=yambo_exec_path,printIO=False)
+                self.setup_yambo_fg(yambo_dir,self.fg_grids[ig][iff],y_out_dir)
+
     def setup_cg(self):
         """ First step of the workflow: setup CG folder tree and CG nscf calculations
         """
@@ -310,7 +332,7 @@ class YamboDG_Optimize():
                 self.ya_inp.write('%s/%s.in'%(yambo_dir,self.yambo_calc_type))
             if not os.path.isfile('%s/%s'%(work_dir,fg_nscf_inp)):
                 self.generate_ypp_input_random_grid(yambo_cg_dir,fg,ypp_inp)
-                ypp_run = self.frontend
+                ypp_run = self.frontend.copy()
                 ypp_run.add_command('cd %s; %s -F %s > ypp_fg.log'%(yambo_cg_dir,self.ypp,ypp_inp))
                 ypp_run.add_command('mv o.random_k_pts %s'%rand_nm)
                 ypp_run.add_command('cp %s %s'%(rand_nm,work_dir))
@@ -324,14 +346,14 @@ class YamboDG_Optimize():
         """ Third step of the workflow: map FG to CG and FG yambo calculations
         """
         ypp_inp = 'ypp_map.in'
-        os_run = self.frontend
+        os_run = self.frontend.copy()
         if os.path.isfile('%s/../%s/ndb.dipoles'%(yambo_fg_dir,yresults_dir)):
             os_run.add_command('cd %s; cp ../%s/ndb.dipoles* ../SAVE/ ; cp -r ../SAVE .'%(yambo_fg_dir,yresults_dir))
         else:
             os_run.add_command('cd %s; cp -r ../SAVE .'%yambo_fg_dir)
         os_run.run()
         self.generate_ypp_input_map_grid(yambo_fg_dir,fg_num,ypp_inp)
-        ypp_run = self.frontend
+        ypp_run = self.frontend.copy()
         ypp_run.add_command('cd %s; %s -F %s > ypp_map.log'%(yambo_fg_dir,self.ypp,ypp_inp))
         ypp_run.run()
         if os.path.isfile('%s/SAVE/ndb.Double_Grid'%yambo_fg_dir):
@@ -429,6 +451,22 @@ class YamboDG_Optimize():
                         self.ya_id_fg[ig][iff] = self.shell_run("ya_%s"%cg,save_dir,out_yambo,'y') # depends on JOBID='%d:%d'%(self.ya_id_cg[ig],self.qe_id_fg[ig][iff]))
                         if self.wait_up: self.job_folders.append(save_dir)
 
+    def shell_job(self,jname,run_dir,out_dir,exec,cd=False):
+        """
+        Prepare the scheduler of a job without submitting it (see shell_run)
+
+            cd: move to run_dir at the beginning of the job
+                (for jobs submitted before run_dir exists)
+        """
+        if exec=='qe': shell = deepcopy(self.qejobrun)
+        if exec=='y':  shell = deepcopy(self.yjobrun)
+        shell.name = '%s_%s'%(jname,shell.name)
+        
+        if cd: shell.add_command('cd %s'%os.path.abspath(run_dir))
+        if exec=='qe': shell.add_mpirun_command('%s -inp %s.nscf > %s.out'%(self.pw,self.prefix,out_dir))
+        if exec=='y': shell.add_mpirun_command('%s -F %s.in -J %s -C %s 2> %s.log'%(self.yambo,self.yambo_calc_type,out_dir,out_dir,out_dir))
+        return shell
+
     def shell_run(self,jname,run_dir,out_dir,exec,JOBID=None):
         """ 
         Submit job
@@ -444,17 +482,11 @@ class YamboDG_Optimize():
             
             returns id of present submitted job          
         """
-        if exec=='qe': shell = deepcopy(self.qejobrun)
-        if exec=='y':  shell = deepcopy(self.yjobrun)
-        shell.name = '%s_%s'%(jname,shell.name)
+        shell = self.shell_job(jname,run_dir,out_dir,exec)
         
         # Add dependency if specified
-        if self.wait_up and JOBID is not None:
-            dependency='afterok:%s'%JOBID
-            shell.dependency=dependency
+        if self.wait_up and JOBID is not None: shell.set_dependency(JOBID)
         
-        if exec=='qe': shell.add_mpirun_command('%s -inp %s.nscf > %s.out'%(self.pw,self.prefix,out_dir))
-        if exec=='y': shell.add_mpirun_command('%s -F %s.in -J %s -C %s 2> %s.log'%(self.yambo,self.yambo_calc_type,out_dir,out_dir,out_dir))
         shell.run(filename='%s/%s.sh'%(run_dir,exec)) ### Specify run path
         
         # Manage submissions if specified
@@ -466,6 +498,76 @@ class YamboDG_Optimize():
         
         return this_job_id
     
+    def run_chain(self,out_qe,out_yambo,save_type,elph_path,yambo_exec_path):
+        """
+        Submit the whole workflow tree at once (see branch_wise_flow) with the dependencies of the scheduler.
+
+        The setup operations done by this python process between the steps (SAVEs, ypp fine grids
+        and double grid maps) run in short jobs calling setup_cg_branch and setup_fg_branch.
+        The jobs of the fine grids are submitted before their folders exist so they start by moving there.
+        """
+        chain = JobChain()
+        pickle_file = self.dump()
+
+        for ig,cg in enumerate(self.cg_strings): # ---------- Outer COARSE GRID loop ----------
+            nscf_cg  = '%s/%s_coarse_grid'%(self.nscf_dir,cg)
+            yambo_cg = '%s/%s_coarse_grid'%(self.yambo_dir,cg)
+
+            qe_cg = None
+            if not self.check_nscf_completed(nscf_cg,out_qe):
+                self.yf.msg("Submitting NSCF CG %s..."%cg)
+                qe_cg = chain.add(self.shell_job("qe_%s"%cg,nscf_cg,out_qe,'qe'),'%s/qe.sh'%nscf_cg)
+
+            setup_cg = chain.add_setup([self.setup_command(pickle_file,'setup_cg_branch',cg,ig,out_qe,out_yambo,save_type,elph_path,yambo_exec_path)],
+                                       '%s/setup.sh'%yambo_cg,self.yjobrun,depends=qe_cg,name='setup_%s'%cg)
+
+            ya_cg = None
+            if self.yambo_output_is_NOT_there(yambo_cg,out_yambo) and not self.noyambo:
+                self.yf.msg("Submitting YAMBO CG %s..."%cg)
+                ya_cg = chain.add(self.shell_job("ya_%s"%cg,yambo_cg,out_yambo,'y'),'%s/y.sh'%yambo_cg,depends=setup_cg)
+
+            for iff,fg in enumerate(self.fg_strings[ig]):  # ---------- Inner FINE GRID loop ----------
+                nscf_fg  = '%s/%s'%(nscf_cg,fg)
+                yambo_fg = '%s/%s'%(yambo_cg,fg)
+
+                qe_fg = None
+                if not self.check_nscf_completed(nscf_fg,out_qe):
+                    self.yf.msg("Submitting NSCF CG %s FG %s..."%(cg,fg))
+                    qe_fg = chain.add(self.shell_job("qe_%s"%cg,nscf_fg,out_qe,'qe',cd=True),'%s/qe_%s.sh'%(nscf_cg,fg),depends=setup_cg)
+
+                setup_fg = chain.add_setup([self.setup_command(pickle_file,'setup_fg_branch','%s_%s'%(cg,fg),ig,iff,out_qe,out_yambo,yambo_exec_path)],
+                                           '%s/setup_%s.sh'%(yambo_cg,fg),self.yjobrun,depends=[setup_cg,qe_fg,ya_cg],name='setup_%s'%cg)
+
+                if self.yambo_output_is_NOT_there(yambo_fg,out_yambo) and not self.noyambo:
+                    self.yf.msg("Submitting YAMBO CG %s FG %s..."%(cg,fg))
+                    chain.add(self.shell_job("ya_%s"%cg,yambo_fg,out_yambo,'y',cd=True),'%s/y_%s.sh'%(yambo_cg,fg),depends=setup_fg)
+
+        chain.submit()
+        for shell in chain.jobs:
+            self.job_shells.append(shell)
+            self.job_folders.append(os.path.dirname(chain.filenames[id(shell)]))
+        return chain
+
+    def setup_command(self,pickle_file,method,tag,*args):
+        """ Command of a setup job calling method(*args) of the pickled workflow
+        """
+        args = (pickle_file,method,tag)+args
+        return '%s -c "from yambopy.double_grid.dg_convergence import dg_setup_job; dg_setup_job%r"'%(sys.executable,args)
+
+    def dump(self,filename='YAMBOPY_double-grid_Optimize.pkl'):
+        """ Pickle the workflow to be used in the setup jobs
+        """
+        self.cwd = os.getcwd()
+        pickle_file = os.path.abspath(os.path.join(self.RUN_path,filename))
+        with open(pickle_file,'wb') as f:
+            pickle.dump(self,f)
+        return pickle_file
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['yf','job_shells','job_folders']: state.pop(key,None)
+        return state
+
     def ip_input_is_there(self):
         """ Check if yambo ip input is correctly given in converge_DG case
         """
@@ -527,7 +629,7 @@ class YamboDG_Optimize():
     def clean_everything(self):
         """ Remove workflow tree
         """
-        rm_run = self.frontend
+        rm_run = self.frontend.copy()
         rm_run.add_command('rm -rf %s %s %s'%(self.nscf_dir,self.yambo_dir,self.plot_dir))
         rm_run.run()
         self.yf.msg("Workflow removed.")
@@ -581,5 +683,19 @@ class YamboDG_Optimize():
                                     y_FG_1   ...   y_FG_n 
                                     
         For this reason, it's better to plan a submission 'STEP by STEP' of the workflow instead than 'branch by branch'. 
-        However, the latter way would be more efficient if implemented. 
+        The latter is done by run_chain (option chain=True): each barrier becomes a dependency of the scheduler
+        and the setup functions run as short jobs, so the whole tree is submitted at once.
         """
+
+def dg_setup_job(pickle_file,method,tag,*args):
+    """
+    Run a setup step of a YamboDG_Optimize workflow submitted as a chain of jobs
+    (see YamboDG_Optimize.run_chain), the messages go to a log for each step
+    """
+    with open(pickle_file,'rb') as f:
+        dg = pickle.load(f)
+    os.chdir(dg.cwd)
+    dg.yf = YamboIO(out_name='YAMBOPY_double-grid_%s_%s.log'%(method,tag),out_path=dg.RUN_path,print_to_shell=True)
+    dg.yf.IO_start()
+    getattr(dg,method)(*args)
+    dg.yf.IO_close()
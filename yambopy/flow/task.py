@@ -29,7 +29,7 @@ The hierarchy is:
 import os
 import shutil
 import time
-from schedulerpy import Scheduler
+from schedulerpy import Scheduler, LocalPool
 from qepy.pw import PwIn
 from qepy.ph import PhIn
 from qepy.dynmat import DynmatIn
@@ -57,12 +57,34 @@ def write_fake(filename):
     with open(filename,'w') as f:
         f.write('')
 
+def walltime_seconds(walltime):
+    """ Convert a walltime in the format [days-]hours:minutes:seconds to seconds (1 if unknown)
+    """
+    try:
+        days, _, hms = str(walltime).rpartition('-')
+        seconds = 0
+        for value in hms.split(':'): seconds = seconds*60+int(value)
+        return seconds+int(days or 0)*86400
+    except ValueError:
+        return 1
+
+def pid_alive(pid):
+    """ Check if a process with this pid is running in this machine
+    """
+    if pid is None: return False
+    try:
+        os.kill(pid,0)
+    except OSError:
+        return False
+    return True
+
 class YambopyFlow(object):
     """
     Handle multiple tasks and their interdependencies
     Monitor the progress
     """
     _picklename = "__yambopyflow__"
+    _journalname = "__yambopyjournal__"
 
     def __init__(self,path,tasks):
         if not isiter(tasks): 
@@ -87,7 +109,9 @@ class YambopyFlow(object):
         pickle_filename = os.path.join(flow_folder,cls._picklename)
         if not os.path.isfile(pickle_filename):
             raise FileNotFoundError('pickle not found in %s'%pickle_filename)
-        return cls.from_pickle(pickle_filename)
+        flow = cls.from_pickle(pickle_filename)
+        flow.read_journal(flow_folder)
+        return flow
 
     @property
     def dependencies(self):
@@ -141,23 +165,209 @@ class YambopyFlow(object):
         with open(os.path.join(self.path,'run.sh'),'w') as f:
             f.write('\n'.join(lines))
 
-    def run(self,maxexecs=1,sleep=5,dry=False,verbose=0):
-        """Run all the tasks"""
+    def run(self,maxexecs=None,sleep=5,dry=False,verbose=0,cores=None):
+        """
+        Run all the tasks
+
+        The dependencies are resolved once in a graph, the state of each task is kept
+        in memory and only updated when the task finishes. The ready tasks on the longest
+        chain (estimated from the walltime of their schedulers) are launched first.
+        The state changes are appended to a journal instead of pickling the flow each time.
+
+        Arguments:
+            maxexecs: maximum number of tasks running at the same time
+                      (default: 1, unlimited when running with a core budget)
+            sleep:    seconds between checks of the tasks submitted to a queue
+            cores:    run the tasks of the Bash scheduler concurrently in a LocalPool
+                      with this number of cores. The flow wakes up as soon as one of
+                      them finishes.
+        """
         if not self.initialized: self.create()
+        pool = LocalPool(cores) if cores is not None and not dry else None
+        if maxexecs is None and pool is None: maxexecs = 1
 
+        self.build_graph()
         print(marquee("YambopyFlow.run"))
-        while not self.alldone:
-            #exeute maxexecs ready tasks
-            for it,task in self.readytasks[:maxexecs]:
-                print("%5s %10s  %s"%("t%d"%it,str(task.name),task.status))
-                self.initialize_task(it,verbose=False)
-                task.run(dry=dry)
-
-            #wait some seconds
-            time.sleep(sleep)
-        
-            #transform into a pickle
-            self.pickle()
+
+        if dry:
+            for it in self._order:
+                if self._state[it] != "done": self.launch(it,dry=True)
+            return
+
+        while not self.alldone_cached:
+            #launch the ready tasks on the critical path first
+            for it in self.ready_cached:
+                task = self[it]
+                if maxexecs is not None and len(self.running) >= maxexecs: break
+                if pool is not None and pool.accepts(task.scheduler) and not pool.fits(task.scheduler): continue
+                self.launch(it,pool=pool)
+                #tasks run without a pool finish before the call returns
+                if getattr(task,'pid',None) is None and LocalPool.accepts(task.scheduler):
+                    self.update(it,returncode=getattr(task.scheduler,'returncode',-1))
+            if self.alldone_cached: break
+
+            #wait for a task to finish
+            remote = [it for it in self.running if pool is None or getattr(self[it],'pid',None) not in pool.processes]
+            if pool is not None and len(pool):
+                finished = pool.wait(timeout=sleep if remote else None)
+                for it in self.running:
+                    pid = getattr(self[it],'pid',None)
+                    if pid in finished: self.update(it,verbose=verbose,returncode=finished[pid])
+            elif remote:
+                time.sleep(sleep)
+            elif not self.ready_cached:
+                self.pickle()
+                raise RuntimeError('The flow can not continue, the tasks launched did not succeed:\n%s'%self)
+            for it in remote:
+                self.update(it,verbose=verbose)
+
+        self.pickle()
+
+    def build_graph(self):
+        """
+        Resolve the dependencies of the tasks in the flow:
+
+            _parents:  indexes of the tasks each task depends on
+            _children: indexes of the tasks depending on each task
+            _order:    topological order of the tasks
+            _priority: length of the longest chain of tasks starting at each task
+            _state:    'waiting', 'ready', 'running', 'done' or 'failed' for each task
+
+        Dependencies on tasks that are not part of the flow are checked on the disk
+        when the task is about to run.
+        """
+        index = dict((id(task),it) for it,task in enumerate(self.tasks))
+        self._parents = []
+        self._children = [[] for task in self.tasks]
+        for it,task in enumerate(self.tasks):
+            parents = []
+            for dependency in task._dependencies or []:
+                if id(dependency) not in index: continue
+                parents.append(index[id(dependency)])
+                self._children[index[id(dependency)]].append(it)
+            self._parents.append(parents)
+
+        #topological order
+        nparents = [len(parents) for parents in self._parents]
+        self._order = [it for it in range(self.ntasks) if not nparents[it]]
+        for it in self._order:
+            for child in self._children[it]:
+                nparents[child] -= 1
+                if not nparents[child]: self._order.append(child)
+        if len(self._order) != self.ntasks:
+            raise ValueError('The dependencies of the tasks in the flow have a cycle')
+
+        #longest remaining chain of each task
+        self._priority = [0]*self.ntasks
+        for it in reversed(self._order):
+            chain = max([self._priority[child] for child in self._children[it]]+[0])
+            self._priority[it] = walltime_seconds(self[it].scheduler.walltime)+chain
+
+        #state of the tasks from the disk, read only once
+        self._state = [None]*self.ntasks
+        for it in self._order:
+            task = self[it]
+            if task.exitcode == "success": state = "done"
+            elif task.exitcode is not None: state = "failed"
+            elif task.launched and self._is_running(task): state = "running"
+            else: state = "waiting"
+            task.launched = state == "running"
+            self._state[it] = state
+        for it in self._order:
+            self._set_ready(it)
+
+    @staticmethod
+    def _is_running(task):
+        """
+        A launched task without exit code is still running if its process is alive
+        or if it was submitted to a queue
+        """
+        pid = getattr(task,'pid',None)
+        if pid is not None: return pid_alive(pid)
+        return not LocalPool.accepts(task.scheduler)
+
+    def _set_ready(self,it):
+        """ Change the state of a waiting task to ready if all its dependencies are done
+        """
+        if self._state[it] != "waiting": return
+        if not all(self._state[parent] == "done" for parent in self._parents[it]): return
+        #dependencies outside the flow
+        index = set(id(task) for task in self.tasks)
+        external = [dependency for dependency in self[it]._dependencies or [] if id(dependency) not in index]
+        if all(dependency.status == "done" for dependency in external):
+            self._state[it] = "ready"
+
+    @property
+    def alldone_cached(self):
+        return all(state == "done" for state in self._state)
+
+    @property
+    def ready_cached(self):
+        """ Indexes of the ready tasks, the ones with the longest chain of tasks after them first
+        """
+        ready = [it for it in self._order if self._state[it] == "ready"]
+        return sorted(ready,key=lambda it: -self._priority[it])
+
+    @property
+    def running(self):
+        return [it for it in self._order if self._state[it] == "running"]
+
+    def launch(self,it,pool=None,dry=False):
+        """ Launch a task and record it in the journal
+        """
+        task = self[it]
+        print("%5s %10s  %s"%("t%d"%it,str(task.name),self._state[it]))
+        self.initialize_task(it,verbose=False)
+        task.run(dry=dry,pool=pool)
+        if dry: return
+        self._state[it] = "running"
+        self.journal(it,"running",getattr(task,'pid',None))
+
+    def update(self,it,verbose=0,returncode=None):
+        """
+        Read the exit code of a running task and update its state and the ones of its children
+
+        returncode is the exit code of the process of a task that is known to have finished,
+        if the task did not write its exit code (killed before the end) it is set as failed
+        """
+        exitcode = self[it].exitcode
+        if exitcode is None and returncode is None: return
+        state = "done" if exitcode == "success" else "failed"
+        self._state[it] = state
+        if exitcode is None: self.journal(it,state,getattr(self[it],'pid',None),returncode)
+        else:                self.journal(it,state)
+        if verbose: print("%5s %10s  %s"%("t%d"%it,str(self[it].name),state))
+        for child in self._children[it]:
+            self._set_ready(child)
+
+    def journal(self,it,state,pid=None,returncode=None):
+        """
+        Append a change of state of a task to the journal of the flow.
+        Each line has the time, the task, the new state and the pid of the task if known.
+        The tasks that finished without writing their exit code also have the exit code of their process.
+        """
+        line = "%.3lf t%d %s"%(time.time(),it,state)
+        if pid is not None: line += " %d"%pid
+        if returncode is not None: line += " exitcode=%d"%returncode
+        with open(os.path.join(self.path,self._journalname),'a') as f:
+            f.write(line+"\n")
+
+    def read_journal(self,path=None):
+        """
+        Replay the journal of the flow so that the tasks launched after the flow
+        was pickled are known to be running
+        """
+        if path is None: path = self.path
+        journal_filename = os.path.join(path,self._journalname)
+        if not os.path.isfile(journal_filename): return
+        with open(journal_filename,'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3: continue
+                if fields[2] != "running": continue
+                task = self[int(fields[1][1:])]
+                task.launched = True
+                task.pid = int(fields[3]) if len(fields) > 3 else None
 
     def initialize_task(self,itask,verbose=True):
         task = self[itask]
@@ -222,6 +432,7 @@ class YambopyTask():
         self.nerr = 0
         self.initialized = initialized
         self.launched = False
+        self.pid = None
         
         #code_injection
         self.code_dict = {}
@@ -333,9 +544,12 @@ class YambopyTask():
         if n==1: return instances[0]
         return instances[:n]
 
-    def run(self,dry=False,verbose=1):
+    def run(self,dry=False,verbose=1,pool=None):
         """
         Run this task using the specified scheduler
+
+        If a LocalPool is given and it accepts the scheduler the task is started
+        in the pool without waiting for it to finish and its pid is stored.
         """
         #initialize the task
         if not self.initialized: self.initialize()
@@ -343,7 +557,9 @@ class YambopyTask():
         if self.launched: return 0
 
         #if initialized run it
-        if self.initialized:
+        if self.initialized and pool is not None and not dry and pool.accepts(self.scheduler):
+            self.pid = pool.submit(self.scheduler,self._run)
+        elif self.initialized:
             self.scheduler.run(self._run,dry=dry)
         else:
             raise ValueError('could not initialize task')
@@ -362,6 +578,8 @@ class YambopyTask():
         app('initialized: {}'.format(self.initialized))
         app('status:      {}'.format(self.status))
         app('exitcode:    {}'.format(self.exitcode))
+        if getattr(self,'pid',None) is not None:
+            app('pid:         {}'.format(self.pid))
         if self.initialized:
             app('path: {}'.format(self.path))
         return "\n".join(lines)
@@ -480,49 +698,222 @@ class YamboChiTask(YamboTask):
     The purpose of this class is to paralelize the calculation of chi.
     This is done by overloading the run method with one similar to the
     YambopyFlow.
-    The input files for the missing q are created in initialize
-    One job per q-point is launched at a time.
-    Once the database is ready the input file for that q-point is removed
+    The input files for the missing q are created when they are submitted.
+    The q-points can be submitted as (see ``submission``):
+
+        'single': one job per q-point
+        'bundle': ``nbundles`` jobs, each running a range of q-points one after the other
+        'array':  a job array of the scheduler (Slurm, PBS or OAR) with one job per q-point
+
+    Each job appends the exit code of each q-point to a manifest so the progress is known
+    by reading a single file. The q-points that failed are submitted again up to ``maxretries`` times.
+    The q-points of the jobs that left the queue (or the pool) without reporting their exit code,
+    e.g. killed by the walltime, are also set as failed.
     """
-    def run(self,maxexecs=None,sleep=5,dry=False):
+    submission = "single"
+    nbundles = 4
+    maxretries = 1
+    _manifest = "__yambochi__"
+
+    def run(self,maxexecs=None,sleep=5,dry=False,pool=None):
+        """
+        Submit the missing q-points and wait for them to finish
+
+        Arguments:
+            maxexecs: return after submitting this number of jobs
+            sleep:    seconds between checks of the manifest
+            pool:     run the jobs of the Bash scheduler concurrently in this LocalPool
+        """
         #initialize the task
         if not self.initialized: self.initialize()
 
         if not self.initialized:
             raise ValueError('could not initialize task')
 
-        #if initialized run it
+        if dry:
+            for qpoints in self.get_jobs(list(range(1,self.nqpoints+1))):
+                self.submit(qpoints,dry=True)
+            return
+
+        njobs = 0
         while not self.alldone:
-            #execute maxexecs ready tasks
-            for iq,(done,launched) in enumerate(zip(self.done_chi,self.launched_chi)):
-                if done or launched: continue
-                iq = iq + 1 #pad iq
-                #create input for this q-point
-                inpq = self.yamboinput.copy()
-                inpq.set_q(iq)
-                if dry: print(inpq)
-                else:   inpq.write(os.path.join(self.path,'runchiq%d.in'%iq))
-                #create submission script for this q-point
-                this_scheduler = self.scheduler.copy()
-                run = os.path.join(self.path,'runchiq%d.sh'%iq)
-                cmd = '%s -F runchiq%d.in -J run -C runchiq%d > runchiq%d.log 2> runchiq%d.err'%(self.executable,iq,iq,iq,iq)
-                this_scheduler.add_mpirun_command(cmd)
-                #launch job
-                print("%10s"%("q%d"%iq))
-                this_scheduler.run(run,dry=dry)
-                if maxexecs: 
-                    maxexecs = maxexecs-1
-                    if maxexecs == 0: return
-
-                #wait some seconds
-                time.sleep(sleep)
+            self.check_queue()
+            states = self.chi_states
+            #submit the q-points that are missing or failed
+            missing = [iq for iq,(state,nsubmitted) in states.items()
+                       if state in [None,'failed'] and nsubmitted <= self.maxretries]
+            for qpoints in self.get_jobs(missing):
+                print("%10s"%" ".join("q%d"%iq for iq in qpoints))
+                if pool is not None and pool.accepts(self.scheduler):
+                    while not pool.fits(self.scheduler): self.wait_pool(pool)
+                self.submit(qpoints,pool=pool)
+                njobs += 1
+                if maxexecs and njobs == maxexecs: return
+
+            #check for q-points that can not be calculated
+            if not missing and not any(state == 'submitted' for state,nsubmitted in self.chi_states.values()):
+                failed = [iq for iq,(state,nsubmitted) in self.chi_states.items() if state == 'failed']
+                raise RuntimeError('chi failed for the q-points %s after %d retries'%(failed,self.maxretries))
+
+            #wait for the jobs to finish
+            if pool is not None and len(pool): self.wait_pool(pool,timeout=sleep)
+            elif not self.alldone: time.sleep(sleep)
+
+        #wait for the jobs of the pool that are still writing to the manifest
+        if pool is not None:
+            while any(pid in pool.processes for pid in getattr(self,'_pool_jobs',{})): self.wait_pool(pool)
+
+    def get_jobs(self,qpoints):
+        """
+        Split a list of q-points in the lists of q-points to run in each job
+        """
+        if not qpoints: return []
+        if self.submission == "array" and len(qpoints) > 1: return [qpoints]
+        if self.submission == "bundle":
+            nbundles = min(self.nbundles,len(qpoints))
+            return [qpoints[ib::nbundles] for ib in range(nbundles)]
+        return [[iq] for iq in qpoints]
+
+    def submit(self,qpoints,dry=False,pool=None):
+        """
+        Create the input files of the q-points and submit one job for them.
+        In the 'array' submission the q-points are run in a job array.
+        """
+        for iq in qpoints:
+            inpq = self.yamboinput.copy()
+            inpq.set_q(iq)
+            if dry: print(inpq)
+            else:   inpq.write(os.path.join(self.path,'runchiq%d.in'%iq))
+
+        #create submission script for these q-points
+        this_scheduler = self.scheduler.copy()
+        this_scheduler.commands = []
+        cmd = '%s -F runchiq${iq}.in -J run -C runchiq${iq} > runchiq${iq}.log 2> runchiq${iq}.err'%self.executable
+        if self.submission == "array" and len(qpoints) > 1:
+            name = 'runchiarray%d'%qpoints[0]
+            with open(os.path.join(self.path,'%s.txt'%name),'w') as f:
+                f.write("\n".join("%d"%iq for iq in qpoints)+"\n")
+            this_scheduler.set_array(len(qpoints))
+            this_scheduler.add_command('iq=$(sed -n "%sp" %s.txt)'%(this_scheduler.get_array_index(),name))
+            this_scheduler.add_mpirun_command(cmd)
+            this_scheduler.add_command('echo "q$iq $?" >> %s'%self._manifest)
+        else:
+            name = 'runchiq%s'%"-".join("%d"%iq for iq in qpoints[:1]+qpoints[1:][-1:])
+            this_scheduler.add_command('for iq in %s; do'%" ".join("%d"%iq for iq in qpoints))
+            this_scheduler.add_mpirun_command(cmd)
+            this_scheduler.add_command('echo "q$iq $?" >> %s'%self._manifest)
+            this_scheduler.add_command('done')
+        run = os.path.join(self.path,'%s.sh'%name)
+
+        if dry:
+            print(this_scheduler)
+            return
+
+        #record the submission before launching the job
+        self.write_manifest(["q%d submitted"%iq for iq in qpoints])
+        #keep the submission of each q-point run by the job
+        states = self.chi_states
+        submissions = [(iq,states[iq][1]) for iq in qpoints]
+        if pool is not None and pool.accepts(this_scheduler):
+            pid = pool.submit(this_scheduler,run)
+            if not hasattr(self,'_pool_jobs'): self._pool_jobs = {}
+            self._pool_jobs[pid] = submissions
+        else:
+            this_scheduler.run(run,dry=dry)
+            if not hasattr(self,'_queue_jobs'): self._queue_jobs = []
+            self._queue_jobs.append([this_scheduler,submissions,0])
 
-            #check for deadlocks
-            all_done_or_launched = all([ done or launched for (done,launched) in zip(self.done_chi,self.launched_chi)])
-            if all_done_or_launched and not self.alldone:
-                print('waiting for the jobs to finish')
-                time.sleep(25)
+    def wait_pool(self,pool,timeout=None):
+        """
+        Wait for jobs of the pool, the q-points of the jobs that finished
+        without reporting their exit code are set as failed.
+        Only the q-points whose last submission is the one of the job are changed,
+        a q-point that failed in the job might be running again in another job.
+        """
+        finished = pool.wait(timeout=timeout)
+        if not finished: return
+        pool_jobs = getattr(self,'_pool_jobs',{})
+        states = self.chi_states
+        lines = []
+        for pid in finished:
+            for iq,nsubmitted in pool_jobs.pop(pid,[]):
+                if states[iq] == ('submitted',nsubmitted): lines.append("q%d %d"%(iq,finished[pid] or 1))
+        if lines: self.write_manifest(lines)
+
+    def check_queue(self):
+        """
+        Check the jobs submitted to the queue, the q-points of the jobs that left the queue
+        without reporting their exit code are set as failed.
+        The jobs of each scheduler are queried with a single call. A job has to be missing
+        from the queue in two consecutive checks so that a failed query does not fail its q-points.
+        The jobs run in the bash without a pool finished when they were submitted.
+        """
+        queue_jobs = getattr(self,'_queue_jobs',[])
+        if not queue_jobs: return
+        status = {}
+        for scheduler in set(type(shell) for shell,submissions,nmissing in queue_jobs):
+            jobids = [shell.jobid for shell,submissions,nmissing in queue_jobs
+                      if type(shell) is scheduler and getattr(shell,'jobid',None) is not None]
+            if jobids: status.update(scheduler.query_jobs(jobids,self.path))
+
+        finished = []
+        for job in queue_jobs:
+            shell = job[0]
+            jobid = getattr(shell,'jobid',None)
+            if jobid is not None and status.get(str(jobid)) in shell._active_states:
+                job[2] = 0
+                continue
+            job[2] += 1
+            if jobid is None or job[2] > 1: finished.append(job)
+        if not finished: return
+
+        states = self.chi_states
+        lines = ["q%d 1"%iq for shell,submissions,nmissing in finished
+                 for iq,nsubmitted in submissions if states[iq] == ('submitted',nsubmitted)]
+        if lines: self.write_manifest(lines)
+        self._queue_jobs = [job for job in queue_jobs if not any(job is other for other in finished)]
+
+    def write_manifest(self,lines):
+        with open(os.path.join(self.path,self._manifest),'a') as f:
+            f.write("\n".join(lines)+"\n")
+
+    def read_manifest(self):
+        """
+        Read the manifest, returns a dictionary with a list of the entries of each q-point:
+        'submitted' when the q-point is submitted and the exit code when it finishes
+        """
+        manifest = {}
+        manifest_filename = os.path.join(self.path,self._manifest)
+        if not os.path.isfile(manifest_filename): return manifest
+        with open(manifest_filename,'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) != 2 or not fields[0].startswith('q'): continue
+                entry = fields[1] if fields[1] == 'submitted' else int(fields[1])
+                manifest.setdefault(int(fields[0][1:]),[]).append(entry)
+        return manifest
+
+    def chi_fragment(self,iq):
+        return os.path.join(self.path,'run','ndb.pp_fragment_%d'%iq)
 
+    @property
+    def chi_states(self):
+        """
+        Dictionary with the state of each q-point and the number of times it was submitted
+        The state is None (not submitted), 'submitted', 'done' or 'failed'
+        The q-points not in the manifest are done if their database is present (runs without manifest)
+        """
+        manifest = self.read_manifest()
+        states = {}
+        for iq in range(1,self.nqpoints+1):
+            entries = manifest.get(iq,[])
+            nsubmitted = entries.count('submitted')
+            if not entries:                state = 'done' if os.path.isfile(self.chi_fragment(iq)) else None
+            elif entries[-1] == 'submitted': state = 'submitted'
+            elif entries[-1] == 0 and os.path.isfile(self.chi_fragment(iq)): state = 'done'
+            else:                          state = 'failed'
+            states[iq] = (state,nsubmitted)
+        return states
 
     @property
     def alldone(self):
@@ -546,31 +937,14 @@ class YamboChiTask(YamboTask):
     @property
     def launched_chi(self):
         """
-        A job is known to be launched when the input file is present in the folder
-        We use run.in for the job with all the q points and runchiqn.in for each n q point
+        A job is known to be launched when it is in the manifest
         """ 
-        import re
-        import glob
-        runchis = glob.glob(os.path.join(self.path,'runchiq*.in'))
-        # get a list of launched/not launched
-        launched = [False]*self.nqpoints
-        for runchi in runchis:
-            qidx = int(re.findall('([0-9]+)',os.path.basename(runchi))[-1])-1
-            launched[qidx] = True
-        return launched
+        return [state is not None for state,nsubmitted in self.chi_states.values()]
 
     @property
     def done_chi(self):
-        """Get list of all the chi objects"""
-        import glob
-        chis = glob.glob(os.path.join(self.path,'run','ndb.pp*'))
-        # get a list of done/not done chis
-        done = [False]*self.nqpoints
-        for chi in chis:
-            if 'fragment' not in chi: continue
-            qidx = int(chi.split('_')[-1])-1
-            done[qidx] = True
-        return done
+        """Get list of the q-points done according to the manifest"""
+        return [state == 'done' for state,nsubmitted in self.chi_states.values()]
 
     def __str__(self):
         lines = []; app = lines.append
@@ -578,8 +952,8 @@ class YamboChiTask(YamboTask):
         app('initialized: %d'%self.initialized)
         if self.initialized: 
             app('nqpoints: %d'%self.nqpoints)
-            for iq,(done,launched) in enumerate(zip(self.done_chi,self.launched_chi)):
-                app("%5s %5s %5s"%("q%d"%(iq+1),done,launched))
+            for iq,(state,nsubmitted) in self.chi_states.items():
+                app("%5s %10s %5d"%("q%d"%iq,state,nsubmitted))
         return '\n'.join(lines)
 
 class P2yTask(YambopyTask):
@@ -0,0 +1,222 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+"""
+Test the scheduling of the tasks of a flow using tasks that only run shell commands
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from schedulerpy import Bash, Slurm, LocalPool
+from yambopy.flow import YambopyFlow, YambopyTask, YamboChiTask
+from yambopy.flow.task import task_init
+
+class ShellTask(YambopyTask):
+    """ Task running a shell command """
+    def __init__(self,command,dependencies=None,walltime="1:00:00"):
+        super(ShellTask,self).__init__([],command,Bash(walltime=walltime),dependencies=dependencies)
+
+    @task_init
+    def initialize(self,path):
+        self.scheduler.add_command(self.executable)
+        self._run = os.path.join(path,'run.sh')
+
+class TestFlow(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp,'flow')
+
+    def test_graph(self):
+        a = ShellTask('true')
+        b = ShellTask('true',dependencies=a,walltime="2:00:00")
+        c = ShellTask('true')
+        d = ShellTask('true',dependencies=[b,c])
+        flow = YambopyFlow.from_tasks(self.path,[d,c,b,a])
+        flow.create()
+        flow.build_graph()
+        self.assertEqual(flow._order,[1,3,2,0])
+        self.assertEqual(flow._priority,[3600,7200,3*3600,4*3600])
+        #the task starting the longest chain goes first
+        self.assertEqual(flow.ready_cached,[3,1])
+
+        a._dependencies = [d]
+        self.assertRaises(ValueError,flow.build_graph)
+
+    def test_run(self):
+        a = ShellTask('sleep 1')
+        b = ShellTask('sleep 1')
+        c = ShellTask('true',dependencies=[a,b])
+        flow = YambopyFlow.from_tasks(self.path,[a,b,c])
+
+        #a and b run at the same time
+        start = time.time()
+        flow.run(cores=2)
+        self.assertLess(time.time()-start,1.9)
+        self.assertTrue(flow.alldone)
+
+        #the changes of state are in the journal
+        with open(os.path.join(self.path,'__yambopyjournal__')) as f:
+            lines = [line.split() for line in f]
+        self.assertEqual([line[1:3] for line in lines[-2:]],[['t2','running'],['t2','done']])
+
+        #the flow read from the disk is done
+        flow = YambopyFlow.from_folder(self.path)
+        flow.build_graph()
+        self.assertTrue(flow.alldone_cached)
+
+    def test_failure(self):
+        a = ShellTask('sh -c "exit 1"; false')
+        b = ShellTask('true',dependencies=a)
+        flow = YambopyFlow.from_tasks(self.path,[a,b])
+        self.assertRaises(RuntimeError,flow.run)
+        self.assertEqual(flow._state,['failed','waiting'])
+
+    def test_killed(self):
+        #the task is killed before writing its exit code
+        a = ShellTask('kill -9 $$')
+        b = ShellTask('true',dependencies=a)
+        c = ShellTask('true')
+        flow = YambopyFlow.from_tasks(self.path,[a,b,c])
+        self.assertRaises(RuntimeError,flow.run,cores=2,sleep=0.1)
+        self.assertEqual(flow._state,['failed','waiting','done'])
+        self.assertIsNone(a.exitcode)
+        with open(os.path.join(self.path,'__yambopyjournal__')) as f:
+            lines = [line.split() for line in f]
+        failed = [line for line in lines if line[1:3] == ['t0','failed']]
+        self.assertEqual(failed[0][3:],['%d'%a.pid,'exitcode=-9'])
+
+        #the same without a pool
+        flow = YambopyFlow.from_tasks(os.path.join(self.tmp,'serial'),[ShellTask('kill -9 $$')])
+        self.assertRaises(RuntimeError,flow.run,sleep=0.1)
+        self.assertEqual(flow._state,['failed'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+#fake yambo writing the chi database of the q-point, the q-point 2 fails the first time
+_fake_yambo = """
+q=${6#runchiq}
+if [ $q = 2 ] && [ ! -f failed ]; then touch failed; exit 1; fi
+touch run/ndb.pp_fragment_$q
+"""
+
+class WriteSlurm(Slurm):
+    """ Slurm scheduler that only writes the submission script """
+    def run(self,filename='run.sh',dry=False):
+        self.write(filename)
+
+class QueueSlurm(WriteSlurm):
+    """ Slurm scheduler that writes the submission script and has a fake queue """
+    queue = {}
+    njobs = 0
+    killed = False #the jobs are killed right after being submitted
+    def run(self,filename='run.sh',dry=False):
+        self.write(filename)
+        QueueSlurm.njobs += 1
+        self.jobid = "%d"%QueueSlurm.njobs
+        if not QueueSlurm.killed: QueueSlurm.queue[self.jobid] = 'PD'
+
+    @classmethod
+    def query_jobs(cls,jobids,workdir=None):
+        return dict((str(jobid),cls.queue[str(jobid)]) for jobid in jobids if str(jobid) in cls.queue)
+
+class TestChiTask(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp,'run'))
+        with open(os.path.join(self.tmp,'run.in'),'w') as f:
+            f.write('em1d\n%QpntsRXd\n 1 | 5 |\n%\n')
+        with open(os.path.join(self.tmp,'yambo'),'w') as f:
+            f.write(_fake_yambo)
+        with open(os.path.join(self.tmp,'mpirun'),'w') as f:
+            f.write('shift 2; "$@"\n')
+
+    def chi_task(self,scheduler):
+        task = YamboChiTask.from_folder(self.tmp,executable='sh yambo',scheduler=scheduler)
+        task.scheduler.commands = ['yambo -F run.in -J run']
+        return task
+
+    def test_bundle(self):
+        task = self.chi_task(Bash(mpirun='sh mpirun'))
+        task.submission = "bundle"
+        task.nbundles = 2
+        self.assertEqual(task.get_jobs([1,2,3,4,5]),[[1,3,5],[2,4]])
+
+        pool = LocalPool(cores=2)
+        task.run(sleep=0.1,pool=pool)
+        self.assertTrue(task.alldone)
+        #only the failed q-point was submitted again
+        states = task.chi_states
+        self.assertEqual(states[2],('done',2))
+        self.assertEqual([states[iq][1] for iq in [1,3,4,5]],[1,1,1,1])
+        self.assertEqual(len(pool.exitcodes),3)
+
+    def test_retry_running(self):
+        class FinishedPool(object):
+            """ pool where the job 1 just finished """
+            def wait(self,timeout=None): return {1:0}
+        task = self.chi_task(Bash())
+        #q2 failed in the job 1 and is running again in another job while q4 did not report
+        task.write_manifest(["q2 submitted","q4 submitted","q2 1","q2 submitted"])
+        task._pool_jobs = {1:[(2,1),(4,1)]}
+        task.wait_pool(FinishedPool())
+        states = task.chi_states
+        self.assertEqual(states[2],('submitted',2))
+        self.assertEqual(states[4],('failed',1))
+
+    def test_array(self):
+        task = self.chi_task(WriteSlurm())
+        task.submission = "array"
+        task.submit([1,2,4])
+        script = open(os.path.join(self.tmp,'runchiarray1.sh')).read()
+        self.assertIn('#SBATCH --array=1-3',script)
+        self.assertIn('iq=$(sed -n "${SLURM_ARRAY_TASK_ID}p" runchiarray1.txt)',script)
+        self.assertNotIn('run.in',script)
+        self.assertEqual(task.chi_states[4],('submitted',1))
+
+    def test_queue(self):
+        QueueSlurm.queue = {}
+        task = self.chi_task(QueueSlurm())
+        task.submit([1])
+        task.submit([2])
+        task.check_queue()
+        self.assertEqual([task.chi_states[iq] for iq in [1,2]],[('submitted',1)]*2)
+
+        #the job of q1 is killed, it has to be missing from the queue twice
+        del QueueSlurm.queue['1']
+        task.check_queue()
+        self.assertEqual(task.chi_states[1],('submitted',1))
+        task.check_queue()
+        self.assertEqual(task.chi_states[1],('failed',1))
+        self.assertEqual(task.chi_states[2],('submitted',1))
+
+        #the job of q2 finishes normally
+        task.write_manifest(["q2 0"])
+        open(task.chi_fragment(2),'w').close()
+        del QueueSlurm.queue['2']
+        task.check_queue(); task.check_queue()
+        self.assertEqual(task.chi_states[2],('done',1))
+        self.assertEqual(task._queue_jobs,[])
+
+        #the jobs never run, the q-points are submitted again once before giving up
+        QueueSlurm.killed = True
+        try:
+            task = self.chi_task(QueueSlurm())
+            self.assertRaises(RuntimeError,task.run,sleep=0)
+        finally:
+            QueueSlurm.killed = False
+        states = task.chi_states
+        self.assertEqual([states[iq] for iq in [1,3,4,5]],[('failed',2)]*4)
+        self.assertEqual(states[2],('done',1))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 from qepy import *
 from yambopy import *
 from schedulerpy import *
+from yambopy.common.calculation_manager import shell_qe_job
 import os
+import sys
 from copy import deepcopy
 
 class YamboGkkpCompute():
@@ -18,9 +20,14 @@ class YamboGkkpCompute():
         - work_dir: directory where flow is run and yambo SAVE will appear
         - pw_exec_path: path to executables
         - qe_scheduler: optional scheduler for cluster submission
-        - with_SAVE: if True, workflow will generate yambo SAVE at the end (the python master process will remain active).
+        - with_SAVE: if True, workflow will generate yambo SAVE at the end.
+                     With a qe_scheduler the SAVE is generated by a last job depending on the nscf and gkkp jobs,
+                     otherwise the python master process generates it once the calculations finish.
                      The workflow can be called a second time switching with_SAVE to True to immediately generate the SAVE.
 
+    All the jobs are submitted at once using the dependencies of the scheduler (see schedulerpy.JobChain),
+    so the python master process exits right after the submission.
+
           [SUBOPTIONS for with_SAVE]
 
               -- expand: whether to expand the matrix elements
@@ -33,7 +40,8 @@ class YamboGkkpCompute():
 
         if not os.path.isdir(work_dir): os.mkdir(work_dir)
         self.RUN_path = os.path.abspath(work_dir)
-        self.wait_up = with_SAVE #Slightly restructure dependencies and waith for job completions if SAVE is to be created
+        self.yambo_exec_path = yambo_exec_path
+        self.chain = JobChain()
 
         #Configuring schedulers
         if qe_scheduler is not None: self.qejobrun= qe_scheduler                          # Here we use, e.g., slurm 
@@ -85,9 +93,20 @@ class YamboGkkpCompute():
         if not self.nscf_status:
             self.yf.msg('Running nscf.')
             self.run_nscf()
-            
+
+        # [OPTIONAL] Create SAVE in a job after the calculations
+        submitted = len(self.chain) and not isinstance(self.qejobrun,Bash)
+        if with_SAVE and submitted:
+            self.setup_SAVE()
+            if not self.are_gkkp_there:
+                self.yf.msg('SAVE folder will be generated by a job.')
+                self.run_SAVE(expand)
+
+        # Submit all the jobs
+        self.chain.submit()
+
         # [OPTIONAL] Create SAVE
-        if with_SAVE:
+        if with_SAVE and not submitted:
             self.setup_SAVE()
 
             if not self.are_gkkp_there:
@@ -181,9 +200,10 @@ class YamboGkkpCompute():
         inp_name = self.prefix + '.scf'
         self.scf_input.write('%s/%s'%(self.scf_dir,inp_name))
         
-        # Submit calculation
+        # Add calculation to the chain
         jname = 'scf'
-        self.scf_id = shell_qe_run(jname,inp_name,self.out_scf,self.scf_dir,exec=self.pw,scheduler=self.qejobrun)
+        shell = shell_qe_job(jname,inp_name,self.out_scf,exec=self.pw,scheduler=self.qejobrun)
+        self.scf_job = self.chain.add(shell,'%s/qe.sh'%self.scf_dir)
         
     def run_dvscf(self):
         """
@@ -209,12 +229,12 @@ class YamboGkkpCompute():
 
         # Manage dependency
         if self.scf_status: depend = None # No dependency if scf was found
-        else: depend = self.scf_id
+        else: depend = self.scf_job
         
-        # Submit calculation
+        # Add calculation to the chain
         jname = 'dvscf'
-        self.dvscf_id = shell_qe_run(jname,inp_name,self.out_dvscf,self.gkkp_dir,exec=self.ph,shell_name='dvscf',\
-                                     scheduler=self.qejobrun,pre_run=commands,pos_run=dyn_run,depend_on_JOBID=depend) 
+        shell = shell_qe_job(jname,inp_name,self.out_dvscf,exec=self.ph,scheduler=self.qejobrun,pre_run=commands,pos_run=dyn_run)
+        self.dvscf_job = self.chain.add(shell,'%s/dvscf.sh'%self.gkkp_dir,depends=depend)
                                      
     def run_gkkp(self):
         """
@@ -232,12 +252,12 @@ class YamboGkkpCompute():
         
         # Manage dependency
         if self.dvscf_status: depend = None # No dependency if dvscf was found
-        else: depend = self.dvscf_id
+        else: depend = self.dvscf_job
 
-        # Submit calculation
+        # Add calculation to the chain
         jname = 'gkkp'
-        self.gkkp_id = shell_qe_run(jname,inp_name,self.out_gkkp,self.gkkp_dir,exec=self.ph,shell_name='gkkp',\
-                                    scheduler=self.qejobrun,pre_run=commands,depend_on_JOBID=depend)    
+        shell = shell_qe_job(jname,inp_name,self.out_gkkp,exec=self.ph,scheduler=self.qejobrun,pre_run=commands)
+        self.gkkp_job = self.chain.add(shell,'%s/gkkp.sh'%self.gkkp_dir,depends=depend)
                                     
     def run_nscf(self):
         """
@@ -253,20 +273,23 @@ class YamboGkkpCompute():
         if not os.path.isdir('%s/%s.save'%(self.nscf_dir,self.prefix)):
             commands.append('cp -r %s/%s.save %s/'%(self.scf_dir,self.prefix,self.nscf_dir)) 
                 
-        # Dependency here may include gkkp job to ensure that this is the last job to be completed if SAVE is to be generated
-        if self.wait_up:
-            if self.gkkp_status and self.scf_status:       depend = None # No dependency if scf and gkkp were found
-            elif self.gkkp_status and not self.scf_status: depend = self.gkkp_id # scf was found, not gkkp
-            elif not self.gkkp_status and self.scf_status: depend = self.scf_id  # gkkp was found, not scf
-            else:                                          depend = '%s:%s'%(self.scf_id,self.gkkp_id) # double dependency
-        else: 
-            if self.scf_status: depend = None # No dependency if scf was found
-            else:               depend = self.scf_id    
+        # Manage dependency
+        if self.scf_status: depend = None # No dependency if scf was found
+        else:               depend = self.scf_job
         
-        # Submit calculation
+        # Add calculation to the chain
         jname = 'nscf'
-        self.nscf_id = shell_qe_run(jname,inp_name,self.out_nscf,self.nscf_dir,exec=self.pw,scheduler=self.qejobrun,\
-                                    pre_run=commands,depend_on_JOBID=depend,hang_python=self.wait_up)       
+        shell = shell_qe_job(jname,inp_name,self.out_nscf,exec=self.pw,scheduler=self.qejobrun,pre_run=commands)
+        self.nscf_job = self.chain.add(shell,'%s/qe.sh'%self.nscf_dir,depends=depend)
+
+    def run_SAVE(self,expand):
+        """
+        Add a job generating the SAVE once the nscf and gkkp calculations finish
+        """
+        depends = [getattr(self,'%s_job'%calc,None) for calc in ['nscf','gkkp']]
+        args = (self.RUN_path,'%s/%s.scf'%(self.scf_dir,self.prefix),expand,self.yambo_exec_path)
+        command = '%s -c "from yambopy.gkkp.compute_gkkp import create_gkkp_SAVE; create_gkkp_SAVE%r"'%(sys.executable,args)
+        self.SAVE_job = self.chain.add_setup([command],'%s/save.sh'%self.RUN_path,self.qejobrun,depends=depends,name='SAVE')
 
     def generate_nscf_input(self):
         """
@@ -359,3 +382,11 @@ class YamboGkkpCompute():
        for setup in setups:    os.remove(setup)
        os.remove(run_dir+'gkkp.in')
      
+
+def create_gkkp_SAVE(work_dir,scf_input_file,expand=False,yambo_exec_path=''):
+    """
+    Generate the yambo SAVE of a gkkp workflow whose calculations are finished.
+    Run by the last job of the workflow when it is submitted with a scheduler.
+    """
+    scf_input = PwIn.from_file(scf_input_file)
+    return YamboGkkpCompute(scf_input,work_dir=work_dir,with_SAVE=True,yambo_exec_path=yambo_exec_path,expand=expand)
@@ -11,8 +11,10 @@ import numpy as np
 from netCDF4 import Dataset
 
 from .yambofile import YamboFile
+from yamboparser.cache import get_cache
 from yambopy import YamboIn
 from yambopy.tools.jsonencoder import JsonDumper
+from yambopy.io.packfile import pack_npz
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.units import ha2ev
 
@@ -25,6 +27,9 @@ class YamboOut():
     ``folder``:      The relative path of the folder where yambo dumped its input files
 
     ``save_folder``: The path were the SAVE folder is localized 
+
+    ``cache``:       Read the files that did not change since they were last parsed from a YamboCache.
+                     Pass an instance of YamboCache or True to use the default one (default: no cache)
     """
 
     _tags = ['refl', 'eel', 'eps', 'qp', 'sf',
@@ -32,13 +37,15 @@ class YamboOut():
     _netcdf = ['ndb.QP', 'ndb.HF_and_locXC']
     _tagsexp = r'#\n#\s+((?:(?:[`0-9a-zA-Z\-\/\|\\(\)\_[\]]+)\s+)+)#\n\s'
 
-    def __init__(self, folder, save_folder='.'):
+    def __init__(self, folder, save_folder='.', cache=None):
         """
         For now we initialize the class in the same way as before (from_files)
         In the future we should be able to initialize this class from
         a file in the disk or from a dictionary
         """
         self.files = defaultdict(dict)
+        self.cache = get_cache(cache)
+        self.cached = set() #files read from the cache
         self.from_folder(folder,save_folder)
 
     def from_folder(self,folder,save_folder):
@@ -52,14 +59,14 @@ class YamboOut():
 
         # get all the files in the output dir
         if os.path.isdir(folder):
-            outdir = os.listdir(folder)
+            outdir = sorted(os.listdir(folder))
         else:
             raise ValueError("Invalid folder: %s" % folder)
 
         # get the log dir
         logdir_path = os.path.join(folder, "LOG")
         if os.path.isdir(logdir_path):
-            logdir = os.listdir(logdir_path)
+            logdir = sorted(os.listdir(logdir_path))
         else:
             logdir = outdir
 
@@ -69,6 +76,9 @@ class YamboOut():
         self.run = ["%s" % f for f in outdir if f.startswith('r-')]
         self.logs = ["%s" % f for f in logdir if f.startswith('l-')]
 
+        # get the files that did not change from the cache
+        self.load_cache()
+
         # get data from output file
         self.get_runtime()
         self.get_outputfile()
@@ -76,6 +86,28 @@ class YamboOut():
         self.get_inputfile()
         self.get_cell()
 
+        self.store_cache()
+
+    def load_cache(self):
+        """
+        Read the data of the files that did not change from the cache
+        """
+        if self.cache is None: return
+        for filename in self.run + self.output + self.netcdf:
+            data = self.cache.load(os.path.join(self.folder,filename),namespace='YamboOut')
+            if data is None: continue
+            self.files[filename] = data
+            self.cached.add(filename)
+
+    def store_cache(self):
+        """
+        Store the data of the files that were parsed in the cache
+        """
+        if self.cache is None: return
+        for filename in self.run + self.output + self.netcdf:
+            if filename in self.cached: continue
+            self.cache.store(os.path.join(self.folder,filename),self.files[filename],namespace='YamboOut')
+
     @staticmethod
     def has_output(folder):
         """Check if the folder has output files"""
@@ -87,7 +119,15 @@ class YamboOut():
         kpoints and symmetry operations) from the SAVE folder.
         """
         path = os.path.join(self.save_folder,'SAVE/ns.db1')
-        self.lattice = YamboLatticeDB.from_db_file(path)
+        #the lattice is cached before expanding the kpoints to the full brillouin zone
+        lattice = self.cache.load(path,namespace='YamboOut') if self.cache is not None else None
+        if lattice is not None:
+            self.lattice = YamboLatticeDB.from_dict(lattice)
+        else:
+            self.lattice = YamboLatticeDB.from_db_file(path,Expand=False)
+            if self.cache is not None:
+                self.cache.store(path,self.lattice.as_dict(),namespace='YamboOut')
+        self.lattice.expand_kpoints()
 
     def get_outputfile(self):
         """ 
@@ -95,7 +135,8 @@ class YamboOut():
         """
         # for all the o-* files
         for filename in self.output:
-            
+            if filename in self.cached: continue
+
             #yambofile read
             # TODO: use Yambofile class to read the o-* files
             yf = YamboFile(filename,self.folder)
@@ -124,6 +165,7 @@ class YamboOut():
                 ndb.HF_and_locXC
         """
         for filename in self.netcdf:
+            if filename in self.cached: continue
             yf = YamboFile(filename, self.folder)
             #convert units
             if yf.type == 'netcdf_gw':
@@ -140,6 +182,7 @@ class YamboOut():
         """
 
         for filename in self.output:
+            if filename in self.cached: continue
             inputfile = []
             # read this inputfile
             with open(os.path.join(self.folder, filename),'r') as f:
@@ -160,6 +203,7 @@ class YamboOut():
         """
 
         for filename in self.run:
+            if filename in self.cached: continue
             timing = {}
 
             with open(os.path.join(self.folder,filename),'r') as f:
@@ -192,13 +236,22 @@ class YamboOut():
         for t in list(timing.items()):
             print(t[0], '\n', t[1], '\n')
 
-    def pack(self, filename=None):
+    def pack(self, filename=None, format='json'):
         """
-        Pack up all the data in the structure in a json file
+        Pack up all the data in the structure in a file
+
+        format: 'json' or 'npz' (the arrays are stored natively and can be read lazily, see YamboPack)
         """
+        if format not in ['json','npz']:
+            raise ValueError("Unknown format %s, use json or npz" % format)
+
         # if no filename is specified we use the same name as the folder
         if not filename:
-            filename = '%s.json' % self.folder
+            filename = '%s.%s' % (self.folder, format)
+
+        if format == 'npz':
+            pack_npz(self.files, self.lattice.as_dict(), filename)
+            return
 
         # create json dictionary
         jsondata = {"files": self.files,
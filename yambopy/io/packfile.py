@@ -0,0 +1,166 @@
+# Copyright (C) 2018 Henrique Pereira Coutada Miranda
+# All rights reserved.
+#
+# This file is part of yambopy
+#
+"""
+Read the packs of output files written by YamboOut.pack
+
+Two formats are supported:
+    json: all the data in a json file (complex arrays are stored as [real, imag])
+    npz:  the arrays stored natively in a numpy .npz file with a json manifest
+          describing the files, their type and tags
+"""
+import os
+import json
+import numpy as np
+from yamboparser.cache import save_npz, load_npz_manifest, decode_npz
+
+__all__ = ['YamboPack','pack_npz','convert_json_pack','convert_json_packs_in_folder']
+
+#tags stored as complex numbers for each type of file
+_complex_tags = {'netcdf_gw': ['E','Eo','Z','E-Eo'],
+                 'netcdf_hf': ['Sx','Vxc']}
+
+class YamboPack():
+    """
+    Read a pack written by YamboOut.pack in the json or npz format
+
+    For npz packs only the manifest is read when the pack is opened and the arrays
+    of each output file are read the first time the file is requested with ``get_file``.
+    json packs are read at once.
+    """
+    _formats = ['.json','.npz']
+
+    def __init__(self,filename):
+        self.filename = filename
+        self.name, self.format = os.path.splitext(os.path.basename(filename))
+        if self.format not in self._formats:
+            raise ValueError('Unknown format of the pack %s, use .json or .npz'%filename)
+
+        self._files = {} #output files already read
+        if self.format == '.json':
+            with open(filename,'r') as f:
+                data = json.load(f)
+            self._files = data['files']
+            self._manifest = data
+        else:
+            self._manifest = load_npz_manifest(filename)['data']
+
+    @classmethod
+    def is_pack(cls,filename):
+        """ Check if the filename has the extension of a pack
+        """
+        return os.path.splitext(filename)[1] in cls._formats
+
+    @property
+    def filenames(self):
+        """ Names of the output files in the pack
+        """
+        return list(self._manifest['files'].keys())
+
+    def get_type(self,filename):
+        """ Type of an output file in the pack (does not read its data)
+        """
+        return self._manifest['files'][filename]['type']
+
+    def get_tags(self,filename):
+        """ Tags of an output file in the pack (does not read its data)
+        """
+        return list(self._manifest['files'][filename].keys())
+
+    def get_input(self,filename):
+        """ Input file used to produce an output file of the pack
+        """
+        return self._manifest['files'][filename].get('input')
+
+    def get_file(self,filename):
+        """ Get the data of an output file of the pack, reading its arrays if needed
+        """
+        if filename not in self._files:
+            self._files[filename] = decode_npz(self.filename,self._manifest['files'][filename])
+        return self._files[filename]
+
+    @property
+    def files(self):
+        """ Dictionary with all the output files of the pack
+        """
+        return dict((filename,self.get_file(filename)) for filename in self.filenames)
+
+    @property
+    def lattice(self):
+        """ Dictionary with the lattice (see YamboLatticeDB.from_dict)
+        """
+        if self.format == '.json': return self._manifest['lattice']
+        if not hasattr(self,'_lattice'):
+            self._lattice = decode_npz(self.filename,self._manifest['lattice'])
+        return self._lattice
+
+    def __str__(self):
+        lines = ["%s (%s)"%(self.name,self.format[1:])]
+        for filename in self.filenames:
+            lines.append("\t%s"%filename)
+        return "\n".join(lines)
+
+def pack_npz(files,lattice,filename):
+    """
+    Write a pack with the output files and the lattice in the npz format
+    """
+    save_npz(filename,{"files": files, "lattice": lattice})
+
+def _from_json(value,complex=False):
+    """
+    Convert the lists read from a json pack to arrays
+    """
+    if not isinstance(value,list): return value
+    try:
+        array = np.array(value)
+    except ValueError:
+        return value
+    if array.dtype.kind not in 'biuf': return value
+    if complex and len(array) == 2: return array[0]+1j*array[1]
+    return array
+
+def convert_json_pack(json_filename,npz_filename=None,remove=False):
+    """
+    Convert a pack in the json format to the npz format
+
+    Arguments:
+        json_filename: the json pack
+        npz_filename:  the npz pack to write (default: same name with .npz extension)
+        remove:        remove the json pack after the conversion
+
+    The arrays are restored from the lists of the json file, the complex
+    arrays of the netcdf files are restored from their [real, imag] lists.
+    The input files and runtimes are kept as they are.
+    Returns the name of the npz pack.
+    """
+    if npz_filename is None:
+        npz_filename = '%s.npz'%os.path.splitext(json_filename)[0]
+
+    with open(json_filename,'r') as f:
+        data = json.load(f)
+
+    files = {}
+    for output_filename, output_file in data['files'].items():
+        complex_tags = _complex_tags.get(output_file.get('type'),[])
+        files[output_filename] = dict((tag, value if tag in ['input','runtime','type'] else
+                                            _from_json(value,complex=tag in complex_tags))
+                                      for tag,value in output_file.items())
+    lattice = dict((key,_from_json(value)) for key,value in data['lattice'].items())
+
+    pack_npz(files,lattice,npz_filename)
+    if remove: os.remove(json_filename)
+    return npz_filename
+
+def convert_json_packs_in_folder(folder,remove=False,verbose=True):
+    """
+    Convert all the json packs in a folder to the npz format
+    """
+    npz_filenames = []
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith('.json'): continue
+        npz_filename = convert_json_pack(os.path.join(folder,filename),remove=remove)
+        if verbose: print("%s -> %s"%(filename,os.path.basename(npz_filename)))
+        npz_filenames.append(npz_filename)
+    return npz_filenames
@@ -6,8 +6,11 @@
 from __future__ import print_function
 import unittest
 import os
+import shutil
+import tempfile
 import numpy as np
 from yambopy.io.outputfile import YamboOut
+from yamboparser import YamboCache
 
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw')
 
@@ -41,5 +44,22 @@ class TestYamboOut(unittest.TestCase):
         #the difference is larger than 1e-3
         assert np.all(np.isclose(of,qo,atol=5e-3))
 
+    def test_yamboout_cache(self):
+
+        tmp = tempfile.mkdtemp()
+        try:
+            cache = YamboCache(tmp)
+            ref = YamboOut(test_path,cache=False)
+            YamboOut(test_path,cache=cache)
+            yo = YamboOut(test_path,cache=cache)
+            assert yo.cached == set(yo.run+yo.output+yo.netcdf)
+            assert yo.files['o-yambo.qp']['input'] == ref.files['o-yambo.qp']['input']
+            assert yo.files['r-yambo_em1d_ppa_HF_and_locXC_gw0'] == ref.files['r-yambo_em1d_ppa_HF_and_locXC_gw0']
+            for tag in ['E','Eo','Z','qp_table']:
+                assert np.allclose(yo.files['ndb.QP'][tag],ref.files['ndb.QP'][tag])
+            assert np.allclose(yo.lattice.car_kpoints,ref.lattice.car_kpoints)
+        finally:
+            shutil.rmtree(tmp)
+
 if __name__ == "__main__":
     unittest.main() 
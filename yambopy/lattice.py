@@ -5,6 +5,7 @@
 #
 from yambopy import *
 from itertools import product
+from qepy.lattice import red_car, car_red
 
 def calculate_distances(kpoints):
     """
@@ -43,18 +44,6 @@ def isbetween(a,b,c,eps=1e-5):
     """
     return np.isclose(np.linalg.norm(a-c)+np.linalg.norm(b-c)-np.linalg.norm(a-b),0,atol=eps)
 
-def red_car(red,lat):
-    """
-    Convert reduced coordinates to cartesian
-    """
-    return np.array([coord[0]*lat[0]+coord[1]*lat[1]+coord[2]*lat[2] for coord in red])
-
-def car_red(car,lat):
-    """
-    Convert cartesian coordinates to reduced
-    """
-    return np.array([np.linalg.solve(np.array(lat).T,coord) for coord in car])
-
 def vol_lat(lat):
     """
     Calculate the volume of a lattice
@@ -73,6 +62,24 @@ def rec_lat(lat):
     b3 = np.cross(a1,a2)/v
     return np.array([b1,b2,b3])
 
+def points_in_segment(start,end,kmesh,eps=1e-5):
+    """
+    get the indexes of the points of kmesh that lie between start and end
+    sorted according to their distance to start
+
+    the same criterion as isbetween is used but evaluated for the whole mesh at once
+    """
+    kmesh = np.asarray(kmesh)
+    start = np.asarray(start)
+    end   = np.asarray(end)
+
+    dist_start = np.linalg.norm(kmesh-start,axis=-1)
+    dist_end   = np.linalg.norm(kmesh-end,axis=-1)
+    in_segment = np.isclose(dist_start+dist_end-np.linalg.norm(end-start),0,atol=eps)
+
+    indexes = np.nonzero(in_segment)[0]
+    return indexes[np.argsort(dist_start[indexes],kind='stable')]
+
 def get_path(kmesh,path,debug=False):
     """
     get indexes of the kpoints in the the kmesh
@@ -87,32 +94,18 @@ def get_path(kmesh,path,debug=False):
     #for all the paths
     for k in range(len(path)-1):
 
-        # store here all the points in the path
-        # key:   has the coordinates of the kpoint rounded to 4 decimal places
-        # value: index of the kpoint
-        #        the kpoint cordinate
-        kpoints_in_path = []
-
         start_kpt = path[k]   #start point of the path
         end_kpt   = path[k+1] #end point of the path
 
-        #iterate over all the kpoints
-        for index, kpt in enumerate(kmesh):
-
-            #if the point is collinear we add it
-            if isbetween(start_kpt,end_kpt,kpt):
-                value = [ index, np.linalg.norm(start_kpt-kpt), kpt ]
-                kpoints_in_path.append( value )
-
-        #sort the points acoording to distance to the start of the path
-        kpoints_in_path = sorted(kpoints_in_path,key=lambda i: i[1])
+        #points in the path sorted acoording to distance to the start of the path
+        indexes = points_in_segment(start_kpt,end_kpt,kmesh)
 
-        #for all the kpoints in the path
-        for index, disp, kpt in kpoints_in_path:
-            bands_indexes.append( index )
-            if debug: print ("%12.8lf "*3)%tuple(kpt), index
+        bands_indexes.extend( indexes )
+        if debug:
+            for index in indexes:
+                print(("%12.8lf "*3)%tuple(kmesh[index]), index)
 
-    return np.array(bands_indexes)
+    return np.array(bands_indexes,dtype=int)
 
 def replicate_red_kmesh(kmesh,repx=list(range(1)),repy=list(range(1)),repz=list(range(1))):
     """
@@ -7,8 +7,10 @@
 import unittest
 import os
 import shutil as sh
+import numpy as np
 from yambopy.analyse import YamboAnalyser
 from yambopy.io.outputfile import YamboOut
+from yambopy.io.packfile import YamboPack, convert_json_packs_in_folder
 from qepy.lattice import Path
 
 test_path = os.path.join(os.path.dirname(__file__),'..','data','refs','gw_conv')
@@ -41,6 +43,12 @@ class TestYamboAnalyse(unittest.TestCase):
         keys = sorted(netcdf_files.keys())
         assert keys == ['FFTGvecs_00010', 'FFTGvecs_00015','reference']
 
+        #test the index of the input files
+        invars = y.get_inputfiles_tag(['FFTGvecs','gw0'])
+        assert invars['FFTGvecs_00015']['variables']['FFTGvecs'] == [15.0, 'Ry']
+        assert invars['reference']['arguments'] == ['gw0']
+        assert sorted(y.types['netcdf_gw'].keys()) == sorted(y.packs.keys())
+
         #test getting data
         ks_bands,qp_bands = y.get_bands(tags='reference')
         ks_bands.plot(show=False)
@@ -56,6 +64,37 @@ class TestYamboAnalyse(unittest.TestCase):
         ks_bands_path,qp_bands_path = y.get_bands(tags='FFTGvecs',path_kpoints=path,type_calc=('gw'))
         qp_bands_path.plot(show=False) 
 
+    def test_yamboanalyse_npz(self):
+        """ Convert the .json packs to .npz and read them lazily
+        """
+        ref = YamboAnalyser('gw_conv').get_files_type('netcdf_gw')
+        convert_json_packs_in_folder('gw_conv',remove=True,verbose=False)
+        y = YamboAnalyser('gw_conv')
+        assert all(pack.format == '.npz' for pack in y.packs.values())
+
+        #only the files requested are read
+        netcdf_files = y.get_files_type('netcdf_gw','FFTGvecs')
+        assert sorted(netcdf_files.keys()) == ['FFTGvecs_00010', 'FFTGvecs_00015']
+        assert all(len(pack._files) == (name in netcdf_files) for name,pack in y.packs.items())
+
+        for name,data in y.get_files_type('netcdf_gw').items():
+            np.testing.assert_allclose(data['E'].real,ref[name]['E'][0])
+            np.testing.assert_allclose(data['E'].imag,ref[name]['E'][1])
+            np.testing.assert_array_equal(data['Kpoint'],ref[name]['Kpoint'])
+
+        #packing directly in the npz format gives the same data
+        y = YamboOut(os.path.join('gw_conv','reference'),save_folder='gw_conv')
+        y.pack('direct.npz',format='npz')
+        direct = YamboPack('direct.npz')
+        converted = YamboPack(os.path.join('gw_conv','reference.npz'))
+        assert sorted(direct.filenames) == sorted(converted.filenames)
+        for tag in ['E','Eo','Z','qp_table']:
+            np.testing.assert_allclose(direct.get_file('ndb.QP')[tag],converted.get_file('ndb.QP')[tag])
+        assert direct.get_input('o-reference.qp') == converted.get_input('o-reference.qp')
+        os.remove('direct.npz')
+
+        ks_bands,qp_bands = YamboAnalyser('gw_conv').get_bands(tags='reference')
+
     def tearDown(self):
         sh.rmtree('gw_conv') 
     
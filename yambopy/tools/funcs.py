@@ -21,3 +21,108 @@ def gaussian(x,x0,s,max_exp=50.,min_exp=-100.):
     return height*np.exp(argument)
 
 
+
+def linear_binning(x,weights,x0,step,nbins):
+    """
+    Distribute the weights of the points x between the two closest points
+    of the regular grid x0+i*step (i=0,...,nbins-1)
+    Points outside the grid are discarded.
+
+    Arguments:
+        weights: array with shape (...,len(x))
+
+    Returns an array with shape (...,nbins)
+    """
+    x = np.asarray(x).ravel()
+    weights = np.asarray(weights)
+    shape = weights.shape[:-1]
+    weights = weights.reshape(-1,len(x))
+
+    t = (x-x0)/step
+    i = np.floor(t).astype(int)
+    f = t-i
+
+    hist = np.zeros([len(weights),nbins])
+    for idx, frac in ((i,1-f),(i+1,f)):
+        inside = (idx >= 0) & (idx < nbins)
+        for n,w in enumerate(weights):
+            hist[n] += np.bincount(idx[inside],weights=(w*frac)[inside],minlength=nbins)
+    return hist.reshape(shape+(nbins,))
+
+def broadening_convolution(hist,step,sigma,broadening=lorentzian):
+    """
+    Convolve a histogram defined on a regular grid with a broadening function using FFT
+    Returns the convolution on the same grid as the histogram.
+    """
+    from scipy.signal import fftconvolve
+    hist = np.asarray(hist)
+    nbins = hist.shape[-1]
+    kernel = broadening(np.arange(-(nbins-1),nbins)*step,0.,sigma)
+    kernel = kernel.reshape((1,)*(hist.ndim-1)+kernel.shape)
+    conv = fftconvolve(hist,kernel,axes=-1)
+    return conv[...,nbins-1:2*nbins-1]
+
+def occupations(e,ef=0.,smear=0.1,smearing='fermi-dirac',order=1,max_exp=50.):
+    """
+    Occupation of the states with energies e for the fermi energy ef
+    The arguments are broadcasted against each other.
+
+    Arguments:
+        smear: width of the smearing (kT for fermi-dirac) in the units of e
+        smearing: 'fermi-dirac', 'gaussian' or 'methfessel-paxton'
+        order: order of the methfessel-paxton smearing
+        max_exp: the argument (e-ef)/smear is clipped to [-max_exp,max_exp] to avoid overflows
+    """
+    x = np.clip((np.asarray(e)-ef)/smear,-max_exp,max_exp)
+    if smearing == 'fermi-dirac':
+        return 1/(np.exp(x)+1)
+
+    from scipy.special import erfc
+    occ = 0.5*erfc(x)
+    if smearing == 'gaussian':
+        return occ
+    elif smearing == 'methfessel-paxton':
+        #S_N(x) = S_0(x) + sum_n A_n H_{2n-1}(x) exp(-x^2) with A_n = (-1)^n/(n! 4^n sqrt(pi))
+        gauss = np.exp(-x**2)
+        a = 1/np.sqrt(np.pi)
+        hm, h = np.ones_like(x), 2*x
+        for n in range(1,order+1):
+            a = -a/(4*n)
+            occ = occ + a*h*gauss
+            #advance the hermite polynomials from H_{2n-1} to H_{2n+1}
+            hm = 2*x*h-2*(2*n-1)*hm
+            h  = 2*x*hm-2*(2*n)*h
+        return occ
+    raise ValueError('Unknown smearing %s, use fermi-dirac, gaussian or methfessel-paxton'%smearing)
+
+def find_fermi(eigenvalues,weights,nelectrons,smear,smearing='fermi-dirac',order=1,tol=1e-10,maxiter=200):
+    """
+    Find the fermi energy for which sum(weights*occupations) equals nelectrons by bisection.
+    Each step evaluates the total occupation of all the states with a single array reduction.
+
+    Arguments:
+        eigenvalues: array with the energies of the states
+        weights: weights of the states (spin degeneracy included) broadcastable to eigenvalues
+        smear: width of the smearing, if an array the fermi energy is determined for all the values at once
+
+    Returns the fermi energy (an array with the shape of smear if smear is an array)
+    """
+    eigenvalues = np.asarray(eigenvalues,dtype=float)
+    weights = np.broadcast_to(weights,eigenvalues.shape).ravel()
+    eigenvalues = eigenvalues.ravel()
+    smear_array = np.asarray(smear,dtype=float)
+    smear = smear_array.reshape(-1,1)
+
+    #bracket the fermi energy
+    lo = np.full(len(smear),np.min(eigenvalues))-10*smear[:,0]
+    hi = np.full(len(smear),np.max(eigenvalues))+10*smear[:,0]
+
+    for i in range(maxiter):
+        ef = (lo+hi)/2
+        below = occupations(eigenvalues,ef[:,None],smear,smearing,order).dot(weights) < nelectrons
+        lo = np.where(below,ef,lo)
+        hi = np.where(below,hi,ef)
+        if np.max(hi-lo) < tol: break
+
+    ef = (lo+hi)/2
+    return ef.reshape(smear_array.shape) if smear_array.ndim else ef[0]